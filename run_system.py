@@ -1,13 +1,22 @@
 """
 Master Orchestrator Script for AI Smart Event Photo Sorter
 
-This script runs the complete pipeline sequentially:
+This script runs the complete pipeline:
 1. Enrollment (enroll.py) - Generate face embeddings
 2. Photo sorting (process_photos.py) - Classify and sort photos
 3. Results distribution (send_results.py) - Send sorted photos via email
+
+By default the stages run in this process: buffalo_l is loaded once and shared
+by enrollment and sorting, and a person's photos are sent as soon as sorting
+reports their folder as final (while the rest of the rescue stage is still
+running). ``--mode subprocess`` runs the three scripts one after another as
+separate processes instead. A failed stage stops the pipeline in both modes,
+and a per-stage timing breakdown is printed at the end.
 """
 
 import sys
+import time
+import argparse
 import subprocess
 import os
 from pathlib import Path
@@ -18,14 +27,18 @@ SORTING_SCRIPT = "src/process_photos.py"  # Main photo sorting script
 SEND_SCRIPT = "src/send_results.py"       # n8n automation script
 
 BASE_DIR = Path(__file__).parent
+SRC_DIR = BASE_DIR / "src"
+
+PIPELINE_MODES = ("inprocess", "subprocess")
 
-def run_script(script_path, script_name):
+def run_script(script_path, script_name, args=()):
     """
     Run a Python script using the current Python interpreter (venv-aware).
     
     Args:
         script_path: Path to the script file
         script_name: Display name for logging
+        args: Extra command-line arguments for the script
         
     Returns:
         True if script executed successfully (exit code 0), False otherwise
@@ -46,7 +59,7 @@ def run_script(script_path, script_name):
     try:
         # Use sys.executable to ensure we use the venv Python interpreter
         result = subprocess.run(
-            [sys.executable, str(script_full_path)],
+            [sys.executable, str(script_full_path), *args],
             cwd=str(BASE_DIR),
             check=False,  # Don't raise exception, we'll check return code
             stdout=sys.stdout,  # Stream output in real-time
@@ -73,59 +86,216 @@ def run_script(script_path, script_name):
         print(f"{'='*70}\n")
         return False
 
+def print_stopped(reason, lines):
+    print("\n" + "="*70)
+    print(f"🛑 [STOPPED] Pipeline stopped due to {reason}")
+    for line in lines:
+        print(f"   {line}")
+    print("="*70 + "\n")
+
+ENROLL_FAILED = ("The embeddings database (Data/embeddings.fsdb) was not updated.",
+                 "Photo sorting and distribution will NOT run.")
+SORTING_FAILED = ("Photos were not sorted into person folders.",
+                  "Results distribution will NOT run.")
+
+def print_distribution_failed():
+    print("\n" + "="*70)
+    print("⚠️  [WARNING] Distribution script failed, but sorting completed")
+    print("   Photos are sorted in Data/output/ but emails were not sent.")
+    print("="*70 + "\n")
+
+def print_timings(timings, total):
+    print("\n" + "="*70)
+    print("⏱️  [TIMINGS] Per-stage breakdown")
+    print("="*70)
+    for stage, seconds in timings.items():
+        print(f"   {stage:<38} {seconds:>9.2f}s")
+    print(f"   {'Total (wall clock)':<38} {total:>9.2f}s")
+    print("="*70)
+
+def run_subprocess_pipeline(timings, runtime_args=()):
+    """The three scripts as separate processes, each loading its own models (with the same runtime flags)."""
+    steps = (
+        ("📝 STEP 1: FACE ENROLLMENT", ENROLL_SCRIPT, "Face Enrollment", runtime_args),
+        ("📸 STEP 2: PHOTO SORTING", SORTING_SCRIPT, "Photo Sorting", runtime_args),
+        ("📧 STEP 3: RESULTS DISTRIBUTION", SEND_SCRIPT, "Results Distribution", ()),
+    )
+    for title, script, name, args in steps:
+        print("\n" + "="*70)
+        print(title)
+        print("="*70)
+        start = time.perf_counter()
+        success = run_script(script, name, args)
+        timings[name] = time.perf_counter() - start
+
+        if not success:
+            if script == ENROLL_SCRIPT:
+                print_stopped("enrollment failure", ENROLL_FAILED)
+            elif script == SORTING_SCRIPT:
+                print_stopped("sorting failure", SORTING_FAILED)
+            else:
+                print_distribution_failed()
+            return False
+    return True
+
+class Deliverer:
+    """
+    Hands person folders to send_results' DeliveryEngine as sorting releases them.
+    Each release is sent once (a person released again after a late rescue is re-sent).
+    """
+
+    def __init__(self, send_results):
+        self.send_results = send_results
+        self.engine = None
+        self.submitted = set()
+
+    @property
+    def stats(self):
+        return self.engine.stats if self.engine is not None else self.send_results.new_stats()
+
+    @property
+    def busy(self):
+        return self.engine.busy if self.engine is not None else 0.0
+
+    @property
+    def error(self):
+        return self.engine.error if self.engine is not None else None
+
+    def start(self):
+        attendees = self.send_results.load_attendees()
+        if not attendees:
+            print("❌ [ERROR] No attendees loaded. Photos will be sorted but not sent.")
+            return
+        self.engine = self.send_results.DeliveryEngine(attendees)
+
+    def submit(self, person):
+        self.submitted.add(person)
+        if self.engine is not None and self.engine.error is None:
+            if os.path.isdir(os.path.join(self.send_results.OUTPUT_DIR, person)):
+                self.engine.submit(person)
+
+    def finish(self):
+        # Folders sorting never released (e.g. left in Data/output by earlier runs) go last
+        output_dir = self.send_results.OUTPUT_DIR
+        if os.path.isdir(output_dir):
+            for folder in sorted(os.listdir(output_dir)):
+                if folder != "Unknown" and os.path.isdir(os.path.join(output_dir, folder)) and folder not in self.submitted:
+                    self.submit(folder)
+        if self.engine is not None:
+            self.engine.close()
+
+    def cancel(self):
+        if self.engine is not None:
+            self.engine.close(cancel=True)
+
+def run_inprocess_pipeline(timings, workers=1):
+    """
+    Enrollment, sorting and distribution in this process: the models are loaded
+    once and shared, and distribution overlaps the end of sorting.
+    """
+    sys.path.insert(0, str(SRC_DIR))
+    start = time.perf_counter()
+    import enroll
+    import process_photos
+    import send_results
+    from face_models import LazyModel
+    timings["Imports"] = time.perf_counter() - start
+
+    # Loaded on first use: not at all when enrollment is up to date and every photo is in the ledger
+    models = LazyModel(process_photos.initialize_models)
+    load_seconds = [0.0]
+
+    def load_models():
+        if not models.loaded:
+            t0 = time.perf_counter()
+            models.get()
+            load_seconds[0] = time.perf_counter() - t0
+        return models.get()
+
+    print("\n" + "="*70)
+    print("📝 STEP 1: FACE ENROLLMENT")
+    print("="*70)
+    start = time.perf_counter()
+    try:
+        success = enroll.enroll_known_people(load_model=lambda: load_models()[0])
+    except Exception as e:
+        print(f"❌ [ERROR] Exception during enrollment: {e}")
+        success = False
+    timings["Face Enrollment"] = time.perf_counter() - start
+    if not success:
+        print_stopped("enrollment failure", ENROLL_FAILED)
+        return False
+
+    print("\n" + "="*70)
+    print("📸 STEP 2: PHOTO SORTING (distribution starts as persons are final)")
+    print("="*70)
+    deliverer = Deliverer(send_results)
+    deliverer.start()
+    start = time.perf_counter()
+    try:
+        process_photos.process_new_photos(workers=workers, load_models=load_models, on_person_final=deliverer.submit)
+    except Exception as e:
+        timings["Photo Sorting"] = time.perf_counter() - start
+        print(f"❌ [ERROR] Exception during photo sorting: {e}")
+        deliverer.cancel()
+        print_stopped("sorting failure", SORTING_FAILED)
+        return False
+    timings["Photo Sorting"] = time.perf_counter() - start
+
+    print("\n" + "="*70)
+    print("📧 STEP 3: RESULTS DISTRIBUTION")
+    print("="*70)
+    start = time.perf_counter()
+    deliverer.finish()
+    timings["Distribution (after sorting ended)"] = time.perf_counter() - start
+    timings["Distribution (summed send time)"] = deliverer.busy
+    timings["Model loading (inside the stages above)"] = load_seconds[0]
+    send_results.print_send_summary(deliverer.stats)
+    if deliverer.error is not None:
+        print_distribution_failed()
+        return False
+    return True
+
 def main():
     """Main orchestrator function."""
+    sys.path.insert(0, str(SRC_DIR))
+    from face_models import (
+        add_runtime_arguments, configure_runtime, describe_runtime, runtime_cli_args, runtime_from_args,
+    )
+
+    parser = argparse.ArgumentParser(description="Enroll, sort and distribute event photos")
+    parser.add_argument("--mode", choices=PIPELINE_MODES, default="inprocess",
+                        help="inprocess: shared models and overlapped delivery (default); "
+                             "subprocess: run the three scripts one after another")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="In-process mode: worker processes for sorting (workers load their own models)")
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    runtime = runtime_from_args(args)
+
     print("\n" + "="*70)
     print("🎯 AI SMART EVENT PHOTO SORTER - COMPLETE PIPELINE")
     print("="*70)
     print(f"📁 Working Directory: {BASE_DIR}")
     print(f"🐍 Python Interpreter: {sys.executable}")
+    print(f"⚙️  Mode: {args.mode}")
+    print(f"🧮 ONNX Runtime: {describe_runtime(runtime)}")
     print("="*70)
     print("\n📋 Pipeline Steps:")
     print("   1️⃣  Enrollment (Generate face embeddings)")
     print("   2️⃣  Photo Sorting (Classify and organize photos)")
     print("   3️⃣  Results Distribution (Send via email)")
     print("="*70)
-    
-    # Step 1: Run enrollment script
-    print("\n" + "="*70)
-    print("📝 STEP 1: FACE ENROLLMENT")
-    print("="*70)
-    success = run_script(ENROLL_SCRIPT, "Face Enrollment")
-    
-    if not success:
-        print("\n" + "="*70)
-        print("🛑 [STOPPED] Pipeline stopped due to enrollment failure")
-        print("   The embeddings.pkl file was not created.")
-        print("   Photo sorting and distribution will NOT run.")
-        print("="*70 + "\n")
-        sys.exit(1)
-    
-    # Step 2: Run photo sorting script (only if enrollment succeeded)
-    print("\n" + "="*70)
-    print("📸 STEP 2: PHOTO SORTING")
-    print("="*70)
-    success = run_script(SORTING_SCRIPT, "Photo Sorting")
-    
-    if not success:
-        print("\n" + "="*70)
-        print("🛑 [STOPPED] Pipeline stopped due to sorting failure")
-        print("   Photos were not sorted into person folders.")
-        print("   Results distribution will NOT run.")
-        print("="*70 + "\n")
-        sys.exit(1)
-    
-    # Step 3: Run results distribution script (only if sorting succeeded)
-    print("\n" + "="*70)
-    print("📧 STEP 3: RESULTS DISTRIBUTION")
-    print("="*70)
-    success = run_script(SEND_SCRIPT, "Results Distribution")
-    
+
+    timings = {}
+    start = time.perf_counter()
+    if args.mode == "subprocess":
+        success = run_subprocess_pipeline(timings, runtime_cli_args(runtime))
+    else:
+        configure_runtime(runtime)
+        success = run_inprocess_pipeline(timings, workers=max(1, args.workers))
+    print_timings(timings, time.perf_counter() - start)
     if not success:
-        print("\n" + "="*70)
-        print("⚠️  [WARNING] Distribution script failed, but sorting completed")
-        print("   Photos are sorted in Data/output/ but emails were not sent.")
-        print("="*70 + "\n")
         sys.exit(1)
     
     # All three steps completed successfully
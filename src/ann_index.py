@@ -0,0 +1,274 @@
+"""
+Approximate nearest-neighbour (IVF) index for very large enrollment galleries.
+
+A spherical k-means coarse quantizer splits the gallery rows into inverted
+lists. A query is compared only with the rows of the ``nprobe`` lists whose
+centroids are closest to it, so lookups cost O(nprobe * N / n_lists * D)
+instead of O(N * D). ``nprobe`` is the recall knob: probing every list gives
+exactly the same answers as the exact Gallery matcher.
+
+The index is built by enroll.py and saved next to the embeddings database.
+Before using it, process_photos.attach_ann_index checks nprobe on perturbed
+copies of the gallery's own rows (verified_nprobe): nprobe is doubled until
+every sampled match decision equals exact matching, and matching stays exact
+when that takes more than half the lists. Run this module directly to print a recall-vs-exact report, including whether
+the STRICT_THRESHOLD / DOUBT_THRESHOLD decisions stay the same:
+
+    python src/ann_index.py --nprobe 1,4,8,16,32
+"""
+
+import os
+import argparse
+import hashlib
+import time
+import numpy as np
+
+# Galleries with fewer rows than this are always matched exactly
+ANN_MIN_GALLERY_SIZE = 20000
+DEFAULT_NPROBE = 16
+INDEX_FORMAT_VERSION = 1
+
+def matrix_fingerprint(matrix):
+    """Cheap identity check tying a saved index to the gallery it was built from."""
+    digest = hashlib.sha1()
+    digest.update(np.asarray(matrix.shape, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+def _assign(matrix, centroids, chunk=8192):
+    labels = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], chunk):
+        labels[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+    return labels
+
+def _normalize_rows(rows):
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (rows / norms).astype(np.float32)
+
+def spherical_kmeans(matrix, n_lists, iterations=20, seed=0, max_train=None):
+    """Cluster unit-norm rows by cosine similarity and return unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    if max_train is None:
+        max_train = n_lists * 256
+    if matrix.shape[0] > max_train:
+        train = matrix[rng.choice(matrix.shape[0], size=max_train, replace=False)]
+    else:
+        train = matrix
+
+    centroids = train[rng.choice(train.shape[0], size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, train)
+        counts = np.bincount(labels, minlength=n_lists)
+
+        # Re-seed empty lists from random training rows
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = train[rng.choice(train.shape[0], size=len(empty), replace=False)]
+
+        new_centroids = _normalize_rows(sums)
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            centroids = new_centroids
+            break
+        centroids = new_centroids
+    return centroids
+
+class IVFIndex:
+    """Inverted-file index over the rows of a Gallery matrix.
+
+    ``list_rows[list_offsets[l]:list_offsets[l + 1]]`` are the gallery rows
+    assigned to coarse centroid ``l``.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, fingerprint):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_rows = np.asarray(list_rows, dtype=np.int64)
+        self.fingerprint = fingerprint
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, iterations=20, seed=0, fingerprint=None):
+        num_rows = matrix.shape[0]
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(num_rows))
+        n_lists = max(1, min(n_lists, num_rows))
+
+        centroids = spherical_kmeans(matrix, n_lists, iterations=iterations, seed=seed)
+        labels = _assign(matrix, centroids)
+        list_rows = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=n_lists)
+        list_offsets = np.concatenate(([0], np.cumsum(counts)))
+        if fingerprint is None:
+            fingerprint = matrix_fingerprint(matrix)
+        return cls(centroids, list_offsets, list_rows, fingerprint)
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(INDEX_FORMAT_VERSION),
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_rows=self.list_rows,
+                fingerprint=np.array(self.fingerprint),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != INDEX_FORMAT_VERSION:
+                raise ValueError(f"Unsupported ANN index version {int(data['version'])} in {path}")
+            return cls(data["centroids"], data["list_offsets"], data["list_rows"], str(data["fingerprint"]))
+
+    def matches(self, gallery):
+        return self.fingerprint == gallery.fingerprint
+
+    def probe(self, queries, nprobe):
+        """Return the ids of the ``nprobe`` closest lists for each query row."""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        coarse = queries @ self.centroids.T
+        if nprobe == self.n_lists:
+            return np.tile(np.arange(self.n_lists), (queries.shape[0], 1))
+        return np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+    def candidates(self, lists):
+        return np.concatenate([self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists])
+
+def match_decisions(names, sims, strict_threshold, doubt_threshold):
+    """
+    Sorting outcome of every face: a clear match for a given person (>= strict),
+    a doubt-zone rescue candidate (>= doubt) or unknown.
+    """
+    out = []
+    for name, sim in zip(names, sims):
+        if sim >= strict_threshold:
+            out.append(("clear", name))
+        elif sim >= doubt_threshold:
+            out.append(("doubt", name))
+        else:
+            out.append(("unknown", None))
+    return out
+
+def verified_nprobe(gallery, index, queries, start, strict_threshold, doubt_threshold, chunk=32):
+    """
+    Smallest nprobe, doubling from ``start``, for which the decisions on ``queries``
+    all equal those of exact matching. None when that needs more than half the
+    lists: the IVF scan is then no faster than exact matching.
+    """
+    def decide():
+        names, sims = [], []
+        for i in range(0, len(queries), chunk):
+            chunk_names, chunk_sims, _ = gallery.match(queries[i:i + chunk])
+            names.extend(chunk_names)
+            sims.extend(chunk_sims)
+        return match_decisions(names, sims, strict_threshold, doubt_threshold)
+
+    saved_index = gallery.index
+    saved_nprobe = gallery.nprobe
+    try:
+        gallery.index = None
+        exact = decide()
+        gallery.index = index
+        nprobe = max(1, start)
+        while nprobe <= index.n_lists // 2:
+            gallery.nprobe = nprobe
+            if decide() == exact:
+                return nprobe
+            nprobe *= 2
+        return None
+    finally:
+        gallery.index = saved_index
+        gallery.nprobe = saved_nprobe
+
+def recall_report(gallery, index, queries, nprobe_values, strict_threshold, doubt_threshold):
+    """Compare IVF answers with exact matching for several nprobe settings.
+
+    Decisions are compared as in match_decisions.
+    Returns a list of per-nprobe result dicts and prints a table.
+    """
+    def decisions(names, sims):
+        return match_decisions(names, sims, strict_threshold, doubt_threshold)
+
+    saved_index = gallery.index
+    saved_nprobe = gallery.nprobe
+    results = []
+    try:
+        gallery.index = None
+        start = time.perf_counter()
+        exact_names, exact_sims, _ = gallery.match(queries)
+        exact_ms = (time.perf_counter() - start) * 1000
+        exact_decisions = decisions(exact_names, exact_sims)
+
+        print(f"[INFO] Gallery rows: {len(gallery)}, lists: {index.n_lists}, queries: {len(queries)}")
+        print(f"[INFO] Thresholds: Strict={strict_threshold}, Doubt={doubt_threshold}")
+        print(f"{'nprobe':>8} {'top-1 recall':>13} {'decisions same':>15} {'changed':>8} {'time (ms)':>10} {'speedup':>8}")
+        print("-" * 68)
+        print(f"{'exact':>8} {'100.00%':>13} {'100.00%':>15} {0:>8} {exact_ms:>10.2f} {'1.0x':>8}")
+
+        gallery.index = index
+        for nprobe in nprobe_values:
+            gallery.nprobe = nprobe
+            start = time.perf_counter()
+            ann_names, ann_sims, _ = gallery.match(queries)
+            ann_ms = (time.perf_counter() - start) * 1000
+            ann_decisions = decisions(ann_names, ann_sims)
+
+            recall = np.mean([a == e for a, e in zip(ann_names, exact_names)]) if len(queries) else 1.0
+            changed = sum(a != e for a, e in zip(ann_decisions, exact_decisions))
+            same = 1.0 - changed / max(len(queries), 1)
+            results.append({'nprobe': nprobe, 'recall': recall, 'decisions_same': same,
+                            'changed': changed, 'ms': ann_ms})
+            print(f"{nprobe:>8} {recall * 100:>12.2f}% {same * 100:>14.2f}% {changed:>8} {ann_ms:>10.2f} "
+                  f"{exact_ms / max(ann_ms, 1e-9):>7.1f}x")
+        print("-" * 68)
+    finally:
+        gallery.index = saved_index
+        gallery.nprobe = saved_nprobe
+    return results
+
+def make_report_queries(gallery, num_queries, noise, rng):
+    """Perturbed gallery rows (enrolled people seen in new photos) plus random strangers."""
+    num_known = num_queries // 2
+    rows = gallery.matrix[rng.integers(0, len(gallery), size=num_known)]
+    known = rows + rng.standard_normal(rows.shape).astype(np.float32) * noise / np.sqrt(gallery.dim)
+    strangers = rng.standard_normal((num_queries - num_known, gallery.dim)).astype(np.float32)
+    return list(np.concatenate([known, strangers]))
+
+def main():
+    from process_photos import (ANN_INDEX_PATH, STRICT_THRESHOLD, DOUBT_THRESHOLD,
+                                load_embeddings)
+
+    parser = argparse.ArgumentParser(description="Recall-vs-exact report for the IVF gallery index")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32,64", help="Comma-separated nprobe values")
+    parser.add_argument("--queries", type=int, default=2000, help="Number of synthetic query faces")
+    parser.add_argument("--noise", type=float, default=1.5, help="Query noise relative to embedding norm")
+    parser.add_argument("--rebuild", action="store_true", help="Build a fresh index instead of loading the saved one")
+    parser.add_argument("--lists", type=int, default=None, help="Number of inverted lists when rebuilding")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    gallery = load_embeddings()
+    if args.rebuild or not os.path.exists(ANN_INDEX_PATH):
+        print("[INFO] Building IVF index...")
+        index = IVFIndex.build(gallery.matrix, n_lists=args.lists, seed=args.seed)
+    else:
+        index = IVFIndex.load(ANN_INDEX_PATH)
+        if not index.matches(gallery):
+            print("[WARN] Saved index does not match the current gallery; rebuilding in memory.")
+            index = IVFIndex.build(gallery.matrix, n_lists=args.lists, seed=args.seed)
+
+    rng = np.random.default_rng(args.seed)
+    queries = make_report_queries(gallery, args.queries, args.noise, rng)
+    nprobe_values = [int(v) for v in args.nprobe.split(",") if v.strip()]
+    recall_report(gallery, index, queries, nprobe_values, STRICT_THRESHOLD, DOUBT_THRESHOLD)
+
+if __name__ == "__main__":
+    main()
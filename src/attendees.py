@@ -0,0 +1,205 @@
+"""
+Indexed attendee table for results distribution.
+
+attendees.csv is parsed once into a table keyed by normalized name (case,
+whitespace, diacritics and ``_`` ignored, so the folder ``jose_garcia`` finds
+"José García") and cached in ``Data/attendees_index.json``. The cache is
+reused while the CSV's size and mtime are unchanged (or, if only the mtime
+moved, its SHA-256 is), so a run against a 100k-row registration does one
+JSON load instead of a CSV parse, and every lookup is a dict access.
+
+Names that resolve to nothing are never guessed: ``suggest`` lists the
+closest attendees by character-trigram overlap, for the report.
+"""
+
+import os
+import csv
+import json
+import hashlib
+import unicodedata
+
+ATTENDEES_INDEX_VERSION = 1
+NEAR_MIN_SCORE = 0.5  # Dice coefficient of the two names' trigram sets
+NEAR_MAX_SUGGESTIONS = 3
+MAX_REPORTED_ROWS = 10
+
+def normalize_name(name):
+    """Lookup key of a name: accents removed, casefolded, ``_`` as space, whitespace collapsed."""
+    decomposed = unicodedata.normalize("NFKD", name.replace("_", " "))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def parse_attendees_csv(csv_path):
+    """
+    Read attendees.csv (comma or semicolon separated, Name and Email columns).
+
+    Returns:
+        (rows, problems): [(name, email)] of valid rows, and a list of
+        human-readable reasons for every skipped row.
+
+    Raises:
+        ValueError: if the Name or Email column is missing.
+    """
+    with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+        first_line = f.readline()
+        delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        reader.fieldnames = [field.strip() if field else field for field in reader.fieldnames or []]
+        if "Name" not in reader.fieldnames or "Email" not in reader.fieldnames:
+            raise ValueError(f"Required columns 'Name' and 'Email' not found (columns: {reader.fieldnames})")
+
+        rows, problems = [], []
+        for row_number, row in enumerate(reader, 1):
+            name = (row.get("Name") or "").strip()
+            email = (row.get("Email") or "").strip()
+            if not name or not email:
+                problems.append(f"Row {row_number}: Missing Name or Email (Name='{name}', Email='{email}')")
+            elif "@" not in email:
+                problems.append(f"Row {row_number}: Invalid email format for '{name}' (Email='{email}')")
+            else:
+                rows.append((name, email))
+    return rows, problems
+
+class AttendeeIndex:
+    """
+    Name -> email table. ``name in index`` and ``index[name]`` accept any
+    spelling that normalizes to the same key; a key shared by attendees with
+    different emails is ambiguous and resolves to nothing.
+    """
+
+    def __init__(self, exact, by_key, ambiguous, problems=()):
+        self.exact = exact  # display name -> email
+        self.by_key = by_key  # normalized name -> email
+        self.ambiguous = ambiguous  # normalized name -> [display names]
+        self.problems = list(problems)
+        self._trigram_index = None
+
+    @classmethod
+    def from_rows(cls, rows, problems=()):
+        exact, by_key, ambiguous = {}, {}, {}
+        for name, email in rows:
+            exact[name] = email  # a later row wins, as with the former dict
+            key = normalize_name(name)
+            if key in ambiguous:
+                if name not in ambiguous[key]:
+                    ambiguous[key].append(name)
+            elif key in by_key and by_key[key] != email:
+                ambiguous[key] = sorted({n for n in exact if normalize_name(n) == key})
+                del by_key[key]
+            else:
+                by_key[key] = email
+        return cls(exact, by_key, ambiguous, problems)
+
+    def __len__(self):
+        return len(self.exact)
+
+    def __bool__(self):
+        return bool(self.exact)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        email = self.get(name)
+        if email is None:
+            raise KeyError(name)
+        return email
+
+    def get(self, name, default=None):
+        email = self.exact.get(name)
+        if email is None:
+            email = self.by_key.get(normalize_name(name))
+        return default if email is None else email
+
+    def suggest(self, name, limit=NEAR_MAX_SUGGESTIONS):
+        """Closest attendee names for a name that did not resolve (ambiguous candidates first)."""
+        key = normalize_name(name)
+        if key in self.ambiguous:
+            return list(self.ambiguous[key])
+        if self._trigram_index is None:
+            self._build_trigram_index()
+        keys, sizes, postings = self._trigram_index
+        query = trigrams(key)
+        shared = {}
+        for gram in query:
+            for i in postings.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        scored = []
+        for i, count in shared.items():
+            score = 2 * count / (len(query) + sizes[i])
+            if score >= NEAR_MIN_SCORE:
+                scored.append((score, keys[i][1]))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [name for _, name in scored[:limit]]
+
+    def _build_trigram_index(self):
+        # Built on first use only: a run where every folder resolves never pays for it
+        keys = sorted({(normalize_name(name), name) for name in self.exact})
+        sizes, postings = [], {}
+        for i, (key, _) in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self._trigram_index = (keys, sizes, postings)
+
+    def to_json(self):
+        return {"exact": self.exact, "by_key": self.by_key, "ambiguous": self.ambiguous, "problems": self.problems}
+
+def load_attendee_index(csv_path, cache_path):
+    """
+    Returns:
+        (index, rebuilt): the AttendeeIndex of ``csv_path`` and whether the CSV
+        had to be parsed (False = served from ``cache_path``).
+
+    Raises:
+        OSError / ValueError: if the CSV cannot be read or lacks the required columns.
+    """
+    st = os.stat(csv_path)
+    cached = None
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") != ATTENDEES_INDEX_VERSION or cached.get("csv") != os.path.abspath(csv_path):
+            cached = None
+    except (OSError, ValueError):
+        cached = None
+
+    sha = None
+    if cached is not None:
+        if cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+            return AttendeeIndex(**cached["index"]), False
+        if cached["size"] == st.st_size:
+            sha = _file_sha256(csv_path)
+            if sha == cached["sha256"]:
+                cached["mtime_ns"] = st.st_mtime_ns
+                _write_cache(cache_path, cached)
+                return AttendeeIndex(**cached["index"]), False
+
+    rows, problems = parse_attendees_csv(csv_path)
+    index = AttendeeIndex.from_rows(rows, problems)
+    _write_cache(cache_path, {
+        "version": ATTENDEES_INDEX_VERSION,
+        "csv": os.path.abspath(csv_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": sha or _file_sha256(csv_path),
+        "index": index.to_json(),
+    })
+    return index, True
+
+def _write_cache(cache_path, data):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
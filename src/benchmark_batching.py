@@ -0,0 +1,96 @@
+"""
+Equivalence and speed check of batched inference (analyze_decoded_batch).
+
+Every photo is decoded once, then analyzed photo by photo (analyze_decoded)
+and in consecutive batches of each ``--batch-sizes`` value, with the same
+engines. The report lists photos/s for every batch size, which model calls
+actually run batched on this model set, and checks that the batched path
+finds the same faces (largest bbox deviation in pixels, embedding cosine)
+and reaches the same match decisions against the enrolled gallery.
+
+Usage:
+    python src/benchmark_batching.py                          # all of Data/new_photos
+    python src/benchmark_batching.py --batch-sizes 4 16 --images a.jpg b.jpg
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+
+from benchmark_decode import cosine, decisions
+from process_photos import (
+    NEW_PHOTOS_DIR, analyze_decoded, analyze_decoded_batch, attach_ann_index, decode_for_analysis, initialize_models,
+    load_embeddings,
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+MIN_COSINE = 0.9999  # batched ONNX runs may differ from single runs in float rounding only
+
+def compare(reference, results):
+    """(same face count, largest bbox deviation, smallest cosine, same decisions) over all photos."""
+    same_faces, same_decision, deviation, min_cosine = 0, 0, 0.0, 1.0
+    for ref, res in zip(reference, results):
+        same_decision += int(res['status'] == ref['status'] and decisions(res) == decisions(ref))
+        if len(ref['faces']) != len(res['faces']):
+            continue
+        same_faces += 1
+        for a, b in zip(ref['faces'], res['faces']):
+            deviation = max(deviation, float(np.max(np.abs(np.subtract(a['bbox'], b['bbox'])))))
+            min_cosine = min(min_cosine, cosine(a['embedding'], b['embedding']))
+    return same_faces, deviation, min_cosine, same_decision
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched and per-photo inference")
+    parser.add_argument("--images", nargs="+", help=f"Photos to check (default: every image in {NEW_PHOTOS_DIR})")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8, 16], help="Batch sizes to measure")
+    args = parser.parse_args()
+
+    paths = args.images or [os.path.join(NEW_PHOTOS_DIR, f) for f in sorted(os.listdir(NEW_PHOTOS_DIR))
+                            if f.lower().endswith(IMAGE_EXTENSIONS)]
+    decoded = [decode_for_analysis(path) for path in paths]
+    decoded = [d for d in decoded if d[0] is not None]
+    if not decoded:
+        print("[WARN] No images to compare.")
+        return
+    gallery = attach_ann_index(load_embeddings())
+    app_small, app_hd, _ = initialize_models()
+
+    # Warm-up, so the first measurement does not pay for session initialization
+    analyze_decoded_batch(decoded[:2], app_small, app_hd, gallery)
+
+    start = time.perf_counter()
+    reference = [analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+                 for img, scale, max_dim in decoded]
+    baseline = time.perf_counter() - start
+    faces = sum(len(result['faces']) for result in reference)
+
+    print(f"\n[BATCHING] {len(decoded)} photos, {faces} faces")
+    for name, app in (("app_small", app_small), ("app_hd", app_hd)):
+        print(f"  {name}: detector {'batched' if app.supports_batched_detection() else 'per photo'}, "
+              f"recognizer {'batched' if app.supports_batched_recognition() else 'per face'}")
+    print(f"  {'batch':<8}{'photos/s':>10}{'speed-up':>10}{'same faces':>12}{'max bbox px':>13}{'min cosine':>12}"
+          f"{'same decisions':>16}")
+    print(f"  {1:<8}{len(decoded) / baseline:>10.1f}{1.0:>9.2f}x")
+
+    all_equal = True
+    for batch_size in args.batch_sizes:
+        batch_size = max(1, batch_size)
+        start = time.perf_counter()
+        results = []
+        for i in range(0, len(decoded), batch_size):
+            results.extend(analyze_decoded_batch(decoded[i:i + batch_size], app_small, app_hd, gallery))
+        seconds = time.perf_counter() - start
+        same_faces, deviation, min_cosine, same_decision = compare(reference, results)
+        all_equal &= same_faces == same_decision == len(decoded) and min_cosine >= MIN_COSINE
+        print(f"  {batch_size:<8}{len(decoded) / seconds:>10.1f}{baseline / seconds:>9.2f}x"
+              f"{f'{same_faces}/{len(decoded)}':>12}{deviation:>13.3f}{min_cosine:>12.6f}"
+              f"{f'{same_decision}/{len(decoded)}':>16}")
+
+    if all_equal:
+        print("[RESULT] Batched inference matches the per-photo path.")
+    else:
+        print("[RESULT] Batched inference DIFFERS from the per-photo path for some photos.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Equivalence and speed check of the reduced-scale decode (image_io.py).
+
+Every photo is analyzed twice with the same engines: once from a full
+``cv2.imread`` and once from ``decode_for_detection``. The report lists decode
+time and decoded pixel bytes (the peak-memory cost of holding the image) for
+both, and checks that the reduced decode finds the same faces (bbox IoU in
+full-resolution coordinates, embedding cosine) and reaches the same match
+decisions against the enrolled gallery. Photos below the reduction threshold
+are decoded identically and only count towards the totals.
+
+Usage:
+    python src/benchmark_decode.py                        # all of Data/new_photos
+    python src/benchmark_decode.py --images a.jpg b.jpg --floor 1600
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import cv2
+
+from image_io import REDUCED_DECODE_FLOOR, decode_for_detection, read_image_header, reduction_factor
+from process_photos import NEW_PHOTOS_DIR, analyze_decoded, attach_ann_index, initialize_models, load_embeddings
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def cosine(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / denom) if denom > 0 else 0.0
+
+def pair_faces(full_faces, reduced_faces):
+    """Greedy pairing of faces by bbox IoU; returns [(iou, cosine)] per full-decode face found again."""
+    pairs = []
+    used = set()
+    for face in full_faces:
+        best, best_iou = None, 0.0
+        for j, other in enumerate(reduced_faces):
+            if j in used:
+                continue
+            overlap = iou(face['bbox'], other['bbox'])
+            if overlap > best_iou:
+                best, best_iou = j, overlap
+        if best is not None:
+            used.add(best)
+            pairs.append((best_iou, cosine(face['embedding'], reduced_faces[best]['embedding'])))
+    return pairs
+
+def decisions(result):
+    return sorted(result['matches']), result['low_quality'], len(result['needs_rescue'])
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full and reduced-scale decoding for detection")
+    parser.add_argument("--images", nargs="+", help=f"Photos to check (default: every image in {NEW_PHOTOS_DIR})")
+    parser.add_argument("--floor", type=int, default=REDUCED_DECODE_FLOOR,
+                        help="Minimum longer side of a reduced decode in pixels")
+    args = parser.parse_args()
+
+    paths = args.images or [os.path.join(NEW_PHOTOS_DIR, f) for f in sorted(os.listdir(NEW_PHOTOS_DIR))
+                            if f.lower().endswith(IMAGE_EXTENSIONS)]
+    gallery = attach_ann_index(load_embeddings())
+    app_small, app_hd, _ = initialize_models()
+
+    totals = {'images': 0, 'reduced': 0, 'full_seconds': 0.0, 'reduced_seconds': 0.0,
+              'full_bytes': 0, 'reduced_bytes': 0, 'faces_full': 0, 'faces_reduced': 0,
+              'faces_paired': 0, 'same_decision': 0}
+    ious, cosines = [], []
+
+    for path in paths:
+        full_img, full_seconds = timed(cv2.imread, path)
+        if full_img is None:
+            print(f"[SKIP] Unreadable: {path}")
+            continue
+        (img, scale, max_dim), reduced_seconds = timed(decode_for_detection, path, args.floor)
+        factor = reduction_factor(read_image_header(path), args.floor)
+
+        totals['images'] += 1
+        totals['full_seconds'] += full_seconds
+        totals['reduced_seconds'] += reduced_seconds
+        totals['full_bytes'] += full_img.nbytes
+        totals['reduced_bytes'] += img.nbytes
+        if factor == 1:
+            totals['same_decision'] += 1
+            continue
+
+        full = analyze_decoded(full_img, app_small, app_hd, gallery)
+        reduced = analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+        pairs = pair_faces(full['faces'], reduced['faces'])
+        ious.extend(p[0] for p in pairs)
+        cosines.extend(p[1] for p in pairs)
+
+        same = decisions(full) == decisions(reduced)
+        totals['reduced'] += 1
+        totals['faces_full'] += len(full['faces'])
+        totals['faces_reduced'] += len(reduced['faces'])
+        totals['faces_paired'] += len(pairs)
+        totals['same_decision'] += int(same)
+        status = "same" if same else "DIFFER"
+        print(f"  {os.path.basename(path)}: 1/{factor} decode, {full_seconds * 1000:.1f} -> {reduced_seconds * 1000:.1f} ms, "
+              f"faces {len(full['faces'])} -> {len(reduced['faces'])}, decisions {status}")
+
+    if not totals['images']:
+        print("[WARN] No images to compare.")
+        return
+
+    print("\n[DECODE]")
+    print(f"  Images: {totals['images']} ({totals['reduced']} decoded at reduced scale)")
+    print(f"  Decode time: {totals['full_seconds']:.2f}s full vs {totals['reduced_seconds']:.2f}s reduced "
+          f"({totals['full_seconds'] / max(totals['reduced_seconds'], 1e-9):.2f}x)")
+    print(f"  Decoded pixels: {totals['full_bytes'] / 1e6:.1f} MB full vs {totals['reduced_bytes'] / 1e6:.1f} MB reduced")
+
+    print("\n[EQUIVALENCE]")
+    print(f"  Faces: {totals['faces_full']} full vs {totals['faces_reduced']} reduced "
+          f"({totals['faces_paired']} paired)")
+    if ious:
+        print(f"  Bbox IoU: mean {np.mean(ious):.3f}, min {np.min(ious):.3f}")
+        print(f"  Embedding cosine: mean {np.mean(cosines):.4f}, min {np.min(cosines):.4f}")
+    agreement = totals['same_decision'] / totals['images'] * 100
+    print(f"[RESULT] Same match decisions for {totals['same_decision']}/{totals['images']} images ({agreement:.1f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: per-pair find_best_match loop vs. vectorized Gallery matching.
+
+Builds synthetic galleries of increasing size (two embeddings per person, like
+enroll.py's original + flipped), matches a batch of query faces with both
+implementations and checks that they agree on the best person and similarity.
+
+Usage:
+    python src/benchmark_matching.py --sizes 10,100,1000,5000 --faces 20
+"""
+
+import argparse
+import time
+import numpy as np
+
+from gallery import Gallery
+from process_photos import find_best_match_loop
+
+EMBEDDING_DIM = 512
+# The loop computes float64 cosines (scipy); Gallery multiplies float32 unit vectors, which
+# differ from them by about 1e-7 at 512 dimensions. Ties closer than this may pick another name.
+SIM_TOLERANCE = 1e-5
+
+def make_synthetic_db(num_people, per_person, rng):
+    centers = rng.standard_normal((num_people, EMBEDDING_DIM)).astype(np.float32)
+    embeddings_db = {}
+    for i, center in enumerate(centers):
+        noise = rng.standard_normal((per_person, EMBEDDING_DIM)).astype(np.float32) * 0.3
+        embeddings_db[f"person_{i:05d}"] = [center + n for n in noise]
+    return embeddings_db, centers
+
+def make_queries(centers, num_faces, rng):
+    # Half the faces belong to enrolled people, half are strangers
+    known = centers[rng.integers(0, len(centers), size=num_faces // 2)]
+    known = known + rng.standard_normal(known.shape).astype(np.float32) * 0.5
+    strangers = rng.standard_normal((num_faces - len(known), EMBEDDING_DIM)).astype(np.float32)
+    return list(np.concatenate([known, strangers]))
+
+def run_benchmark(sizes, num_faces, per_person, repeats, seed):
+    rng = np.random.default_rng(seed)
+
+    print(f"{'people':>8} {'rows':>8} {'loop (ms)':>12} {'gallery (ms)':>14} {'build (ms)':>12} {'speedup':>9} {'agree':>7}")
+    print("-" * 76)
+
+    all_agree = True
+    for num_people in sizes:
+        embeddings_db, centers = make_synthetic_db(num_people, per_person, rng)
+        queries = make_queries(centers, num_faces, rng)
+
+        start = time.perf_counter()
+        gallery = Gallery.from_db(embeddings_db)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        loop_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            loop_results = [find_best_match_loop(q, embeddings_db) for q in queries]
+            loop_times.append(time.perf_counter() - start)
+
+        gallery_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            names, sims, _ = gallery.match(queries)
+            gallery_times.append(time.perf_counter() - start)
+
+        agree = all(
+            name == loop_name and abs(sim - loop_sim) <= SIM_TOLERANCE
+            for (loop_name, loop_sim), name, sim in zip(loop_results, names, sims)
+        )
+        all_agree = all_agree and agree
+
+        loop_ms = min(loop_times) * 1000
+        gallery_ms = min(gallery_times) * 1000
+        print(f"{num_people:>8} {len(gallery):>8} {loop_ms:>12.2f} {gallery_ms:>14.3f} {build_ms:>12.2f} "
+              f"{loop_ms / max(gallery_ms, 1e-9):>8.1f}x {'yes' if agree else 'NO':>7}")
+
+    print("-" * 76)
+    print(f"[{'OK' if all_agree else 'ERROR'}] Gallery results {'match' if all_agree else 'DIFFER from'} the per-pair loop")
+    return all_agree
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark find_best_match loop vs. Gallery matrix matching")
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="Comma-separated gallery sizes (people)")
+    parser.add_argument("--faces", type=int, default=20, help="Query faces per batch (faces in one photo)")
+    parser.add_argument("--per-person", type=int, default=2, help="Stored embeddings per person")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing repeats (best is reported)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    ok = run_benchmark(sizes, args.faces, args.per_person, args.repeats, args.seed)
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark of model startup, memory and per-face latency.
+
+Model configurations (each loaded in a fresh child process):
+
+    separate        two full buffalo_l loads (the old app_small / app_hd)
+    shared          one shared FaceAnalysis with per-call detector input sizes
+    shared-det-rec  shared, restricted to the detection + recognition heads (current)
+
+Each child reports the time to build both engines and its resident memory
+before and after loading. With --image, every configuration also analyzes the
+same photo with each engine (per-face latency over --runs calls) and the
+detections/embeddings are checked for agreement with ``separate``.
+
+The import section times a cold ``import process_photos`` against importing
+it together with gfpgan, scipy, insightface and tqdm, which process_photos.py
+used to import at module load.
+
+Usage:
+    python src/benchmark_models.py --repeats 3 --image Data/new_photos/example.jpg --runs 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+MODES = ("separate", "shared", "shared-det-rec")
+EAGER_IMPORTS = ("gfpgan", "scipy.spatial.distance", "insightface", "tqdm")
+
+def resident_mb():
+    """Current resident set size in MB (VmRSS on Linux, peak RSS elsewhere)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def load_separate():
+    # The pre-face_models setup: two full buffalo_l stacks
+    import insightface
+    engines = []
+    for det_size in ((320, 320), (640, 640)):
+        app = insightface.app.FaceAnalysis(name='buffalo_l')
+        app.prepare(ctx_id=-1, det_size=det_size)
+        engines.append(app)
+    return engines
+
+def load_shared(allowed_modules=None):
+    import insightface
+    from face_models import DetectorSizeView, SMALL_DET_SIZE, HD_DET_SIZE
+    app = insightface.app.FaceAnalysis(name='buffalo_l', allowed_modules=allowed_modules)
+    app.prepare(ctx_id=-1, det_size=HD_DET_SIZE)
+    return [DetectorSizeView(app, SMALL_DET_SIZE), DetectorSizeView(app, HD_DET_SIZE)]
+
+def run_child(mode, image_path, runs):
+    # Imports are paid before the clock starts, so only model loading is measured
+    import insightface  # noqa: F401
+    import cv2
+
+    rss_before = resident_mb()
+    start = time.perf_counter()
+    if mode == "separate":
+        engines = load_separate()
+    else:
+        from face_models import ANALYSIS_MODULES
+        engines = load_shared(ANALYSIS_MODULES if mode == "shared-det-rec" else None)
+    load_seconds = time.perf_counter() - start
+    report = {"mode": mode, "load_seconds": load_seconds, "rss_before_mb": rss_before, "rss_after_mb": resident_mb()}
+
+    if image_path:
+        img = cv2.imread(image_path)
+        faces = []
+        face_ms = []
+        for engine in engines:
+            engine.get(img)  # warm-up
+            start = time.perf_counter()
+            for _ in range(runs):
+                detected = engine.get(img)
+            face_ms.append((time.perf_counter() - start) / max(runs, 1) / max(len(detected), 1) * 1000)
+            faces.append([
+                {"bbox": [float(v) for v in face.bbox], "det_score": float(face.det_score),
+                 "embedding": [float(v) for v in face.embedding]}
+                for face in engine.get(img)
+            ])
+        report["faces"] = faces
+        report["face_ms"] = face_ms
+    print(json.dumps(report))
+
+def run_import_child(kind):
+    start = time.perf_counter()
+    if kind == "eager":
+        import importlib
+        for name in EAGER_IMPORTS:
+            importlib.import_module(name)
+    import process_photos  # noqa: F401
+    print(json.dumps({"kind": kind, "import_seconds": time.perf_counter() - start}))
+
+def measure(mode, image_path, runs):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--runs", str(runs)]
+    if image_path:
+        cmd += ["--image", image_path]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    # Model loaders print progress; the report is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+def measure_imports(kind):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child-imports", kind]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])["import_seconds"]
+
+def faces_agree(a, b, tolerance=1e-4):
+    if len(a) != len(b):
+        return False
+    for fa, fb in zip(a, b):
+        if not np.allclose(fa["bbox"], fb["bbox"], atol=1e-3):
+            return False
+        if abs(fa["det_score"] - fb["det_score"]) > tolerance:
+            return False
+        if not np.allclose(fa["embedding"], fb["embedding"], atol=tolerance):
+            return False
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Model startup time, memory and per-face latency")
+    parser.add_argument("--repeats", type=int, default=3, help="Child processes per configuration")
+    parser.add_argument("--image", help="Optional photo for per-face latency and an agreement check between configurations")
+    parser.add_argument("--runs", type=int, default=5, help="Calls per engine for the per-face latency (with --image)")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--child-imports", choices=("lazy", "eager"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_imports:
+        run_import_child(args.child_imports)
+        return
+    if args.child:
+        run_child(args.child, args.image, args.runs)
+        return
+
+    repeats = max(1, args.repeats)
+    print("[IMPORTS]")
+    for kind, label in (("eager", "process_photos + " + ", ".join(EAGER_IMPORTS)), ("lazy", "process_photos")):
+        seconds = float(np.median([measure_imports(kind) for _ in range(repeats)]))
+        print(f"  {kind:>5}: {seconds:.2f}s  ({label})")
+
+    results = {mode: [measure(mode, args.image, args.runs) for _ in range(repeats)] for mode in MODES}
+
+    print("\n[MODELS]")
+    header = f"  {'mode':>15} {'startup (s)':>12} {'RSS before (MB)':>16} {'RSS after (MB)':>15} {'models (MB)':>12}"
+    if args.image:
+        header += f" {'small ms/face':>14} {'hd ms/face':>11}"
+    print(header)
+    summary = {}
+    for mode in MODES:
+        load = float(np.median([r["load_seconds"] for r in results[mode]]))
+        before = float(np.median([r["rss_before_mb"] for r in results[mode]]))
+        after = float(np.median([r["rss_after_mb"] for r in results[mode]]))
+        summary[mode] = (load, after - before)
+        line = f"  {mode:>15} {load:>12.2f} {before:>16.1f} {after:>15.1f} {after - before:>12.1f}"
+        if args.image:
+            small_ms, hd_ms = np.median([r["face_ms"] for r in results[mode]], axis=0)
+            line += f" {small_ms:>14.2f} {hd_ms:>11.2f}"
+        print(line)
+
+    sep_load, sep_mem = summary["separate"]
+    for mode in MODES[1:]:
+        load, mem = summary[mode]
+        print(f"[RESULT] {mode}: startup {sep_load / max(load, 1e-9):.2f}x faster, "
+              f"model memory {sep_mem - mem:.1f} MB lower than separate")
+
+    if args.image:
+        separate_faces = results["separate"][0]["faces"]
+        for mode in MODES[1:]:
+            for name, a, b in zip(("app_small", "app_hd"), separate_faces, results[mode][0]["faces"]):
+                status = "agree" if faces_agree(a, b) else "DIFFER"
+                print(f"[CHECK] {mode} {name}: {len(a)} faces (separate) vs {len(b)} -> {status}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Speed, memory and agreement of ONNX Runtime configurations on our own photos.
+
+Configurations (each loaded in a fresh child process):
+
+    fp32        library defaults, what the pipeline uses without runtime flags
+    fp32-tuned  the given runtime flags (threads, graph optimization, arenas)
+    int8        the given runtime flags with the INT8 quantized detector/recognizer
+
+``fp32-tuned`` is left out when no runtime flag is given. Every child analyzes
+the same photos (Data/new_photos or --images) --runs times with the sorting
+engines and reports model load time, resident memory after loading and after
+inference, photos/s and ms per face. The faces of every configuration are
+paired with the fp32 ones by bbox IoU and compared by embedding cosine, and
+the match decisions against the enrolled gallery are compared per photo.
+The INT8 models are generated (Data/models/int8/) before the first int8 child
+is timed.
+
+Usage:
+    python src/benchmark_runtime.py --intra-op-threads 4 --runs 3
+    python src/benchmark_runtime.py --images a.jpg b.jpg --graph-opt extended --no-cpu-arena
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+
+from benchmark_decode import decisions, pair_faces
+from benchmark_models import resident_mb
+from face_models import (
+    DEFAULT_RUNTIME, INT8_MODELS_DIR, add_runtime_arguments, describe_runtime, runtime_cli_args, runtime_from_args,
+)
+from process_photos import NEW_PHOTOS_DIR
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def run_child(settings, paths, runs):
+    from face_models import configure_runtime
+    from process_photos import analyze_decoded, attach_ann_index, decode_for_analysis, initialize_models, load_embeddings
+
+    configure_runtime(settings)
+    gallery = attach_ann_index(load_embeddings())
+    decoded = [decode_for_analysis(path) for path in paths]
+
+    rss_before = resident_mb()
+    start = time.perf_counter()
+    app_small, app_hd, _ = initialize_models()
+    load_seconds = time.perf_counter() - start
+    rss_loaded = resident_mb()
+
+    img, scale, max_dim = decoded[0]
+    analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)  # warm-up
+    start = time.perf_counter()
+    for _ in range(max(1, runs)):
+        results = [analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+                   for img, scale, max_dim in decoded]
+    seconds = (time.perf_counter() - start) / max(1, runs)
+
+    print(json.dumps({
+        "load_seconds": load_seconds,
+        "rss_before_mb": rss_before,
+        "rss_loaded_mb": rss_loaded,
+        "rss_after_mb": resident_mb(),
+        "seconds": seconds,
+        "results": [
+            {"decisions": [result['status'], *decisions(result)],
+             "faces": [{"bbox": face['bbox'], "embedding": face['embedding'].tolist()} for face in result['faces']]}
+            for result in results
+        ],
+    }))
+
+def measure(settings, paths, runs):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", json.dumps(settings), "--runs", str(runs),
+           "--images", *paths]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    # Model loaders print progress; the report is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime settings and INT8 models against FP32 defaults")
+    parser.add_argument("--images", nargs="+", help=f"Photos to analyze (default: every image in {NEW_PHOTOS_DIR})")
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the photos per configuration")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+
+    paths = args.images or [os.path.join(NEW_PHOTOS_DIR, f) for f in sorted(os.listdir(NEW_PHOTOS_DIR))
+                            if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if args.child:
+        run_child(json.loads(args.child), paths, args.runs)
+        return
+    if not paths:
+        print("[WARN] No images to analyze.")
+        return
+
+    tuned = runtime_from_args(args)
+    configs = {"fp32": dict(DEFAULT_RUNTIME)}
+    if dict(tuned, int8=False) != DEFAULT_RUNTIME:
+        configs["fp32-tuned"] = dict(tuned, int8=False)
+    configs["int8"] = dict(tuned, int8=True)
+    for name, settings in configs.items():
+        flags = " ".join(runtime_cli_args(settings)) or "(no flags)"
+        print(f"[INFO] {name}: {describe_runtime(settings)}  {flags}")
+
+    if not (os.path.isdir(INT8_MODELS_DIR) and any(f.endswith(".int8.onnx") for f in os.listdir(INT8_MODELS_DIR))):
+        print("[INFO] Generating the INT8 models (not timed)...")
+        measure(configs["int8"], paths[:1], 1)
+
+    reports = {}
+    for name, settings in configs.items():
+        print(f"[INFO] Measuring {name}...")
+        reports[name] = measure(settings, paths, args.runs)
+
+    faces = sum(len(result["faces"]) for result in reports["fp32"]["results"])
+    print(f"\n[RUNTIME] {len(paths)} photos, {faces} faces (fp32), {args.runs} passes")
+    print(f"  {'config':<12}{'startup (s)':>12}{'models (MB)':>13}{'RSS after run (MB)':>20}{'photos/s':>10}"
+          f"{'ms/face':>9}{'speed-up':>10}")
+    base_seconds = reports["fp32"]["seconds"]
+    for name, report in reports.items():
+        print(f"  {name:<12}{report['load_seconds']:>12.2f}{report['rss_loaded_mb'] - report['rss_before_mb']:>13.1f}"
+              f"{report['rss_after_mb']:>20.1f}{len(paths) / report['seconds']:>10.1f}"
+              f"{report['seconds'] / max(faces, 1) * 1000:>9.1f}{base_seconds / report['seconds']:>9.2f}x")
+
+    print("\n[AGREEMENT] against fp32")
+    reference = reports["fp32"]["results"]
+    for name, report in reports.items():
+        if name == "fp32":
+            continue
+        pairs, found, same = [], 0, 0
+        for ref, res in zip(reference, report["results"]):
+            pairs.extend(pair_faces(ref["faces"], res["faces"]))
+            found += len(res["faces"])
+            same += int(ref["decisions"] == res["decisions"])
+        line = f"  {name}: faces {faces} vs {found} ({len(pairs)} paired)"
+        if pairs:
+            ious, cosines = np.array(pairs).T
+            line += (f", bbox IoU mean {ious.mean():.3f} min {ious.min():.3f}, "
+                     f"embedding cosine mean {cosines.mean():.4f} min {cosines.min():.4f}")
+        print(line)
+        print(f"[RESULT] {name}: same match decisions for {same}/{len(reference)} photos "
+              f"({same / len(reference) * 100:.1f}%)")
+
+if __name__ == "__main__":
+    main()
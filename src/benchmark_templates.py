@@ -0,0 +1,131 @@
+"""
+Accuracy and gallery size of the multi-photo enrollment templates (enroll.py).
+
+For every person with a subfolder of two or more reference photos, each photo
+is held out in turn and matched against a gallery enrolled from all other
+photos (leave-one-out); people with a single photo take part as distractors.
+With ``--holdout DIR`` (``DIR/<Person>/*.jpg``) those photos are the probes
+instead, matched against a gallery of every reference photo; probes of people
+who are not enrolled measure false accepts.
+
+Enrollment strategies compared:
+
+    single    first photo only (original + flipped), the one-photo layout
+    all       every photo (original + flipped), the gallery grows per photo
+    mean      quality-weighted mean only
+    template  mean + medoid exemplars, what enroll.py stores
+
+Reported per strategy: gallery rows, rank-1 accuracy, the share of probes
+accepted for the right person at STRICT_THRESHOLD and false accepts.
+Reference photo embeddings come from Data/enroll_photos.npz, so run
+``python src/enroll.py`` first.
+
+Usage:
+    python src/benchmark_templates.py
+    python src/benchmark_templates.py --holdout Data/holdout
+"""
+
+import os
+import argparse
+
+from gallery import Gallery
+from enroll import (
+    IMAGE_EXTENSIONS, build_template, embed_known_photo, list_known_photos, load_enrollment_model, load_photo_cache,
+)
+from process_photos import STRICT_THRESHOLD
+
+STRATEGIES = {
+    "single": lambda photos: build_template(photos[:1]),
+    "all": lambda photos: [vec for photo in photos for vec in (photo["embedding"], photo["flipped"])],
+    "mean": lambda photos: build_template(photos, exemplars=0),
+    "template": build_template,
+}
+
+def load_reference_photos():
+    """{person: [photo]} from the enrollment photo cache, in known_people order."""
+    cache = load_photo_cache()
+    people, missing = {}, 0
+    for filename, person in list_known_photos():
+        photo = cache.get(filename)
+        if photo is None:
+            missing += 1
+        elif photo["embedding"] is not None:
+            people.setdefault(person, []).append(photo)
+    if missing:
+        print(f"[WARN] {missing} reference photos are not in the enrollment cache; run enroll.py first.")
+    return people
+
+def load_holdout(folder):
+    """[(person, embedding)] of every face photo in ``folder/<Person>/``."""
+    app = load_enrollment_model()
+    if app is None:
+        raise SystemExit("[ERROR] Failed to load the face model.")
+    probes = []
+    for person in sorted(os.listdir(folder)):
+        person_dir = os.path.join(folder, person)
+        if not os.path.isdir(person_dir):
+            continue
+        for filename in sorted(os.listdir(person_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                # embed_known_photo reads relative to known_people; an absolute path overrides it
+                photo = embed_known_photo(app, os.path.abspath(os.path.join(person_dir, filename)))
+                if photo is not None:
+                    probes.append((person, photo["embedding"]))
+    return probes
+
+def evaluate(strategy, people, probes):
+    """
+    Args:
+        probes: [(true person, embedding, held-out photo index or None)]
+
+    Returns:
+        {'rows', 'rank1', 'accepted', 'false_accepts', 'probes'}
+    """
+    base_db = {person: strategy(photos) for person, photos in people.items()}
+    totals = {"rows": Gallery.from_db(base_db).matrix.shape[0], "rank1": 0, "accepted": 0,
+              "false_accepts": 0, "probes": len(probes)}
+    base_gallery = None
+    for person, embedding, held_out in probes:
+        if held_out is None:
+            if base_gallery is None:
+                base_gallery = Gallery.from_db(base_db)
+            gallery = base_gallery
+        else:
+            db = dict(base_db)
+            db[person] = strategy([p for i, p in enumerate(people[person]) if i != held_out])
+            gallery = Gallery.from_db(db)
+        names, sims, _ = gallery.match([embedding])
+        correct = names[0] == person
+        totals["rank1"] += int(correct)
+        if sims[0] >= STRICT_THRESHOLD:
+            totals["accepted" if correct else "false_accepts"] += 1
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare multi-photo enrollment strategies on held-out photos")
+    parser.add_argument("--holdout", help="Folder of <Person>/<photo> probes (default: leave-one-out over known_people)")
+    args = parser.parse_args()
+
+    people = load_reference_photos()
+    if args.holdout:
+        probes = [(person, emb, None) for person, emb in load_holdout(args.holdout)]
+        mode = f"held-out photos from {args.holdout}"
+    else:
+        probes = [(person, photo["embedding"], i) for person, photos in people.items() if len(photos) > 1
+                  for i, photo in enumerate(photos)]
+        mode = "leave-one-out"
+    if not probes:
+        print("[WARN] No probes: add person subfolders with 2+ photos to known_people, or pass --holdout.")
+        return
+
+    multi = sum(1 for photos in people.values() if len(photos) > 1)
+    print(f"[TEMPLATES] {len(people)} people ({multi} with 2+ photos), {len(probes)} probes, {mode}")
+    print(f"  {'strategy':<10}{'rows':>8}{'rank-1':>10}{f'accepted@{STRICT_THRESHOLD}':>16}{'false accepts':>15}")
+    for name, strategy in STRATEGIES.items():
+        result = evaluate(strategy, people, probes)
+        n = max(result["probes"], 1)
+        print(f"  {name:<10}{result['rows']:>8}{result['rank1'] / n * 100:>9.1f}%{result['accepted'] / n * 100:>15.1f}%"
+              f"{result['false_accepts']:>15}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Persistent per-attendee delivery ledger (SQLite) for incremental distribution.
+
+Every photo that reached an attendee is recorded under the attendee's email
+and the SHA-256 of the file, with the time of delivery. A later
+``send_results.py`` run only packages photos whose content that attendee has
+not received yet, so photos arriving during a multi-day event are sent once,
+and a photo that is renamed or placed again is not sent twice. File hashes
+are cached by path, size and mtime, so unchanged photos are not re-read.
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+DELIVERY_LEDGER_SCHEMA_VERSION = 1
+HASH_CHUNK = 1 << 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    email TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    delivered_at REAL NOT NULL,
+    PRIMARY KEY (email, sha256)
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+"""
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def split_parts(entries, max_bytes):
+    """
+    Split [{'path', 'arcname', 'sha256', 'size'}] into consecutive parts of at
+    most ``max_bytes`` each (None = one part). A file larger than the cap goes
+    into a part of its own.
+    """
+    if not max_bytes:
+        return [entries] if entries else []
+    parts, current, current_size = [], [], 0
+    for entry in entries:
+        if current and current_size + entry['size'] > max_bytes:
+            parts.append(current)
+            current, current_size = [], 0
+        current.append(entry)
+        current_size += entry['size']
+    if current:
+        parts.append(current)
+    return parts
+
+class DeliveryLedger:
+    """SQLite-backed record of which photo contents each attendee received. Calls are serialized, so threads may share it."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)",
+                              (str(DELIVERY_LEDGER_SCHEMA_VERSION),))
+        elif int(row[0]) != DELIVERY_LEDGER_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported delivery ledger schema {row[0]} in {path}")
+        self.conn.commit()
+
+    def file_hash(self, path):
+        st = os.stat(path)
+        with self._lock:
+            row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        sha = file_sha256(path)
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                              (path, st.st_size, st.st_mtime_ns, sha))
+        return sha
+
+    def entries(self, files):
+        """
+        Args:
+            files: [(path, arcname)] currently in a person folder
+
+        Returns:
+            [{'path', 'arcname', 'sha256', 'size'}] in input order, one per distinct content.
+        """
+        entries, seen = [], set()
+        for path, arcname in files:
+            sha = self.file_hash(path)
+            if sha not in seen:
+                seen.add(sha)
+                entries.append({'path': path, 'arcname': arcname, 'sha256': sha, 'size': os.path.getsize(path)})
+        with self._lock:
+            self.conn.commit()  # hashes computed above
+        return entries
+
+    def pending(self, email, files):
+        """Like entries(), restricted to the contents the attendee at ``email`` has not received."""
+        entries = self.entries(files)
+        with self._lock:
+            delivered = {row[0] for row in self.conn.execute("SELECT sha256 FROM deliveries WHERE email = ?", (email,))}
+        return [entry for entry in entries if entry['sha256'] not in delivered]
+
+    def mark_delivered(self, email, entries):
+        """Record a successful send; committed at once, as a lost record means the photos go out again."""
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO deliveries (email, sha256, file, size, delivered_at) VALUES (?, ?, ?, ?, ?)",
+                [(email, entry['sha256'], entry['arcname'], entry['size'], now) for entry in entries],
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
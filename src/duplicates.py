@@ -0,0 +1,204 @@
+"""
+Duplicate and near-duplicate photo grouping, run before face inference.
+
+Event dumps contain the same photo several times (several uploaders, chat
+re-compressions, burst shots). Every photo is fingerprinted with a SHA-256 of
+its bytes and a 256-bit difference hash (dHash) of a small grayscale decode:
+
+    exact  photos with identical bytes form one group
+    near   additionally, photos of the same aspect ratio whose dHashes are
+           within ``NEAR_MAX_DISTANCE`` bits join the group of the largest
+           such photo (greedy leader clustering, so groups never chain
+           A ~ B ~ C into one), provided their 128x128 colour thumbnails also
+           agree to ``NEAR_MAX_PIXEL_DIFF`` everywhere; the gradient hash
+           alone cannot tell apart shots that differ in a small region, such
+           as one more (or another) face in a group photo
+
+Only the representative of a group is analyzed; its decision is fanned out to
+the other members. Fingerprints are kept in ``Data/duplicate_groups.json``
+(keyed by file size and mtime) so unchanged photos are not hashed again, and
+the groups of the last run are written there for review.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import cv2
+
+from image_io import REDUCED_FLAGS, read_image_header, reduction_factor
+from rescue_cache import dhash
+
+DEDUP_MODES = ("off", "exact", "near")
+DUPLICATES_VERSION = 1
+NEAR_MAX_DISTANCE = 10  # of 256 dHash bits
+NEAR_MAX_ASPECT_DIFF = 0.01
+NEAR_MAX_PIXEL_DIFF = 24  # per channel, on a 128x128 thumbnail
+THUMB_SIZE = 128
+HASH_CHUNK = 1 << 20
+
+# Number of set bits for every byte value, for Hamming distances on packed hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def perceptual_hash(path):
+    """
+    Returns:
+        (dhash hex, width, height) of a photo, or None if it cannot be decoded.
+        JPEGs are decoded at 1/8 scale; the hash only looks at a 17x16 thumbnail.
+    """
+    header = read_image_header(path)
+    flags = cv2.IMREAD_REDUCED_GRAYSCALE_8 if header is not None and header[0] == "jpeg" else cv2.IMREAD_GRAYSCALE
+    img = cv2.imread(path, flags)
+    if img is None:
+        return None
+    if header is not None:
+        width, height = header[1], header[2]
+    else:
+        height, width = img.shape[:2]
+    return dhash(img).tobytes().hex(), width, height
+
+def thumbnail(path):
+    factor = reduction_factor(read_image_header(path), floor=2 * THUMB_SIZE)
+    img = cv2.imread(path, REDUCED_FLAGS[factor]) if factor > 1 else cv2.imread(path)
+    if img is None:
+        return None
+    return cv2.resize(img, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+class Fingerprints:
+    """Per-file SHA-256 / dHash cache stored in the duplicate groups file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.hashed = 0
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == DUPLICATES_VERSION:
+                self.entries = data.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+    def keep_only(self, names):
+        """Drop fingerprints of photos that are no longer in the folder."""
+        names = set(names)
+        self.entries = {name: entry for name, entry in self.entries.items() if name in names}
+
+    def get(self, path, near):
+        """Fingerprint of one photo ({'sha256', 'dhash', 'width', 'height'}); dHash only with ``near``."""
+        st = os.stat(path)
+        name = os.path.basename(path)
+        entry = self.entries.get(name)
+        if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+            entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(path)}
+            self.entries[name] = entry
+            self.hashed += 1
+        if near and "dhash" not in entry:
+            phash = perceptual_hash(path)
+            entry["dhash"], entry["width"], entry["height"] = phash if phash else (None, 0, 0)
+        return entry
+
+def _near_leaders(folder, names, fingerprints):
+    """Greedy clustering of exact-group representatives by dHash distance and aspect ratio."""
+    usable = [n for n in names if fingerprints[n].get("dhash")]
+    # Largest photo first, so it becomes the analyzed representative of its group
+    usable.sort(key=lambda n: (-fingerprints[n]["width"] * fingerprints[n]["height"], n))
+    if len(usable) < 2:
+        return {}
+
+    hashes = np.stack([np.frombuffer(bytes.fromhex(fingerprints[n]["dhash"]), dtype=np.uint8) for n in usable])
+    aspects = np.array([fingerprints[n]["width"] / max(fingerprints[n]["height"], 1) for n in usable])
+    assigned = np.zeros(len(usable), dtype=bool)
+    thumbs = {}
+
+    def thumb(j):
+        if j not in thumbs:
+            thumbs[j] = thumbnail(os.path.join(folder, usable[j]))
+        return thumbs[j]
+
+    groups = {}
+    for i, name in enumerate(usable):
+        if assigned[i]:
+            continue
+        assigned[i] = True
+        distances = _POPCOUNT[np.bitwise_xor(hashes, hashes[i])].sum(axis=1, dtype=np.int32)
+        close = ((distances <= NEAR_MAX_DISTANCE) & ~assigned
+                 & (np.abs(aspects - aspects[i]) <= NEAR_MAX_ASPECT_DIFF * aspects[i]))
+        members = [j for j in np.flatnonzero(close)
+                   if thumb(i) is not None and thumb(j) is not None
+                   and int(np.abs(thumb(i) - thumb(j)).max()) <= NEAR_MAX_PIXEL_DIFF]
+        if members:
+            assigned[members] = True
+            groups[name] = [(usable[j], int(distances[j])) for j in members]
+    return groups
+
+def find_duplicates(folder, images, mode, fingerprints):
+    """
+    Group duplicate photos.
+
+    Returns:
+        (representatives, groups): the photos to analyze (in input order) and
+        {representative: {'sha256', 'members': [{'file', 'kind': 'exact'|'near',
+        'distance', 'sha256'}]}} for every representative that has duplicates.
+    """
+    if mode == "off":
+        return list(images), {}
+
+    near = mode == "near"
+    prints = {}
+    for filename in images:
+        try:
+            prints[filename] = fingerprints.get(os.path.join(folder, filename), near)
+        except OSError as e:
+            print(f"[WARN] Failed to fingerprint {filename}: {e}")
+
+    # Exact groups: the first photo (by name) with given bytes represents the others
+    by_sha = {}
+    for filename in sorted(prints):
+        by_sha.setdefault(prints[filename]["sha256"], []).append(filename)
+    groups = {}
+    for sha, names in by_sha.items():
+        if len(names) > 1:
+            groups[names[0]] = {"sha256": sha, "members": [
+                {"file": n, "kind": "exact", "distance": 0, "sha256": sha} for n in names[1:]
+            ]}
+
+    if near:
+        exact_reps = [names[0] for names in by_sha.values()]
+        for leader, near_members in _near_leaders(folder, exact_reps, prints).items():
+            group = groups.setdefault(leader, {"sha256": prints[leader]["sha256"], "members": []})
+            for name, distance in near_members:
+                sha = prints[name]["sha256"]
+                group["members"].append({"file": name, "kind": "near", "distance": distance, "sha256": sha})
+                # Exact copies of a near member follow it into the leader's group
+                for exact in groups.pop(name, {"members": []})["members"]:
+                    group["members"].append(dict(exact, kind="near", distance=distance))
+
+    members = {m["file"] for group in groups.values() for m in group["members"]}
+    representatives = [f for f in images if f not in members]
+    return representatives, groups
+
+def save_duplicate_groups(path, fingerprints, mode, groups, decisions):
+    """Write the fingerprint cache and this run's groups with the decision fanned out to each."""
+    data = {
+        "version": DUPLICATES_VERSION,
+        "mode": mode,
+        "groups": [
+            {"representative": rep, "sha256": group["sha256"], "persons": decisions.get(rep, []),
+             "members": group["members"]}
+            for rep, group in sorted(groups.items())
+        ],
+        "files": fingerprints.entries,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
@@ -0,0 +1,168 @@
+"""
+Compact, memory-mappable embedding store (replaces the pickled embeddings.pkl).
+
+File layout (little-endian):
+
+    [64-byte header][JSON name/offset table][padding][embedding matrix]
+
+The header holds the magic, format version, dtype, row count, dimension and
+the byte offsets of the table and the matrix. The table lists every enrolled
+person with the offset and count of their rows. The matrix is a contiguous
+(rows, dim) block of L2-normalized float32 (or float16) embeddings, grouped
+by person, aligned so it can be opened with ``np.memmap`` directly. Workers
+that open the same file share one copy of its pages through the OS page
+cache, and nothing is unpickled.
+
+Convert a legacy pickle once with:
+
+    python src/embedding_store.py --convert Data/embeddings.pkl Data/embeddings.fsdb
+"""
+
+import os
+import json
+import struct
+import argparse
+import numpy as np
+
+from gallery import Gallery
+from ann_index import matrix_fingerprint
+
+STORE_MAGIC = b"FSDB"
+STORE_VERSION = 1
+HEADER_FORMAT = "<4sHHQIIQQQ"
+HEADER_SIZE = 64
+DATA_ALIGNMENT = 64
+
+DTYPE_CODES = {"float32": 0, "float16": 1}
+CODE_DTYPES = {code: name for name, code in DTYPE_CODES.items()}
+
+def _align(offset, alignment=DATA_ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+def write_store(path, gallery, dtype="float32"):
+    """Atomically write a Gallery (names + normalized matrix) to ``path``."""
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported store dtype: {dtype} (expected one of {sorted(DTYPE_CODES)})")
+
+    matrix = np.ascontiguousarray(gallery.matrix, dtype=dtype)
+    num_rows, dim = matrix.shape
+    counts = np.bincount(gallery.row_person, minlength=len(gallery.names)) if num_rows else np.zeros(len(gallery.names), dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+
+    table = json.dumps({
+        "names": gallery.names,
+        "offsets": [int(v) for v in offsets],
+        "counts": [int(v) for v in counts],
+        # Fingerprint of the matrix as readers will see it (float16 rows are widened to float32)
+        "fingerprint": matrix_fingerprint(matrix.astype(np.float32)),
+    }, ensure_ascii=False).encode("utf-8")
+
+    table_offset = HEADER_SIZE
+    data_offset = _align(table_offset + len(table))
+    header = struct.pack(HEADER_FORMAT, STORE_MAGIC, STORE_VERSION, DTYPE_CODES[dtype],
+                         num_rows, dim, 0, table_offset, len(table), data_offset)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(table)
+        f.write(b"\0" * (data_offset - table_offset - len(table)))
+        f.write(matrix.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_header(f):
+    raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError("Embedding store is truncated")
+    magic, version, dtype_code, num_rows, dim, _, table_offset, table_len, data_offset = \
+        struct.unpack(HEADER_FORMAT, raw[:struct.calcsize(HEADER_FORMAT)])
+    if magic != STORE_MAGIC:
+        raise ValueError("Not an embedding store (bad magic)")
+    if version != STORE_VERSION:
+        raise ValueError(f"Unsupported embedding store version {version}")
+    if dtype_code not in CODE_DTYPES:
+        raise ValueError(f"Unknown dtype code {dtype_code} in embedding store")
+    return {
+        "dtype": CODE_DTYPES[dtype_code],
+        "rows": num_rows,
+        "dim": dim,
+        "table_offset": table_offset,
+        "table_len": table_len,
+        "data_offset": data_offset,
+    }
+
+def store_dtype(path):
+    with open(path, "rb") as f:
+        return read_header(f)["dtype"]
+
+def open_store(path):
+    """
+    Open an embedding store without copying the matrix.
+
+    Returns:
+        (table, matrix) where ``matrix`` is a read-only ``np.memmap`` of shape (rows, dim).
+    """
+    with open(path, "rb") as f:
+        header = read_header(f)
+        f.seek(header["table_offset"])
+        table = json.loads(f.read(header["table_len"]).decode("utf-8"))
+
+    shape = (header["rows"], header["dim"])
+    if header["rows"] == 0:
+        matrix = np.zeros(shape, dtype=header["dtype"])
+    else:
+        matrix = np.memmap(path, dtype=header["dtype"], mode="r", offset=header["data_offset"], shape=shape)
+    return table, matrix
+
+def load_store_gallery(path):
+    """Build a Gallery on top of the memory-mapped store (zero-copy for float32 stores)."""
+    table, matrix = open_store(path)
+    row_person = np.repeat(np.arange(len(table["names"]), dtype=np.int32), table["counts"])
+    # float16 stores are widened once here; float32 rows stay backed by the mapped file
+    gallery = Gallery(table["names"], matrix, row_person)
+    gallery.fingerprint = table["fingerprint"]
+    return gallery
+
+def store_to_db(path):
+    """Read a store back into the ``{name: [embedding, ...]}`` dict enroll.py edits."""
+    table, matrix = open_store(path)
+    embeddings_db = {}
+    for name, offset, count in zip(table["names"], table["offsets"], table["counts"]):
+        embeddings_db[name] = [np.array(row, dtype=np.float32) for row in matrix[offset:offset + count]]
+    return embeddings_db
+
+def load_legacy_pickle(pkl_path):
+    # Legacy format only: pickle can execute code, never point this at untrusted files
+    import pickle
+    with open(pkl_path, "rb") as f:
+        return pickle.load(f)
+
+def convert_legacy_pickle(pkl_path, store_path, dtype="float32"):
+    embeddings_db = load_legacy_pickle(pkl_path)
+    gallery = Gallery.from_db(embeddings_db)
+    write_store(store_path, gallery, dtype=dtype)
+    print(f"[OK] Converted {pkl_path} -> {store_path} ({len(gallery.names)} people, {len(gallery)} embeddings, {dtype})")
+    return gallery
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding store utilities")
+    parser.add_argument("--convert", nargs=2, metavar=("PICKLE", "STORE"), help="Convert a legacy embeddings.pkl")
+    parser.add_argument("--info", metavar="STORE", help="Print the header and table summary of a store")
+    parser.add_argument("--float16", action="store_true", help="Store embeddings as float16 (half the size)")
+    args = parser.parse_args()
+
+    if args.convert:
+        convert_legacy_pickle(args.convert[0], args.convert[1], dtype="float16" if args.float16 else "float32")
+    elif args.info:
+        with open(args.info, "rb") as f:
+            header = read_header(f)
+        table, _ = open_store(args.info)
+        print(f"[INFO] {args.info}: version {STORE_VERSION}, {header['rows']} x {header['dim']} {header['dtype']}, "
+              f"{len(table['names'])} people, data offset {header['data_offset']}")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
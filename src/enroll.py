@@ -1,14 +1,43 @@
+"""
+Enrollment of known people into the embeddings database.
+
+Data/known_people holds either one photo per person (``Alice.jpg``) or a
+subfolder of several reference photos per person (``Alice/1.jpg``, ...). A
+person with a single photo is stored as before: its embedding and that of
+the mirrored photo. A person with several photos gets a fixed-size template
+instead of one row per photo: the quality-weighted mean of all photos plus up
+to ``TEMPLATE_EXEMPLARS`` medoid exemplars that cover the remaining variation
+(pose, glasses, lighting), so gallery size and matching cost do not grow
+with the number of reference photos. Per-photo embeddings are kept in
+``Data/enroll_photos.npz``, so adding one photo to a person does not re-embed
+the others.
+"""
+
 import os
-import pickle
+import json
+import hashlib
+import argparse
 import numpy as np
-import cv2
-import insightface
+
+from gallery import Gallery
+from face_models import add_runtime_arguments, configure_runtime, model_variant, runtime_from_args
+from ann_index import ANN_MIN_GALLERY_SIZE, IVFIndex
+from embedding_store import write_store, load_store_gallery, store_to_db, store_dtype, load_legacy_pickle
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 KNOWN_DIR = os.path.join(BASE_DIR, "Data", "known_people")
-OUTPUT = os.path.join(BASE_DIR, "Data", "embeddings.pkl")
+OUTPUT = os.path.join(BASE_DIR, "Data", "embeddings.fsdb")
+LEGACY_OUTPUT = os.path.join(BASE_DIR, "Data", "embeddings.pkl")
+ANN_INDEX_OUTPUT = os.path.join(BASE_DIR, "Data", "embeddings_ivf.npz")
+MANIFEST_PATH = os.path.join(BASE_DIR, "Data", "enroll_manifest.json")
+PHOTO_CACHE_PATH = os.path.join(BASE_DIR, "Data", "enroll_photos.npz")
 
-def get_largest_face_embedding(app, img):
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MANIFEST_VERSION = 1
+TEMPLATE_EXEMPLARS = 3  # medoid rows per multi-photo person, next to the mean
+QUALITY_FULL_FACE_PX = 112  # faces this size or larger (short side) get full weight
+
+def get_largest_face(app, img):
     if img is None:
         print("[ERROR] Image is None before detection.")
         return None
@@ -16,65 +45,343 @@ def get_largest_face_embedding(app, img):
     faces = app.get(img)
     if not faces:
         return None
-    
-    largest_face = max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
-    return largest_face.embedding
 
-def enroll_known_people():
-    print("[INFO] Initializing InsightFace model (buffalo_l) on GPU...")
+    return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+
+def get_largest_face_embedding(app, img):
+    face = get_largest_face(app, img)
+    return None if face is None else face.embedding
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype=np.float64).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if np.isfinite(norm) and norm > 0 else None
+
+def greedy_medoids(vectors, k):
+    """
+    Indices of ``k`` exemplars among unit ``vectors`` (greedy k-medoids build step):
+    the medoid first, then each time the vector that most reduces the summed
+    cosine distance of all vectors to their nearest exemplar.
+    """
+    distances = 1.0 - vectors @ vectors.T
+    chosen = [int(np.argmin(distances.sum(axis=1)))]
+    nearest = distances[chosen[0]].copy()
+    while len(chosen) < min(k, len(vectors)):
+        gains = np.maximum(nearest[None, :] - distances, 0.0).sum(axis=1)
+        gains[chosen] = -1.0
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            break  # the rest are duplicates of chosen exemplars
+        chosen.append(best)
+        nearest = np.minimum(nearest, distances[best])
+    return chosen
+
+def build_template(photos, exemplars=TEMPLATE_EXEMPLARS):
+    """
+    Gallery rows for one person from [{'embedding', 'flipped', 'quality'}] of their photos.
+
+    One photo: [original, flipped], as single-photo enrollment always stored.
+    Several: [quality-weighted mean] + up to ``exemplars`` medoids, each photo
+    represented by the normalized sum of its original and flipped embeddings.
+    """
+    if len(photos) == 1:
+        return [photos[0]["embedding"], photos[0]["flipped"]]
+
+    vectors, weights = [], []
+    for photo in photos:
+        original, flipped = _unit(photo["embedding"]), _unit(photo["flipped"])
+        combined = _unit(original + flipped) if original is not None and flipped is not None else original
+        if combined is not None:
+            vectors.append(combined)
+            weights.append(max(float(photo["quality"]), 1e-3))
+    if not vectors:
+        return []
+    vectors = np.stack(vectors)
+    mean = _unit(np.average(vectors, axis=0, weights=weights))
+    rows = [mean] if mean is not None else []
+    if exemplars > 0:
+        rows.extend(vectors[i] for i in greedy_medoids(vectors, exemplars))
+    return [row.astype(np.float32) for row in rows]
+
+def build_ann_index(gallery):
+    if len(gallery) < ANN_MIN_GALLERY_SIZE:
+        # Small galleries are matched exactly; drop any index left from a larger enrollment
+        if os.path.exists(ANN_INDEX_OUTPUT):
+            os.remove(ANN_INDEX_OUTPUT)
+        return
+
+    print(f"[INFO] Building IVF index for {len(gallery)} embeddings...")
+    index = IVFIndex.build(gallery.matrix, fingerprint=gallery.fingerprint)
+    index.save(ANN_INDEX_OUTPUT)
+    print(f"[SAVED] ANN index file: {ANN_INDEX_OUTPUT} ({index.n_lists} lists)")
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_atomic(path, data):
+    # Write next to the target and rename, so readers never see a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def load_photo_cache():
+    """
+    Per-photo embeddings of earlier runs: {relpath: {'sha256', 'embedding', 'flipped', 'quality'} or no face}.
+    Empty when they were computed with other model settings (see face_models.model_variant).
+    """
+    try:
+        with np.load(PHOTO_CACHE_PATH, allow_pickle=False) as data:
+            if "variant" not in data or str(data["variant"]) != model_variant():
+                return {}
+            return {
+                str(key): {"sha256": str(sha), "embedding": emb if found else None, "flipped": flip, "quality": float(q)}
+                for key, sha, found, emb, flip, q in zip(data["keys"], data["sha256"], data["found"],
+                                                          data["embedding"], data["flipped"], data["quality"])
+            }
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def save_photo_cache(cache):
+    found = [entry["embedding"] for entry in cache.values() if entry["embedding"] is not None]
+    dim = len(found[0]) if found else 0
+    keys = sorted(k for k, entry in cache.items() if entry["embedding"] is None or len(entry["embedding"]) == dim)
+
+    def column(field):
+        vectors = [np.asarray(cache[k][field], dtype=np.float32).ravel() if cache[k]["embedding"] is not None
+                   else np.zeros(dim, dtype=np.float32) for k in keys]
+        return np.stack(vectors) if vectors else np.zeros((0, dim), dtype=np.float32)
+
+    tmp_path = PHOTO_CACHE_PATH + ".tmp.npz"
+    np.savez(tmp_path, variant=np.array(model_variant()), keys=np.array(keys, dtype=str), sha256=np.array([cache[k]["sha256"] for k in keys], dtype=str),
+             found=np.array([cache[k]["embedding"] is not None for k in keys], dtype=bool),
+             embedding=column("embedding"), flipped=column("flipped"),
+             quality=np.array([cache[k]["quality"] for k in keys], dtype=np.float32))
+    os.replace(tmp_path, PHOTO_CACHE_PATH)
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    if not os.path.exists(OUTPUT) and not os.path.exists(LEGACY_OUTPUT):
+        return {}
     try:
-        app = insightface.app.FaceAnalysis(
-            name='buffalo_l',
-            providers=['CUDAExecutionProvider'],
-            ctx_id=0
-        )
-        app.prepare(ctx_id=0, det_size=(320, 320))
-        print("[OK] InsightFace model loaded successfully on GPU (providers=['CUDAExecutionProvider'], det_size=(320, 320)).")
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            print("[WARN] Enrollment manifest has an unknown version; re-enrolling everything.")
+            return {}
+        if manifest.get("variant") != model_variant():
+            # INT8 models or other session options give other embeddings than the enrolled ones
+            print(f"[WARN] Enrolled with other model settings ({manifest.get('variant', 'unknown')}, "
+                  f"now {model_variant()}); re-enrolling everything.")
+            return {}
+        return manifest.get("files", {})
     except Exception as e:
-        print(f"[ERROR] Failed to initialize InsightFace on GPU: {e}")
-        print("[INFO] Falling back to CPU with same det_size (320, 320)...")
-        try:
-            app = insightface.app.FaceAnalysis(name='buffalo_l')
-            app.prepare(ctx_id=-1, det_size=(320, 320))
-            print("[OK] InsightFace model loaded on CPU (fallback, det_size=(320, 320)).")
-        except Exception as fallback_err:
-            print(f"[ERROR] Failed to initialize InsightFace on CPU (fallback): {fallback_err}")
-            return
-
-    embeddings_db = {}
-
-    print("[INFO] Starting enrollment...")
-    for filename in os.listdir(KNOWN_DIR):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            person_name = os.path.splitext(filename)[0]
-            img_path = os.path.join(KNOWN_DIR, filename)
-
-            print(f"[INFO] Processing: {person_name}")
-
-            img = cv2.imread(img_path)
-            if img is None:
-                print(f"[ERROR] Unable to read image from disk: {img_path}")
-                continue
-
-            embedding = get_largest_face_embedding(app, img)
-            if embedding is None:
-                print(f"[SKIP] No face detected in {filename}")
-                continue
-
-            flipped_img = cv2.flip(img, 1)
-            flipped_embedding = get_largest_face_embedding(app, flipped_img)
-            if flipped_embedding is None:
-                print(f"[SKIP] No face detected in flipped version of {filename}")
-                flipped_embedding = embedding
-
-            embeddings_db[person_name] = [embedding, flipped_embedding]
+        print(f"[WARN] Failed to read enrollment manifest ({e}); re-enrolling everything.")
+        return {}
+
+def save_manifest(entries):
+    manifest = {"version": MANIFEST_VERSION, "variant": model_variant(), "files": entries}
+    write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=1).encode("utf-8"))
+
+def load_existing_db():
+    """The enrolled database, or None if it is missing or unreadable (everyone must be re-enrolled)."""
+    try:
+        if os.path.exists(OUTPUT):
+            return store_to_db(OUTPUT)
+        if os.path.exists(LEGACY_OUTPUT):
+            # Databases written before the embedding store; migrated on this run
+            return load_legacy_pickle(LEGACY_OUTPUT)
+        print("[WARN] No existing database; re-enrolling everything.")
+        return None
+    except Exception as e:
+        print(f"[WARN] Failed to read existing database ({e}); re-enrolling everything.")
+        return None
+
+def list_known_photos():
+    """[(relative path, person)] of every reference photo: top-level files and one level of person subfolders."""
+    photos = []
+    for name in sorted(os.listdir(KNOWN_DIR)):
+        path = os.path.join(KNOWN_DIR, name)
+        if os.path.isdir(path):
+            photos.extend((f"{name}/{filename}", name) for filename in sorted(os.listdir(path))
+                          if filename.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(path, filename)))
+        elif name.lower().endswith(IMAGE_EXTENSIONS):
+            photos.append((name, os.path.splitext(name)[0]))
+    return photos
+
+def scan_known_people(manifest):
+    """
+    Compare the known_people folder with the manifest.
+
+    A file is unchanged when its size and mtime match the manifest entry, or
+    when only the mtime moved but the content hash is the same.
+
+    Returns:
+        (entries, changed, removed): manifest entries for every current file,
+        filenames that need (re-)embedding and manifest filenames that are gone.
+        Photos in a subfolder are keyed "Person/photo.jpg" and belong to "Person".
+    """
+    entries = {}
+    changed = []
+
+    for filename, person in list_known_photos():
+        img_path = os.path.join(KNOWN_DIR, filename)
+        st = os.stat(img_path)
+        previous = manifest.get(filename)
+
+        if previous and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns:
+            entries[filename] = previous
+            continue
+
+        sha256 = file_sha256(img_path)
+        entry = {
+            "person": person,
+            "sha256": sha256,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "status": None,
+        }
+        if previous and previous["sha256"] == sha256:
+            entry["status"] = previous["status"]
+            entries[filename] = entry
+            continue
+
+        entries[filename] = entry
+        changed.append(filename)
+
+    removed = [filename for filename in manifest if filename not in entries]
+    return entries, changed, removed
+
+def load_enrollment_model():
+    from face_models import load_face_analysis
+
+    print("[INFO] Initializing InsightFace model (buffalo_l, detection + recognition)...")
+    try:
+        return load_face_analysis(det_size=(320, 320))
+    except Exception:
+        return None
+
+def embed_known_photo(app, filename):
+    """Return {'embedding', 'flipped', 'quality'} for one reference photo, or None."""
+    import cv2
+
+    img_path = os.path.join(KNOWN_DIR, filename)
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"[ERROR] Unable to read image from disk: {img_path}")
+        return None
+
+    face = get_largest_face(app, img)
+    if face is None:
+        print(f"[SKIP] No face detected in {filename}")
+        return None
+
+    flipped_img = cv2.flip(img, 1)
+    flipped_embedding = get_largest_face_embedding(app, flipped_img)
+    if flipped_embedding is None:
+        print(f"[SKIP] No face detected in flipped version of {filename}")
+        flipped_embedding = face.embedding
+
+    # Sharp, large faces count more in a multi-photo template
+    short_side = min(face.bbox[2] - face.bbox[0], face.bbox[3] - face.bbox[1])
+    quality = float(face.det_score) * float(np.clip(short_side / QUALITY_FULL_FACE_PX, 0.25, 1.0))
+    return {"embedding": face.embedding, "flipped": flipped_embedding, "quality": quality}
+
+def enroll_known_people(full=False, dtype="float32", load_model=load_enrollment_model):
+    """
+    Bring the embeddings database in line with Data/known_people.
+
+    Args:
+        load_model: Returns a FaceAnalysis-like model (or None if it cannot be loaded);
+            only called when some photo needs embedding
+    Returns:
+        False if the model could not be loaded, True otherwise.
+    """
+    manifest = {} if full else load_manifest()
+    embeddings_db = load_existing_db() if manifest else {}
+    if embeddings_db is None:
+        # The manifest describes a database we no longer have, so every photo counts as new
+        manifest, embeddings_db = {}, {}
+    photo_cache = {} if full else load_photo_cache()
+
+    entries, changed, removed = scan_known_people(manifest)
+
+    # People who lost a reference photo or have a new/changed one get their rows rebuilt
+    dropped = {manifest[filename]["person"] for filename in removed}
+    dropped.update(entries[filename]["person"] for filename in changed)
+    for person_name in dropped:
+        embeddings_db.pop(person_name, None)
+    for filename in removed:
+        print(f"[INFO] Removed: {manifest[filename]['person']} ({filename} no longer in known_people)")
+
+    if not changed and not removed and os.path.exists(OUTPUT) and store_dtype(OUTPUT) == dtype:
+        if entries != manifest:
+            # Only mtimes moved (e.g. files touched or copied); remember them to skip hashing next time
+            save_manifest(entries)
+        print(f"[OK] Enrollment is up to date ({len(embeddings_db)} people, no new or changed photos).")
+        return True
+
+    print(f"[INFO] Enrollment changes: {len(changed)} new/changed photos, {len(removed)} removed")
+
+    # Every photo of a rebuilt person is needed; unchanged ones usually come from the photo cache
+    photos_of = {}
+    for filename, entry in entries.items():
+        photos_of.setdefault(entry["person"], []).append(filename)
+    rebuild = sorted(person for person in dropped if person in photos_of)
+    to_embed = [filename for person in rebuild for filename in photos_of[person]
+                if photo_cache.get(filename, {}).get("sha256") != entries[filename]["sha256"]]
+
+    if to_embed:
+        app = load_model()
+        if app is None:
+            return False
+
+        print("[INFO] Starting enrollment...")
+        for filename in to_embed:
+            print(f"[INFO] Processing: {filename}")
+            photo = embed_known_photo(app, filename) or {"embedding": None, "flipped": None, "quality": 0.0}
+            photo_cache[filename] = dict(photo, sha256=entries[filename]["sha256"])
+
+    for person_name in rebuild:
+        photos = []
+        for filename in photos_of[person_name]:
+            photo = photo_cache[filename]
+            entries[filename]["status"] = "enrolled" if photo["embedding"] is not None else "no_face"
+            if photo["embedding"] is not None:
+                photos.append(photo)
+        rows = build_template(photos) if photos else []
+        if not rows:
+            continue
+        embeddings_db[person_name] = rows
+        if len(photos) == 1:
             print(f"[OK] Saved embeddings (original + flipped) for {person_name}")
+        else:
+            print(f"[OK] Saved template for {person_name}: {len(photos)} photos -> {len(rows)} rows (mean + exemplars)")
 
-    with open(OUTPUT, "wb") as f:
-        pickle.dump(embeddings_db, f)
+    # Database first, then manifest: a crash in between only causes re-embedding next run
+    write_store(OUTPUT, Gallery.from_db(embeddings_db), dtype=dtype)
+    save_photo_cache({filename: photo for filename, photo in photo_cache.items() if filename in entries})
+    save_manifest(entries)
 
     print("[DONE] Enrollment completed!")
     print(f"[SAVED] Database file: {OUTPUT}")
 
+    build_ann_index(load_store_gallery(OUTPUT))
+    return True
+
 if __name__ == "__main__":
-    enroll_known_people()
+    parser = argparse.ArgumentParser(description="Enroll known people into the embeddings database")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-embed every photo")
+    parser.add_argument("--float16", action="store_true", help="Store embeddings as float16 (half the size on disk)")
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    configure_runtime(runtime_from_args(args))
+    if not enroll_known_people(full=args.full, dtype="float16" if args.float16 else "float32"):
+        raise SystemExit(1)
@@ -0,0 +1,109 @@
+"""
+Columnar cache of every detected face, written by ``process_photos.py --save-faces``.
+
+One ``.npz`` file holds flat arrays instead of per-image records:
+
+    image_name, image_status, image_engine      one entry per photo
+    face_image                                  index into image_* for every face
+    face_bbox (F, 4), face_det_score (F,)
+    face_embedding (F, D)                       raw recognition embeddings
+    rescue_state (F,)                           0 = not rescued, 1 = rescue failed, 2 = restored
+    rescue_det_score (F,), rescue_row (F,)      row in rescue_embedding, -1 when not restored
+    rescue_embedding (R, D)
+
+resort.py reads these arrays to re-decide and re-place every photo with new
+thresholds without loading a model.
+"""
+
+import os
+import numpy as np
+
+FACE_CACHE_VERSION = 1
+
+RESCUE_NONE = 0
+RESCUE_FAILED = 1
+RESCUE_RESTORED = 2
+
+class FaceCacheWriter:
+    """Collects analysis results in placement order and writes them as columns."""
+
+    def __init__(self):
+        self.image_name = []
+        self.image_status = []
+        self.image_engine = []
+        self.face_image = []
+        self.face_bbox = []
+        self.face_det_score = []
+        self.face_embedding = []
+        self.rescue_state = []
+        self.rescue_det_score = []
+        self.rescue_row = []
+        self.rescue_embedding = []
+
+    def add(self, filename, result):
+        # Errors are transient (the photo is retried on the next run), so they are not cached
+        if result['status'] == 'error':
+            return
+        image_idx = len(self.image_name)
+        self.image_name.append(filename)
+        self.image_status.append(result['status'])
+        self.image_engine.append(result.get('engine') or "")
+
+        for face in result['faces']:
+            self.face_image.append(image_idx)
+            self.face_bbox.append(face['bbox'])
+            self.face_det_score.append(face['det_score'])
+            self.face_embedding.append(np.asarray(face['embedding'], dtype=np.float32).ravel())
+
+            rescue = face['rescue']
+            if rescue is None:
+                self.rescue_state.append(RESCUE_NONE)
+                self.rescue_det_score.append(np.nan)
+                self.rescue_row.append(-1)
+            elif rescue['embedding'] is None:
+                self.rescue_state.append(RESCUE_FAILED)
+                self.rescue_det_score.append(np.nan)
+                self.rescue_row.append(-1)
+            else:
+                self.rescue_state.append(RESCUE_RESTORED)
+                self.rescue_det_score.append(rescue['det_score'])
+                self.rescue_row.append(len(self.rescue_embedding))
+                self.rescue_embedding.append(np.asarray(rescue['embedding'], dtype=np.float32).ravel())
+
+    def __len__(self):
+        return len(self.image_name)
+
+    def save(self, path):
+        """Atomically write the collected columns to ``path`` (an .npz file)."""
+        dim = self.face_embedding[0].size if self.face_embedding else 0
+
+        def stack(rows):
+            return np.stack(rows).astype(np.float32) if rows else np.zeros((0, dim), dtype=np.float32)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.int32(FACE_CACHE_VERSION),
+                image_name=np.array(self.image_name, dtype=str),
+                image_status=np.array(self.image_status, dtype=str),
+                image_engine=np.array(self.image_engine, dtype=str),
+                face_image=np.array(self.face_image, dtype=np.int32),
+                face_bbox=np.array(self.face_bbox, dtype=np.float32).reshape(-1, 4),
+                face_det_score=np.array(self.face_det_score, dtype=np.float32),
+                face_embedding=stack(self.face_embedding),
+                rescue_state=np.array(self.rescue_state, dtype=np.int8),
+                rescue_det_score=np.array(self.rescue_det_score, dtype=np.float32),
+                rescue_row=np.array(self.rescue_row, dtype=np.int32),
+                rescue_embedding=stack(self.rescue_embedding),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+def load_face_cache(path):
+    """Load a face cache into a dict of arrays."""
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["version"]) != FACE_CACHE_VERSION:
+            raise ValueError(f"Unsupported face cache version {int(data['version'])} in {path}")
+        return {key: data[key] for key in data.files}
@@ -0,0 +1,420 @@
+"""
+Models used by the sorting pipeline, loaded lazily.
+
+Both engines share one ``FaceAnalysis('buffalo_l')``: the detector and the
+recognizer are loaded once, and each engine only picks
+the detector input size it passes to ``det_model.detect`` on every call
+(320x320 for low-res photos, 640x640 for HD/4K). The buffalo_l detector has
+dynamic input dimensions, so no second session is needed. Only the detection
+and recognition heads are loaded; the landmark and gender/age heads of
+buffalo_l are never used by the pipeline.
+
+``get_batch`` runs several photos through one engine with batched ONNX
+calls: every aligned face crop of the batch is embedded in one recognizer
+call, and when the detector was exported with a dynamic batch dimension the
+letterboxed detector inputs are stacked into one session run as well (the
+stock buffalo_l detector has a fixed batch of 1, so detection stays per photo
+there). Pre- and post-processing are insightface's own, so faces and
+embeddings are those of ``get`` (up to float rounding of the batched run).
+
+ONNX Runtime sessions use the library defaults unless ``configure_runtime``
+(the ``--intra-op-threads``, ``--inter-op-threads``, ``--graph-opt``,
+``--no-cpu-arena``, ``--no-mem-pattern`` and ``--int8`` flags of the
+command-line tools) asks for something else; the loaded sessions are then
+rebuilt with those options. With ``--int8`` on a CPU session, the detector
+and recognizer run from dynamically quantized copies in Data/models/int8/,
+generated on first use and again whenever the FP32 file changes.
+
+insightface and gfpgan are imported inside the loaders, and GFPGAN is wrapped
+in a LazyModel so it is only loaded when the first doubt-zone face needs it.
+"""
+
+import os
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INT8_MODELS_DIR = os.path.join(BASE_DIR, "Data", "models", "int8")
+
+SMALL_DET_SIZE = (320, 320)
+HD_DET_SIZE = (640, 640)
+ANALYSIS_MODULES = ['detection', 'recognition']
+
+REC_MAX_BATCH = 128  # face crops per recognizer call
+
+GRAPH_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+DEFAULT_RUNTIME = {
+    'intra_op_threads': 0,  # 0 = ONNX Runtime default (one thread per physical core)
+    'inter_op_threads': 0,
+    'graph_optimization': 'all',
+    'cpu_mem_arena': True,
+    'mem_pattern': True,
+    'int8': False,
+}
+_runtime = dict(DEFAULT_RUNTIME)
+
+GFPGAN_MODEL_URL = 'https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.3.pth'
+
+def load_face_analysis(det_size=HD_DET_SIZE, allowed_modules=ANALYSIS_MODULES):
+    """Load buffalo_l on GPU, falling back to CPU. Raises if neither works."""
+    import insightface
+
+    try:
+        app = insightface.app.FaceAnalysis(
+            name='buffalo_l',
+            allowed_modules=allowed_modules,
+            providers=['CUDAExecutionProvider'],
+            ctx_id=0
+        )
+        app.prepare(ctx_id=0, det_size=det_size)
+        print(f"[OK] InsightFace (buffalo_l) loaded on GPU (det_size={det_size}).")
+    except Exception as e:
+        print(f"[WARN] Failed to initialize InsightFace on GPU: {e}")
+        print("[INFO] Falling back to CPU...")
+        try:
+            app = insightface.app.FaceAnalysis(name='buffalo_l', allowed_modules=allowed_modules)
+            app.prepare(ctx_id=-1, det_size=det_size)
+            print(f"[OK] InsightFace (buffalo_l) loaded on CPU (fallback, det_size={det_size}).")
+        except Exception as fallback_err:
+            print(f"[ERROR] Failed to initialize InsightFace on CPU: {fallback_err}")
+            raise
+    apply_runtime(app)
+    return app
+
+def configure_runtime(settings=None, **overrides):
+    """Set the ONNX Runtime options (keys of DEFAULT_RUNTIME) used by every later load_face_analysis."""
+    _runtime.clear()
+    _runtime.update(DEFAULT_RUNTIME, **(settings or {}), **overrides)
+
+def runtime_settings():
+    return dict(_runtime)
+
+def model_variant(settings=None):
+    """
+    Tag of the settings that change model outputs: the model set, graph
+    optimization and thread counts (which change float reduction order).
+    Memory arena options do not and are left out.
+    """
+    settings = _runtime if settings is None else settings
+    return (f"{'int8' if settings['int8'] else 'fp32'}-opt:{settings['graph_optimization']}"
+            f"-threads:{settings['intra_op_threads']}/{settings['inter_op_threads']}")
+
+def describe_runtime(settings):
+    return (f"intra-op threads {settings['intra_op_threads'] or 'default'}, "
+            f"inter-op threads {settings['inter_op_threads'] or 'default'}, "
+            f"graph optimization {settings['graph_optimization']}, "
+            f"CPU arena {'on' if settings['cpu_mem_arena'] else 'off'}, "
+            f"memory pattern {'on' if settings['mem_pattern'] else 'off'}, {'INT8' if settings['int8'] else 'FP32'}")
+
+def session_options(settings):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if settings['intra_op_threads'] > 0:
+        options.intra_op_num_threads = settings['intra_op_threads']
+    if settings['inter_op_threads'] > 0:
+        options.inter_op_num_threads = settings['inter_op_threads']
+        if settings['inter_op_threads'] > 1:
+            # Inter-op threads are only used by the parallel executor
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    options.graph_optimization_level = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[settings['graph_optimization']]
+    options.enable_cpu_mem_arena = settings['cpu_mem_arena']
+    options.enable_mem_pattern = settings['mem_pattern']
+    return options
+
+def quantized_model_path(model_file):
+    """
+    Path of the dynamically quantized (INT8 weights) copy of an ONNX model,
+    generated in Data/models/int8/ when missing or older than ``model_file``.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    pack = os.path.basename(os.path.dirname(os.path.abspath(model_file)))
+    stem = os.path.splitext(os.path.basename(model_file))[0]
+    target = os.path.join(INT8_MODELS_DIR, f"{pack}_{stem}.int8.onnx")
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(model_file):
+        return target
+    os.makedirs(INT8_MODELS_DIR, exist_ok=True)
+    print(f"[INFO] Quantizing {pack}/{os.path.basename(model_file)} to INT8 (one-time)...")
+    tmp_path = target + ".tmp"
+    # ConvInteger on the CPU provider only takes unsigned 8-bit weights
+    quantize_dynamic(model_file, tmp_path, weight_type=QuantType.QUInt8)
+    os.replace(tmp_path, target)
+    print(f"[SAVED] {target}")
+    return target
+
+def apply_runtime(app, settings=None):
+    """
+    Rebuild the ONNX sessions of a loaded FaceAnalysis with the configured
+    options (no-op for the defaults). INT8 is only used for CPU sessions; a
+    model that cannot be quantized or loaded as INT8 stays FP32.
+    """
+    settings = _runtime if settings is None else settings
+    if settings == DEFAULT_RUNTIME:
+        return
+    import onnxruntime as ort
+
+    options = session_options(settings)
+    rebuilt = []
+    for taskname, model in app.models.items():
+        session = getattr(model, 'session', None)
+        if session is None:
+            continue
+        providers = session.get_providers()
+        path = model.model_file
+        if settings['int8']:
+            if providers[0] != 'CPUExecutionProvider':
+                print(f"[WARN] {taskname}: INT8 models are meant for CPU nodes; keeping FP32 on {providers[0]}.")
+            else:
+                try:
+                    path = quantized_model_path(model.model_file)
+                except Exception as e:
+                    print(f"[WARN] {taskname}: INT8 quantization failed ({e}); keeping FP32.")
+        try:
+            model.session = ort.InferenceSession(path, sess_options=options, providers=providers)
+        except Exception as e:
+            if path == model.model_file:
+                raise
+            print(f"[WARN] {taskname}: INT8 model could not be loaded ({e}); keeping FP32.")
+            model.session = ort.InferenceSession(model.model_file, sess_options=options, providers=providers)
+        rebuilt.append(taskname)
+    if rebuilt:
+        print(f"[OK] ONNX Runtime sessions ({', '.join(rebuilt)}): {describe_runtime(settings)}.")
+
+def add_runtime_arguments(parser):
+    """The ONNX Runtime flags shared by the command-line tools; read them back with runtime_from_args."""
+    group = parser.add_argument_group("ONNX Runtime")
+    group.add_argument("--intra-op-threads", type=int, default=0,
+                       help="Threads used inside one operator (0 = ONNX Runtime default)")
+    group.add_argument("--inter-op-threads", type=int, default=0,
+                       help="Operators run concurrently (0 = default; above 1 switches to the parallel executor)")
+    group.add_argument("--graph-opt", choices=GRAPH_OPTIMIZATION_LEVELS, default="all",
+                       help="Graph optimization level of the sessions")
+    group.add_argument("--no-cpu-arena", action="store_true",
+                       help="Disable the CPU memory arena (lower resident memory, more allocations)")
+    group.add_argument("--no-mem-pattern", action="store_true",
+                       help="Disable memory pattern planning (less memory reserved ahead for varying input sizes)")
+    group.add_argument("--int8", action="store_true",
+                       help="CPU sessions: run INT8 dynamically quantized detector/recognizer copies "
+                            "(generated once in Data/models/int8/)")
+
+def runtime_from_args(args):
+    return {
+        'intra_op_threads': max(0, args.intra_op_threads),
+        'inter_op_threads': max(0, args.inter_op_threads),
+        'graph_optimization': args.graph_opt,
+        'cpu_mem_arena': not args.no_cpu_arena,
+        'mem_pattern': not args.no_mem_pattern,
+        'int8': args.int8,
+    }
+
+def runtime_cli_args(settings):
+    """The add_runtime_arguments flags reproducing ``settings``, for child scripts."""
+    cli = []
+    if settings['intra_op_threads']:
+        cli += ["--intra-op-threads", str(settings['intra_op_threads'])]
+    if settings['inter_op_threads']:
+        cli += ["--inter-op-threads", str(settings['inter_op_threads'])]
+    if settings['graph_optimization'] != DEFAULT_RUNTIME['graph_optimization']:
+        cli += ["--graph-opt", settings['graph_optimization']]
+    if not settings['cpu_mem_arena']:
+        cli.append("--no-cpu-arena")
+    if not settings['mem_pattern']:
+        cli.append("--no-mem-pattern")
+    if settings['int8']:
+        cli.append("--int8")
+    return cli
+
+def _dynamic_batch(session):
+    """True if the session's first input takes any batch size (a named or unset first dimension)."""
+    dim = session.get_inputs()[0].shape[0]
+    return not isinstance(dim, int) or dim <= 0
+
+class _CapturedInput(Exception):
+    pass
+
+class _CaptureSession:
+    """Stands in for the detector session to record the input blob ``detect`` builds, then aborts it."""
+
+    def run(self, output_names, feed):
+        self.blob = next(iter(feed.values()))
+        raise _CapturedInput()
+
+class _ReplaySession:
+    """Stands in for the detector session and answers with one image's slice of a batched run."""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def run(self, output_names, feed):
+        return self.outputs
+
+class DetectorSizeView:
+    """
+    A FaceAnalysis-like engine that runs a shared FaceAnalysis with its own
+    detector input size. ``get`` mirrors ``FaceAnalysis.get``; ``get_batch``
+    returns the same faces for several images with batched model calls.
+    Like the models themselves, a view is used by one thread at a time.
+    """
+
+    def __init__(self, app, det_size):
+        from insightface.app.common import Face
+
+        self.app = app
+        self.det_size = tuple(det_size)
+        self._face_cls = Face
+        self._batched_detection = None
+        self._batched_recognition = None
+
+    @property
+    def models(self):
+        return self.app.models
+
+    @property
+    def det_model(self):
+        return self.app.det_model
+
+    def _faces(self, bboxes, kpss):
+        return [self._face_cls(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+                for i in range(bboxes.shape[0])]
+
+    def get(self, img, max_num=0):
+        bboxes, kpss = self.app.det_model.detect(img, input_size=self.det_size, max_num=max_num, metric='default')
+        if bboxes.shape[0] == 0:
+            return []
+        faces = self._faces(bboxes, kpss)
+        for face in faces:
+            for taskname, model in self.app.models.items():
+                if taskname == 'detection':
+                    continue
+                model.get(img, face)
+        return faces
+
+    def get_batch(self, imgs, max_num=0):
+        """
+        Returns:
+            [faces] per image, as ``[self.get(img) for img in imgs]``.
+        """
+        detections = self.detect_batch(imgs, max_num)
+        faces_per_image = [self._faces(bboxes, kpss) if bboxes.shape[0] else [] for bboxes, kpss in detections]
+        for taskname, model in self.app.models.items():
+            if taskname == 'detection':
+                continue
+            if taskname == 'recognition' and self.supports_batched_recognition():
+                self._embed_batch(model, imgs, faces_per_image)
+            else:
+                for img, faces in zip(imgs, faces_per_image):
+                    for face in faces:
+                        model.get(img, face)
+        return faces_per_image
+
+    def supports_batched_detection(self):
+        if self._batched_detection is None:
+            det = self.app.det_model
+            session = getattr(det, 'session', None)
+            # Only batch-exported detectors keep a batch axis in their outputs (SCRFD sets ``batched``)
+            self._batched_detection = (bool(getattr(det, 'batched', False)) and session is not None
+                                       and _dynamic_batch(session))
+        return self._batched_detection
+
+    def supports_batched_recognition(self):
+        if self._batched_recognition is None:
+            rec = self.app.models.get('recognition')
+            session = getattr(rec, 'session', None)
+            self._batched_recognition = hasattr(rec, 'get_feat') and session is not None and _dynamic_batch(session)
+        return self._batched_recognition
+
+    def detect_batch(self, imgs, max_num=0):
+        """[(bboxes, kpss)] per image, with one detector session run when the model supports it."""
+        det = self.app.det_model
+        if len(imgs) < 2 or not self.supports_batched_detection():
+            return [det.detect(img, input_size=self.det_size, max_num=max_num, metric='default') for img in imgs]
+
+        session = det.session
+        try:
+            # Let detect() build each letterboxed blob exactly as it would for a single image ...
+            blobs = []
+            for img in imgs:
+                det.session = _CaptureSession()
+                try:
+                    det.detect(img, input_size=self.det_size, max_num=max_num, metric='default')
+                except _CapturedInput:
+                    blobs.append(det.session.blob)
+            if len(blobs) < len(imgs):
+                self._batched_detection = False  # detect() does not run det.session; stay on the per-image path
+                det.session = session
+                return [det.detect(img, input_size=self.det_size, max_num=max_num, metric='default') for img in imgs]
+
+            # ... run them as one batch, then let detect() decode each image's slice of the outputs
+            outputs = session.run(det.output_names, {det.input_name: np.concatenate(blobs, axis=0)})
+            detections = []
+            for i, img in enumerate(imgs):
+                det.session = _ReplaySession([out[i:i + 1] for out in outputs])
+                detections.append(det.detect(img, input_size=self.det_size, max_num=max_num, metric='default'))
+            return detections
+        finally:
+            det.session = session
+
+    def _embed_batch(self, model, imgs, faces_per_image):
+        # Same alignment as ArcFaceONNX.get, with every crop of the batch in one get_feat call
+        from insightface.utils import face_align
+
+        pending = [face for faces in faces_per_image for face in faces]
+        crops = [face_align.norm_crop(img, landmark=face.kps, image_size=model.input_size[0])
+                 for img, faces in zip(imgs, faces_per_image) for face in faces]
+        for start in range(0, len(crops), REC_MAX_BATCH):
+            feats = model.get_feat(crops[start:start + REC_MAX_BATCH])
+            for face, feat in zip(pending[start:start + REC_MAX_BATCH], feats):
+                face.embedding = feat.flatten()
+
+def load_dual_engine():
+    """
+    Returns:
+        (app_small, app_hd): views over one shared FaceAnalysis with 320x320 and
+        640x640 detector inputs.
+    """
+    print("[INFO] Initializing shared InsightFace (buffalo_l) for both engines...")
+    app = load_face_analysis(det_size=HD_DET_SIZE)
+    return DetectorSizeView(app, SMALL_DET_SIZE), DetectorSizeView(app, HD_DET_SIZE)
+
+def load_gfpgan():
+    """Load GFPGAN v1.3, or return None (rescue disabled) if it cannot be loaded."""
+    print("[INFO] Loading GFPGAN model...")
+    try:
+        from gfpgan import GFPGANer
+
+        gfpgan_model = GFPGANer(
+            model_path=GFPGAN_MODEL_URL,
+            upscale=2,
+            arch='clean',
+            channel_multiplier=2,
+            bg_upsampler=None
+        )
+        print("[OK] GFPGAN model loaded successfully.")
+        return gfpgan_model
+    except Exception as e:
+        print(f"[WARN] Failed to load GFPGAN model: {e}")
+        print("[INFO] Continuing without GFPGAN restoration...")
+        return None
+
+class LazyModel:
+    """Calls ``loader`` on the first get(); the result (including None for a failed load) is kept."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._loaded = False
+        self._model = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            self._model = self._loader()
+            self._loaded = True
+        return self._model
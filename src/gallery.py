@@ -0,0 +1,213 @@
+import numpy as np
+
+from ann_index import DEFAULT_NPROBE, matrix_fingerprint
+
+
+class Gallery:
+    """Enrolled embeddings stacked into one contiguous, L2-normalized float32 matrix.
+
+    Row ``i`` of ``matrix`` belongs to ``names[row_person[i]]``. Rows of the
+    same person are stored next to each other, so per-person maxima can be
+    taken with a single ``np.maximum.reduceat`` over the similarity matrix.
+
+    When ``index`` holds an IVFIndex built from ``matrix``, queries are only
+    compared with the rows of the ``nprobe`` closest inverted lists.
+    """
+
+    def __init__(self, names, matrix, row_person):
+        self.names = list(names)
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(0, 0)
+        self.matrix = np.ascontiguousarray(matrix)
+        self.row_person = np.asarray(row_person, dtype=np.int32)
+        self.dim = self.matrix.shape[1]
+        self.index = None
+        self.nprobe = DEFAULT_NPROBE
+        self._fingerprint = None
+
+        # First row of every person that owns at least one row (rows are grouped by person)
+        if len(self.row_person):
+            change = np.flatnonzero(np.diff(self.row_person)) + 1
+            self.block_starts = np.concatenate(([0], change)).astype(np.intp)
+            self.block_person = self.row_person[self.block_starts]
+        else:
+            self.block_starts = np.zeros(0, dtype=np.intp)
+            self.block_person = np.zeros(0, dtype=np.int32)
+
+    @classmethod
+    def from_db(cls, embeddings_db):
+        """Build a gallery from the legacy ``{name: [embedding, ...]}`` dict.
+
+        Embeddings are flattened and normalized in float64 before the cast to
+        float32. Rows the per-pair loop could never match are dropped: zero or
+        non-finite vectors (cosine is NaN) and vectors whose size differs from
+        the first stored embedding.
+        """
+        names = list(embeddings_db.keys())
+        rows = []
+        owners = []
+        dim = None
+
+        for person_idx, person_emb_list in enumerate(embeddings_db.values()):
+            if not isinstance(person_emb_list, (list, tuple)):
+                person_emb_list = [person_emb_list]
+
+            for stored_emb in person_emb_list:
+                try:
+                    vec = np.asarray(stored_emb, dtype=np.float64).flatten()
+                except Exception:
+                    continue
+                if dim is None:
+                    dim = vec.size
+                if vec.size != dim:
+                    continue
+                norm = np.linalg.norm(vec)
+                if not np.isfinite(norm) or norm == 0:
+                    continue
+                rows.append(vec / norm)
+                owners.append(person_idx)
+
+        if rows:
+            matrix = np.stack(rows).astype(np.float32)
+        else:
+            matrix = np.zeros((0, dim or 0), dtype=np.float32)
+        return cls(names, matrix, owners)
+
+    @property
+    def fingerprint(self):
+        # Computed on demand; galleries opened from an embedding store carry the stored value
+        if self._fingerprint is None:
+            self._fingerprint = matrix_fingerprint(self.matrix)
+        return self._fingerprint
+
+    @fingerprint.setter
+    def fingerprint(self, value):
+        self._fingerprint = value
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def normalize_queries(self, embeddings):
+        """Stack query embeddings into an (M, D) float32 matrix of unit rows.
+
+        Rows that cannot be compared with the gallery (wrong size, zero or
+        non-finite norm) come back as NaN so they never beat a real match.
+        """
+        queries = np.full((len(embeddings), self.dim), np.nan, dtype=np.float32)
+        for i, emb in enumerate(embeddings):
+            vec = np.asarray(emb, dtype=np.float64).flatten()
+            if vec.size != self.dim:
+                continue
+            norm = np.linalg.norm(vec)
+            if not np.isfinite(norm) or norm == 0:
+                continue
+            queries[i] = vec / norm
+        return queries
+
+    def person_similarities(self, queries):
+        """Return an (M, P) matrix with the best similarity of each query to each person.
+
+        ``P`` is the number of people that own at least one row; column ``j``
+        belongs to ``names[block_person[j]]``.
+        """
+        sims = queries @ self.matrix.T
+        return np.maximum.reduceat(sims, self.block_starts, axis=1)
+
+    def match(self, embeddings):
+        """Match a batch of query embeddings against the whole gallery at once.
+
+        Returns:
+            (names, best_similarities, margins) where ``names[i]`` is the best
+            person for query ``i`` (None when nothing is comparable), and the
+            margin is the gap to the best *other* person (-1.0 stands in for a
+            missing runner-up, the same floor the per-pair loop starts from).
+        """
+        count = len(embeddings)
+        names = [None] * count
+        best = np.full(count, -1.0)
+        margins = np.zeros(count)
+        if count == 0 or len(self) == 0:
+            return names, best, margins
+
+        queries = self.normalize_queries(embeddings)
+        valid = ~np.isnan(queries[:, 0]) if self.dim else np.zeros(count, dtype=bool)
+        if not valid.any():
+            return names, best, margins
+
+        if self.index is not None:
+            best_person, best_sims, second_sims = self._match_ivf(queries[valid])
+        else:
+            best_person, best_sims, second_sims = self._match_exact(queries[valid])
+
+        for out_idx, person_idx, sim, second in zip(np.flatnonzero(valid), best_person, best_sims, second_sims):
+            if person_idx < 0:
+                continue
+            names[out_idx] = self.names[person_idx]
+            best[out_idx] = sim
+            margins[out_idx] = sim - second
+        return names, best, margins
+
+    def _match_exact(self, queries):
+        per_person = self.person_similarities(queries)
+        best_col = np.argmax(per_person, axis=1)
+        rows = np.arange(per_person.shape[0])
+        best_sims = per_person[rows, best_col].astype(np.float64)
+
+        if per_person.shape[1] > 1:
+            per_person[rows, best_col] = -np.inf
+            second_sims = np.maximum(per_person.max(axis=1).astype(np.float64), -1.0)
+        else:
+            second_sims = np.full(per_person.shape[0], -1.0)
+        return self.block_person[best_col], best_sims, second_sims
+
+    def _match_ivf(self, queries):
+        # Visit every probed list once and score all queries probing it in one
+        # matrix multiply, keeping a running best and best-other-person per query.
+        count = queries.shape[0]
+        best_person = np.full(count, -1, dtype=np.int32)
+        best_sims = np.full(count, -np.inf)
+        second_sims = np.full(count, -np.inf)
+
+        probed = self.index.probe(queries, self.nprobe)
+        query_ids = np.repeat(np.arange(count), probed.shape[1])
+        list_ids = probed.ravel()
+        order = np.argsort(list_ids, kind="stable")
+        list_ids, query_ids = list_ids[order], query_ids[order]
+        bounds = np.flatnonzero(np.diff(list_ids)) + 1
+
+        for group in np.split(np.arange(len(list_ids)), bounds):
+            if len(group) == 0:
+                continue
+            list_id = list_ids[group[0]]
+            rows = self.index.list_rows[self.index.list_offsets[list_id]:self.index.list_offsets[list_id + 1]]
+            if len(rows) == 0:
+                continue
+            qids = query_ids[group]
+            owners = self.row_person[rows]
+            sims = (queries[qids] @ self.matrix[rows].T).astype(np.float64)
+
+            top = np.argmax(sims, axis=1)
+            chunk_sim = sims[np.arange(len(qids)), top]
+            chunk_person = owners[top]
+            sims[owners[None, :] == chunk_person[:, None]] = -np.inf
+            chunk_other = sims.max(axis=1)
+
+            cur_best, cur_person, cur_second = best_sims[qids], best_person[qids], second_sims[qids]
+            same = chunk_person == cur_person
+            wins = chunk_sim > cur_best
+            new_second = np.where(
+                wins,
+                np.where(same, np.maximum(cur_second, chunk_other), np.maximum(cur_best, chunk_other)),
+                np.where(same, np.maximum(cur_second, chunk_other), np.maximum(cur_second, chunk_sim)),
+            )
+            best_sims[qids] = np.where(wins, chunk_sim, cur_best)
+            best_person[qids] = np.where(wins, chunk_person, cur_person)
+            second_sims[qids] = new_second
+
+        best_sims[best_person < 0] = -1.0
+        return best_person, best_sims, np.maximum(second_sims, -1.0)
+
+    def match_one(self, embedding):
+        names, best, _ = self.match([embedding])
+        return names[0], float(best[0])
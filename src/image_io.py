@@ -0,0 +1,116 @@
+"""
+Image header parsing and reduced-resolution decoding for the detection pass.
+
+``read_image_header`` gets the format and dimensions from the JPEG SOF or PNG
+IHDR header without decoding any pixels. Large JPEGs are then decoded at 1/2,
+1/4 or 1/8 scale with libjpeg's DCT scaling (``cv2.IMREAD_REDUCED_COLOR_*``),
+which is much faster and needs a fraction of the memory of a full decode. The
+factor is chosen so the longer side never drops below ``REDUCED_DECODE_FLOOR``
+pixels, well above the 640x640 detector input. Callers multiply detected
+boxes by the returned scale to get full-resolution coordinates.
+"""
+
+import io
+import struct
+import numpy as np
+import cv2
+
+REDUCED_DECODE_FLOOR = 1600
+REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start-of-frame markers carrying the frame size (C4 = DHT, C8 = JPG, CC = DAC are not frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7:
+            continue  # standalone markers have no length
+        if marker in (0xD9, 0xDA):
+            return None  # end of image / start of scan before any frame header
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+def read_image_header(path):
+    """
+    Returns:
+        (format, width, height) with format 'jpeg' or 'png', or None when the
+        header cannot be parsed (the caller should fall back to a full decode).
+    """
+    try:
+        with open(path, "rb") as f:
+            return _read_header(f)
+    except OSError:
+        return None
+
+def _read_header(f):
+    head = f.read(24)
+    if head[:2] == b"\xff\xd8":
+        size = _jpeg_size(f)
+        return ("jpeg", *size) if size else None
+    if head[:8] == PNG_SIGNATURE and head[12:16] == b"IHDR":
+        width, height = struct.unpack(">II", head[16:24])
+        return "png", width, height
+    return None
+
+def reduction_factor(header, floor=REDUCED_DECODE_FLOOR):
+    """Largest DCT reduction keeping the longer side >= floor (1 = full decode)."""
+    if header is None or header[0] != "jpeg" or floor is None:
+        return 1
+    max_dim = max(header[1], header[2])
+    for factor in sorted(REDUCED_FLAGS, reverse=True):
+        if max_dim // factor >= floor:
+            return factor
+    return 1
+
+def decode_for_detection(path, floor=REDUCED_DECODE_FLOOR):
+    """
+    Decode a photo for detection, at reduced scale when it is a large JPEG.
+
+    Returns:
+        (img, scale, max_dim): the decoded BGR image (None if unreadable), the
+        factor mapping its coordinates to full resolution and the full-resolution
+        longer side (from the header when available) used for engine routing.
+    """
+    header = read_image_header(path)
+    factor = reduction_factor(header, floor)
+    img = cv2.imread(path, REDUCED_FLAGS[factor]) if factor > 1 else cv2.imread(path)
+    return _detection_input(img, header, factor)
+
+def decode_bytes_for_detection(data, floor=REDUCED_DECODE_FLOOR):
+    """decode_for_detection for an encoded image held in memory (e.g. an upload)."""
+    header = _read_header(io.BytesIO(data))
+    factor = reduction_factor(header, floor)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buf, REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    return _detection_input(img, header, factor)
+
+def _detection_input(img, header, factor):
+    if img is None:
+        return None, 1.0, 0
+    if header is None:
+        return img, 1.0, max(img.shape[:2])
+    # Header dimensions are pre-EXIF-rotation; the longer side is the same either way
+    return img, float(factor), max(header[1], header[2])
@@ -0,0 +1,98 @@
+"""
+Load test for sort_service.py: throughput and latency percentiles.
+
+``--concurrency`` client threads post photos (cycled from Data/new_photos or
+--images) to a running service for ``--requests`` requests in total, each
+over its own keep-alive connection. Reported: requests/s, p50/p90/p99/max
+latency, the mean micro-batch size the server used and any errors.
+
+Usage:
+    python src/sort_service.py &
+    python src/load_test_service.py --concurrency 8 --requests 400
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+import http.client
+import numpy as np
+
+from process_photos import NEW_PHOTOS_DIR
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def run_client(host, port, payloads, counter, lock, latencies, batch_sizes, errors):
+    conn = http.client.HTTPConnection(host, port, timeout=120)
+    try:
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            body = payloads[index % len(payloads)]
+            start = time.perf_counter()
+            try:
+                conn.request("POST", "/sort", body=body, headers={"Content-Type": "application/octet-stream"})
+                response = conn.getresponse()
+                payload = json.loads(response.read())
+            except (OSError, http.client.HTTPException, ValueError) as e:
+                errors.append(str(e))
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=120)
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                batch_sizes.append(payload.get('batch_size', 1))
+                if response.status != 200:
+                    errors.append(f"HTTP {response.status}: {payload.get('error')}")
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of the local sorting service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel client connections")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests")
+    parser.add_argument("--images", nargs="+", help=f"Photos to send (default: every image in {NEW_PHOTOS_DIR})")
+    args = parser.parse_args()
+
+    paths = args.images or [os.path.join(NEW_PHOTOS_DIR, f) for f in sorted(os.listdir(NEW_PHOTOS_DIR))
+                            if f.lower().endswith(IMAGE_EXTENSIONS)]
+    if not paths:
+        print("[ERROR] No photos to send.")
+        return
+    payloads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            payloads.append(f.read())
+
+    counter = iter(range(max(1, args.requests)))
+    lock = threading.Lock()
+    latencies, batch_sizes, errors = [], [], []
+    threads = [
+        threading.Thread(target=run_client, args=(args.host, args.port, payloads, counter, lock,
+                                                  latencies, batch_sizes, errors))
+        for _ in range(max(1, args.concurrency))
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    print(f"[LOAD TEST] {len(latencies)} requests, concurrency {args.concurrency}, {len(payloads)} distinct photos")
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+        print(f"  Throughput: {len(latencies) / wall:.1f} requests/s ({wall:.2f}s)")
+        print(f"  Latency: p50 {p50:.1f} ms, p90 {p90:.1f} ms, p99 {p99:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+        print(f"  Mean server batch size: {np.mean(batch_sizes):.2f}")
+    if errors:
+        print(f"  Errors: {len(errors)} (first: {errors[0]})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Staged decode -> inference -> output pipeline for a single sorting process.
+
+    feeder --> [decode thread pool] --decode_q--> inference (caller thread) --output_q--> writer thread
+
+Decoding (JPEG/PNG -> pixels) runs ahead in a small thread pool, the models
+run in the calling thread, and file placement happens asynchronously in a
+writer thread. Both queues are bounded, so at most ``queue_size`` decoded
+images and ``queue_size`` pending placements exist at any time (plus the
+images of the current inference batch, when batching is on). Items leave
+every stage in input order, so placement order (and therefore the output
+folders and stats) matches a plain serial loop.
+
+Per-stage busy time and queue depths are recorded so the bottleneck stage on
+a given machine is visible in the report.
+"""
+
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+_DONE = object()
+
+class StageCounters:
+    """Busy time and item count for one pipeline stage."""
+
+    def __init__(self, name, threads=1):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.calls = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self._lock = threading.Lock()
+
+    def add_busy(self, seconds, items=1):
+        with self._lock:
+            self.items += items
+            self.calls += 1
+            self.busy += seconds
+
+    def add_wait(self, seconds):
+        with self._lock:
+            self.waiting += seconds
+
+    def occupancy(self, wall):
+        return self.busy / max(wall * self.threads, 1e-9)
+
+class GaugedQueue(queue.Queue):
+    """Bounded queue that samples its depth on every put."""
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize=maxsize)
+        self.name = name
+        self.samples = 0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.full_waits = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.full():
+            self.full_waits += 1
+        super().put(item, block=block, timeout=timeout)
+        depth = self.qsize()
+        self.samples += 1
+        self.depth_sum += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def mean_depth(self):
+        return self.depth_sum / max(self.samples, 1)
+
+def run_pipeline(items, decode_fn, infer_fn, output_fn, decode_threads=2, queue_size=8,
+                 infer_batch_fn=None, batch_size=1, batch_wait=0.0):
+    """
+    Run every item through decode_fn -> infer_fn -> output_fn.
+
+    Args:
+        items: Sequence of work items (e.g. filenames)
+        decode_fn: decode_fn(item) -> decoded data (runs in the decode thread pool)
+        infer_fn: infer_fn(item, decoded) -> result (runs in the calling thread)
+        output_fn: output_fn(item, result) (runs in the writer thread, in input order)
+        decode_threads: Size of the decode/prefetch thread pool
+        queue_size: Capacity of each inter-stage queue
+        infer_batch_fn: infer_batch_fn([item], [decoded]) -> [result]; with batch_size > 1 the
+            inference stage takes up to batch_size items that are decoded within batch_wait
+            seconds of the first one and passes them here together (a lone item goes to infer_fn)
+
+    Returns:
+        Report dict with wall time, per-stage counters and queue gauges.
+    """
+    decode_stage = StageCounters("decode", threads=decode_threads)
+    infer_stage = StageCounters("infer")
+    if infer_batch_fn is None:
+        batch_size = 1
+    batch_size = max(1, batch_size)
+    output_stage = StageCounters("output")
+    decode_q = GaugedQueue("decode->infer", queue_size)
+    output_q = GaugedQueue("infer->output", queue_size)
+    errors = []
+    stop = threading.Event()
+
+    def timed_decode(item):
+        start = time.perf_counter()
+        try:
+            return decode_fn(item)
+        finally:
+            decode_stage.add_busy(time.perf_counter() - start)
+
+    def feeder(pool):
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                # Blocks while decode_q is full, which caps the number of decoded images in memory
+                decode_q.put((item, pool.submit(timed_decode, item)))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            decode_q.put(_DONE)
+
+    def writer():
+        while True:
+            wait_start = time.perf_counter()
+            entry = output_q.get()
+            output_stage.add_wait(time.perf_counter() - wait_start)
+            if entry is _DONE:
+                return
+            if stop.is_set():
+                continue
+            item, result = entry
+            start = time.perf_counter()
+            try:
+                output_fn(item, result)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                output_stage.add_busy(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=decode_threads, thread_name_prefix="decode") as pool:
+        feeder_thread = threading.Thread(target=feeder, args=(pool,), name="feeder", daemon=True)
+        writer_thread = threading.Thread(target=writer, name="writer", daemon=True)
+        feeder_thread.start()
+        writer_thread.start()
+
+        try:
+            carry = None
+            while True:
+                wait_start = time.perf_counter()
+                entry = carry if carry is not None else decode_q.get()
+                carry = None
+                if entry is _DONE:
+                    infer_stage.add_wait(time.perf_counter() - wait_start)
+                    break
+                item, future = entry
+                batch_items, batch_decoded = [item], [future.result()]
+                infer_stage.add_wait(time.perf_counter() - wait_start)
+                # Later items join the batch only if they are decoded before the first one has waited batch_wait
+                deadline = time.perf_counter() + batch_wait
+                while len(batch_items) < batch_size:
+                    try:
+                        entry = decode_q.get(timeout=max(0.0, deadline - time.perf_counter()))
+                    except queue.Empty:
+                        break
+                    if entry is _DONE:
+                        carry = entry
+                        break
+                    try:
+                        decoded = entry[1].result(timeout=max(0.0, deadline - time.perf_counter()))
+                    except FuturesTimeout:
+                        carry = entry
+                        break
+                    batch_items.append(entry[0])
+                    batch_decoded.append(decoded)
+                if stop.is_set():
+                    continue
+
+                start = time.perf_counter()
+                if len(batch_items) == 1:
+                    results = [infer_fn(batch_items[0], batch_decoded[0])]
+                else:
+                    results = infer_batch_fn(batch_items, batch_decoded)
+                del batch_decoded
+                infer_stage.add_busy(time.perf_counter() - start, items=len(batch_items))
+                for item, result in zip(batch_items, results):
+                    output_q.put((item, result))
+        except BaseException:
+            stop.set()
+            # Drain so the feeder is never left blocked on a full queue
+            while feeder_thread.is_alive():
+                try:
+                    decode_q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        finally:
+            output_q.put(_DONE)
+            writer_thread.join()
+            feeder_thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return {
+        'wall': time.perf_counter() - wall_start,
+        'stages': [decode_stage, infer_stage, output_stage],
+        'queues': [decode_q, output_q],
+    }
+
+def print_pipeline_report(report):
+    wall = report['wall']
+    print("\n[PIPELINE STAGES]")
+    print(f"  Wall time: {wall:.2f}s")
+    for stage in report['stages']:
+        per_item = stage.busy / max(stage.items, 1) * 1000
+        print(f"  {stage.name:<7} threads={stage.threads}  items={stage.items}  busy={stage.busy:.2f}s  "
+              f"occupancy={stage.occupancy(wall) * 100:5.1f}%  idle-wait={stage.waiting:.2f}s  ({per_item:.1f} ms/item)")
+    for q in report['queues']:
+        print(f"  queue {q.name:<14} capacity={q.maxsize}  mean depth={q.mean_depth():.1f}  "
+              f"max depth={q.max_depth}  producer blocked (queue full)={q.full_waits}x")
+    infer_stage = report['stages'][1]
+    if infer_stage.calls and infer_stage.calls < infer_stage.items:
+        print(f"  Inference batches: {infer_stage.calls} (mean {infer_stage.items / infer_stage.calls:.2f} images)")
+    bottleneck = max(report['stages'], key=lambda s: s.occupancy(wall))
+    print(f"  Bottleneck: {bottleneck.name} stage")
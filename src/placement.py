@@ -0,0 +1,108 @@
+"""
+Placement strategies for sorted output (how a photo gets into Data/output/<person>/).
+
+    copy      full copy with shutil.copy2 (default, works everywhere)
+    hardlink  os.link: no extra data written, same inode as the original
+    reflink   copy-on-write clone (FICLONE ioctl; Btrfs, XFS, bcachefs, ...)
+    symlink   relative symbolic link to the original photo
+    manifest  nothing is written to the person folders; every placement is
+              listed in Data/output/placements.csv instead
+
+hardlink and reflink fall back to a copy when the output and the source are
+on different filesystems or the filesystem does not support them; the
+fallbacks are counted and shown in the final summary.
+"""
+
+import os
+import csv
+import time
+import errno
+import shutil
+
+PLACEMENT_MODES = ("copy", "hardlink", "reflink", "symlink", "manifest")
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+# errno values meaning "this filesystem pair cannot do it", as opposed to real I/O errors
+FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL,
+                   errno.ENOTTY, errno.ENOSYS, errno.EMLINK}
+
+def reflink(src, dest):
+    import fcntl
+
+    try:
+        with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+    except BaseException:
+        if os.path.exists(dest):
+            os.remove(dest)
+        raise
+    shutil.copystat(src, dest)
+
+class Placer:
+    """Places files with one strategy and keeps per-method counts and the time spent."""
+
+    def __init__(self, mode="copy", manifest_path=None):
+        if mode not in PLACEMENT_MODES:
+            raise ValueError(f"Unknown placement mode: {mode} (expected one of {', '.join(PLACEMENT_MODES)})")
+        self.mode = mode
+        self.manifest_path = manifest_path
+        self.manifest_rows = []
+        self.methods = {}
+        self.seconds = 0.0
+
+    def place(self, src, dest, person):
+        """Place ``src`` at ``dest`` and return the method actually used."""
+        start = time.perf_counter()
+        try:
+            method = self._place(src, dest, person)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.methods[method] = self.methods.get(method, 0) + 1
+        return method
+
+    def _place(self, src, dest, person):
+        if self.mode == "manifest":
+            self.manifest_rows.append((person, os.path.basename(dest), os.path.abspath(src)))
+            return "manifest"
+
+        # Already placed by an earlier (resumed) run -> no second copy
+        if os.path.lexists(dest):
+            return "existing"
+
+        if self.mode == "copy":
+            shutil.copy2(src, dest)
+            return "copy"
+
+        try:
+            if self.mode == "hardlink":
+                os.link(src, dest)
+            elif self.mode == "reflink":
+                reflink(src, dest)
+            else:
+                os.symlink(os.path.relpath(os.path.abspath(src), os.path.dirname(os.path.abspath(dest))), dest)
+            return self.mode
+        except (OSError, ImportError) as e:
+            if isinstance(e, OSError) and e.errno not in FALLBACK_ERRNOS:
+                raise
+            shutil.copy2(src, dest)
+            return "copy (fallback)"
+
+    def remove(self, dest):
+        """Retract an earlier placement (no-op in manifest mode)."""
+        if self.mode != "manifest" and os.path.lexists(dest):
+            os.remove(dest)
+
+    def close(self):
+        """Write the placement manifest (manifest mode only)."""
+        if self.mode != "manifest" or self.manifest_path is None:
+            return
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Person", "Filename", "Source"])
+            writer.writerows(self.manifest_rows)
+        os.replace(tmp_path, self.manifest_path)
+        print(f"[SAVED] Placement manifest: {self.manifest_path} ({len(self.manifest_rows)} placements)")
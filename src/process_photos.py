@@ -1,29 +1,89 @@
 import os
-import pickle
-import shutil
+import time
+import collections
+import argparse
+import multiprocessing
 import numpy as np
 import cv2
-from scipy.spatial.distance import cosine
-from tqdm import tqdm
-from gfpgan import GFPGANer
-import insightface
+
+from duplicates import DEDUP_MODES, Fingerprints, file_sha256, find_duplicates, save_duplicate_groups
+from face_models import (
+    LazyModel, add_runtime_arguments, configure_runtime, load_dual_engine, load_gfpgan, model_variant,
+    runtime_from_args, runtime_settings,
+)
+from image_io import REDUCED_DECODE_FLOOR, decode_for_detection
+from ann_index import ANN_MIN_GALLERY_SIZE, IVFIndex, make_report_queries, verified_nprobe
+from gallery import Gallery
+from embedding_store import convert_legacy_pickle, load_store_gallery
+from pipeline import run_pipeline, print_pipeline_report
+from results_ledger import ResultsLedger
+from face_cache import FaceCacheWriter
+from placement import PLACEMENT_MODES, Placer
+from rescue_cache import DEFAULT_MAX_ENTRIES as DEFAULT_RESCUE_CACHE_SIZE, RescueCache
+from watch_folder import ArrivalTracker, LatencyStats, open_watcher
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-EMBEDDINGS_PATH = os.path.join(BASE_DIR, "Data", "embeddings.pkl")
+EMBEDDINGS_PATH = os.path.join(BASE_DIR, "Data", "embeddings.fsdb")
+LEGACY_EMBEDDINGS_PATH = os.path.join(BASE_DIR, "Data", "embeddings.pkl")
+ANN_INDEX_PATH = os.path.join(BASE_DIR, "Data", "embeddings_ivf.npz")
 NEW_PHOTOS_DIR = os.path.join(BASE_DIR, "Data", "new_photos")
 OUTPUT_DIR = os.path.join(BASE_DIR, "Data", "output")
+LEDGER_PATH = os.path.join(BASE_DIR, "Data", "results_ledger.sqlite")
+FACE_CACHE_PATH = os.path.join(BASE_DIR, "Data", "face_cache.npz")
+PLACEMENT_MANIFEST_PATH = os.path.join(OUTPUT_DIR, "placements.csv")
+DUPLICATE_GROUPS_PATH = os.path.join(BASE_DIR, "Data", "duplicate_groups.json")
+RESCUE_CACHE_PATH = os.path.join(BASE_DIR, "Data", "rescue_cache.sqlite")
 
 STRICT_THRESHOLD = 0.45
 DOUBT_THRESHOLD = 0.3
 QUALITY_GATE_SCORE = 0.6
+DEFAULT_BATCH_WAIT_MS = 20.0
+ANN_NPROBE = 16  # First nprobe checked by attach_ann_index; doubled until the sample decisions are exact
+ANN_CHECK_QUERIES = 256  # perturbed gallery rows (and strangers) compared with exact matching
+ANN_CHECK_NOISE = 1.5  # same perturbation as the ann_index.py recall report
 
 def load_embeddings():
     if not os.path.exists(EMBEDDINGS_PATH):
-        raise FileNotFoundError(f"Database file not found: {EMBEDDINGS_PATH}")
-    with open(EMBEDDINGS_PATH, "rb") as f:
-        embeddings_db = pickle.load(f)
-    print(f"[INFO] Loaded embeddings for {len(embeddings_db)} people")
-    return embeddings_db
+        if not os.path.exists(LEGACY_EMBEDDINGS_PATH):
+            raise FileNotFoundError(f"Database file not found: {EMBEDDINGS_PATH}")
+        # One-time migration of a database written by an older enroll.py
+        print(f"[INFO] Converting legacy database {LEGACY_EMBEDDINGS_PATH} to {EMBEDDINGS_PATH}...")
+        convert_legacy_pickle(LEGACY_EMBEDDINGS_PATH, EMBEDDINGS_PATH)
+    gallery = load_store_gallery(EMBEDDINGS_PATH)
+    print(f"[INFO] Loaded embeddings for {len(gallery.names)} people ({len(gallery)} embeddings, memory-mapped)")
+    return gallery
+
+def attach_ann_index(gallery):
+    if len(gallery) < ANN_MIN_GALLERY_SIZE:
+        return gallery
+
+    if not os.path.exists(ANN_INDEX_PATH):
+        print(f"[WARN] Gallery has {len(gallery)} embeddings but no ANN index was found; using exact matching.")
+        return gallery
+
+    try:
+        index = IVFIndex.load(ANN_INDEX_PATH)
+    except Exception as e:
+        print(f"[WARN] Failed to load ANN index {ANN_INDEX_PATH}: {e}. Using exact matching.")
+        return gallery
+
+    if not index.matches(gallery):
+        print("[WARN] ANN index is stale (built from a different gallery); using exact matching.")
+        return gallery
+
+    # A fixed nprobe may change who gets which photo; only use one that reproduces exact decisions
+    queries = np.asarray(make_report_queries(gallery, ANN_CHECK_QUERIES, ANN_CHECK_NOISE, np.random.default_rng(0)))
+    nprobe = verified_nprobe(gallery, index, queries, ANN_NPROBE, STRICT_THRESHOLD, DOUBT_THRESHOLD)
+    if nprobe is None:
+        print(f"[WARN] IVF index ({index.n_lists} lists) changes match decisions unless more than half of the "
+              f"lists are probed; using exact matching.")
+        return gallery
+
+    gallery.index = index
+    gallery.nprobe = nprobe
+    print(f"[INFO] Using IVF index: {index.n_lists} lists, nprobe={nprobe} "
+          f"(same decisions as exact matching on {ANN_CHECK_QUERIES} sample faces)")
+    return gallery
 
 def ensure_output_dirs(names):
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -36,9 +96,22 @@ def ensure_output_dirs(names):
     os.makedirs(unknown_dir, exist_ok=True)
 
 def cosine_similarity(emb1, emb2):
+    from scipy.spatial.distance import cosine
+
     return 1 - cosine(emb1, emb2)
 
-def find_best_match(embedding, embeddings_db):
+def find_best_match(embedding, gallery):
+    """
+    Best (name, similarity) of one embedding against a Gallery. The older call with an
+    embeddings_db dict ``{name: [embedding, ...]}`` still works, but the dict is stacked
+    into a Gallery on every call; build one with Gallery.from_db to match many faces.
+    """
+    if isinstance(gallery, dict):
+        gallery = Gallery.from_db(gallery)
+    return gallery.match_one(embedding)
+
+def find_best_match_loop(embedding, embeddings_db):
+    # Reference per-pair implementation, kept for parity checks in benchmark_matching.py
     best_name = None
     best_similarity = -1.0
 
@@ -101,71 +174,611 @@ def restore_face_with_gfpgan(gfpgan_model, face_crop):
         return None
 
 def initialize_models():
-    print("[INFO] Initializing Dual-Engine InsightFace (buffalo_l) on GPU...")
-    
-    # Initialize app_small for low-res images (det_size=320)
-    print("[INFO] Initializing app_small (det_size=320) for low-res images...")
+    # One buffalo_l load serves both engines; only the detector input size differs per call
+    app_small, app_hd = load_dual_engine()
+    print(f"[OK] Dual-Engine ready: app_small (det_size={app_small.det_size}), app_hd (det_size={app_hd.det_size}).")
+
+    # GFPGAN is only loaded when the first doubt-zone face reaches the rescue stage
+    gfpgan = LazyModel(load_gfpgan)
+
+    return app_small, app_hd, gfpgan
+
+def choose_engine(img, app_small, app_hd, max_dim=None):
+    # Smart routing: Choose app based on the full-resolution image dimensions
+    if max_dim is None:
+        h, w = img.shape[:2]
+        max_dim = max(h, w)
+
+    if max_dim < 800:
+        # Low-res image -> use app_small
+        return app_small
+    # HD/4K image -> use app_hd
+    return app_hd
+
+def rescue_face(img, face, app, gfpgan, engine=None, cache=None):
+    """
+    Restore a doubt-zone face record with GFPGAN and re-detect it. With a RescueCache,
+    identical or near-identical crops of the same face reuse a stored result instead.
+    ``gfpgan`` is a LazyModel; it is loaded on the first cache miss.
+
+    Returns:
+        None when no restoration model is available (rescue not attempted), otherwise
+        {'det_score', 'embedding'} of the best restored face; both are None when the
+        restoration or re-detection produced nothing usable.
+    """
+    failed = {'det_score': None, 'embedding': None}
     try:
-        app_small = insightface.app.FaceAnalysis(
-            name='buffalo_l',
-            providers=['CUDAExecutionProvider'],
-            ctx_id=0
-        )
-        app_small.prepare(ctx_id=0, det_size=(320, 320))
-        print("[OK] app_small loaded on GPU (det_size=(320, 320)).")
+        face_crop = crop_face(img, np.asarray(face['bbox'], dtype=np.float32))
+        if face_crop.size == 0:
+            return failed
+
+        lookup = None
+        if cache is not None:
+            lookup = cache.get(face_crop, engine, face['embedding'])
+            if lookup['hit']:
+                return {'det_score': lookup['det_score'], 'embedding': lookup['embedding']}
+
+        gfpgan_model = gfpgan.get()
+        if gfpgan_model is None:
+            # No restoration available; treat as unknown/ignored
+            return None
+
+        rescue = failed
+        restored_face = restore_face_with_gfpgan(gfpgan_model, face_crop)
+        if restored_face is not None:
+            # Re-detect on restored face using the same app that detected it initially
+            restored_faces = app.get(restored_face)
+            if restored_faces:
+                restored_face_obj = max(restored_faces, key=lambda f: f.det_score)
+                rescue = {'det_score': float(restored_face_obj.det_score),
+                          'embedding': np.asarray(restored_face_obj.embedding, dtype=np.float32)}
+
+        if lookup is not None:
+            cache.put(lookup, engine, rescue)
+        return rescue
+    except Exception:
+        # Any error in rescue path -> just ignore this face
+        return failed
+
+def decide_faces(faces, gallery):
+    """
+    Turn stored face records into placement decisions with the current thresholds.
+
+    Returns:
+        (matches, low_quality, needs_rescue): ordered ('clear' | 'recovered', person_name)
+        placements, the number of faces below the quality gate and the indexes of
+        doubt-zone faces that have no rescue result yet.
+    """
+    good = [i for i, face in enumerate(faces) if face['det_score'] >= QUALITY_GATE_SCORE]
+    match_names, match_sims, _ = gallery.match([faces[i]['embedding'] for i in good])
+
+    matches = []
+    needs_rescue = []
+    for i, best_name, best_similarity in zip(good, match_names, match_sims):
+        if best_similarity >= STRICT_THRESHOLD:
+            matches.append(('clear', best_name))
+
+        elif best_similarity >= DOUBT_THRESHOLD:
+            # Unsure zone -> decided by the GFPGAN-restored face
+            rescue = faces[i]['rescue']
+            if rescue is None:
+                needs_rescue.append(i)
+            elif rescue['embedding'] is not None and rescue['det_score'] >= QUALITY_GATE_SCORE:
+                restored_name, restored_similarity = find_best_match(rescue['embedding'], gallery)
+                if restored_similarity >= STRICT_THRESHOLD:
+                    matches.append(('recovered', restored_name))
+
+        # similarity < DOUBT_THRESHOLD -> treat as stranger (ignored)
+
+    return matches, len(faces) - len(good), needs_rescue
+
+def finalize_result(result, gallery):
+    """Fill 'matches' and 'low_quality' of an analysis result from its face records."""
+    result['matches'], result['low_quality'], result['needs_rescue'] = decide_faces(result['faces'], gallery)
+    return result
+
+def decode_image(img_path):
+    try:
+        return cv2.imread(img_path)
     except Exception as e:
-        print(f"[WARN] Failed to initialize app_small on GPU: {e}")
-        print("[INFO] Falling back to CPU for app_small...")
-        try:
-            app_small = insightface.app.FaceAnalysis(name='buffalo_l')
-            app_small.prepare(ctx_id=-1, det_size=(320, 320))
-            print("[OK] app_small loaded on CPU (fallback, det_size=(320, 320)).")
-        except Exception as fallback_err:
-            print(f"[ERROR] Failed to initialize app_small on CPU: {fallback_err}")
-            raise
-
-    # Initialize app_hd for HD/4K images (det_size=640)
-    print("[INFO] Initializing app_hd (det_size=640) for HD/4K images...")
+        print(f"[ERROR] Failed to decode {img_path}: {e}")
+        return None
+
+def decode_for_analysis(img_path, reduced_floor=REDUCED_DECODE_FLOOR):
+    """Decode for detection (large JPEGs at reduced scale); returns (img, scale, full max_dim)."""
     try:
-        app_hd = insightface.app.FaceAnalysis(
-            name='buffalo_l',
-            providers=['CUDAExecutionProvider'],
-            ctx_id=0
-        )
-        app_hd.prepare(ctx_id=0, det_size=(640, 640))
-        print("[OK] app_hd loaded on GPU (det_size=(640, 640)).")
+        return decode_for_detection(img_path, floor=reduced_floor)
     except Exception as e:
-        print(f"[WARN] Failed to initialize app_hd on GPU: {e}")
-        print("[INFO] Falling back to CPU for app_hd...")
-        try:
-            app_hd = insightface.app.FaceAnalysis(name='buffalo_l')
-            app_hd.prepare(ctx_id=-1, det_size=(640, 640))
-            print("[OK] app_hd loaded on CPU (fallback, det_size=(640, 640)).")
-        except Exception as fallback_err:
-            print(f"[ERROR] Failed to initialize app_hd on CPU: {fallback_err}")
-            raise
-
-    print("[INFO] Loading GFPGAN model...")
+        print(f"[ERROR] Failed to decode {img_path}: {e}")
+        return None, 1.0, 0
+
+def analyze_image(img_path, app_small, app_hd, gallery, reduced_floor=REDUCED_DECODE_FLOOR):
+    img, scale, max_dim = decode_for_analysis(img_path, reduced_floor)
+    return analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+
+def analyze_decoded(img, app_small, app_hd, gallery, scale=1.0, max_dim=None):
+    """
+    Run detection and matching on one decoded photo without touching Data/output.
+
+    ``img`` may be a reduced decode; ``scale`` maps its coordinates back to the
+    full-resolution photo, so stored bboxes are always full resolution.
+    ``max_dim`` is the full-resolution longer side used for engine routing.
+    Doubt-zone faces are not restored here; they are listed in 'needs_rescue'
+    and handled by the rescue stage after the main pass.
+
+    Returns:
+        dict with 'status' ('ok', 'no_faces', 'unreadable' or 'error'), 'engine',
+        'faces' (bbox, det_score, embedding and rescue result of every detected face)
+        and the decisions added by finalize_result.
+    """
+    result = {'status': 'ok', 'engine': None, 'faces': [], 'error': None}
+
     try:
-        model_path = 'https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.3.pth'
-        gfpgan_model = GFPGANer(
-            model_path=model_path,
-            upscale=2,
-            arch='clean',
-            channel_multiplier=2,
-            bg_upsampler=None
-        )
-        print("[OK] GFPGAN model loaded successfully.")
+        if img is None:
+            result['status'] = 'unreadable'
+            return finalize_result(result, gallery)
+
+        app = choose_engine(img, app_small, app_hd, max_dim)
+        result['engine'] = 'small' if app is app_small else 'hd'
+        return result_from_faces(result, app.get(img), scale, gallery)
+
     except Exception as e:
-        print(f"[WARN] Failed to load GFPGAN model: {e}")
-        print("[INFO] Continuing without GFPGAN restoration...")
-        gfpgan_model = None
+        return error_result(result, e)
+
+def result_from_faces(result, faces, scale, gallery):
+    """Fill an analysis result from the engine's faces (see analyze_decoded)."""
+    if not faces:
+        result['status'] = 'no_faces'
+        return finalize_result(result, gallery)
+
+    result['faces'] = [
+        {
+            'bbox': [float(v) * scale for v in face.bbox],
+            'det_score': float(face.det_score),
+            'embedding': np.asarray(face.embedding, dtype=np.float32),
+            'rescue': None,
+        }
+        for face in faces
+    ]
+    return finalize_result(result, gallery)
+
+def error_result(result, error):
+    result['status'] = 'error'
+    result['error'] = str(error)
+    result.update(matches=[], low_quality=0, needs_rescue=[])
+    return result
+
+def analyze_decoded_batch(decoded, app_small, app_hd, gallery):
+    """
+    analyze_decoded for several photos at once: the photos routed to the same
+    engine go through one ``get_batch`` call (batched detector and recognizer
+    runs, see face_models.py).
+
+    Args:
+        decoded: [(img, scale, max_dim)] as returned by decode_for_analysis
+
+    Returns:
+        [result] in input order, as ``analyze_decoded`` returns them.
+    """
+    results = [None] * len(decoded)
+    by_engine = {}
+    for i, (img, scale, max_dim) in enumerate(decoded):
+        if img is None:
+            results[i] = analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+        else:
+            by_engine.setdefault(choose_engine(img, app_small, app_hd, max_dim), []).append(i)
+
+    for app, indices in by_engine.items():
+        try:
+            faces_per_image = app.get_batch([decoded[i][0] for i in indices])
+        except Exception:
+            # Re-run the batch photo by photo, so only the photo that fails is marked as an error
+            for i in indices:
+                img, scale, max_dim = decoded[i]
+                results[i] = analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+            continue
+        for i, faces in zip(indices, faces_per_image):
+            result = {'status': 'ok', 'engine': 'small' if app is app_small else 'hd', 'faces': [], 'error': None}
+            try:
+                results[i] = result_from_faces(result, faces, decoded[i][1], gallery)
+            except Exception as e:
+                results[i] = error_result(result, e)
+    return results
+
+def make_stats(names):
+    return {
+        'processed': 0,
+        'clear_matches': 0,
+        'recovered': 0,
+        'unknown': 0,
+        'no_faces': 0,
+        'low_quality_faces': 0,
+        'from_ledger': 0,
+        'rescue_faces': 0,
+        'rescue_images': 0,
+        'rescue_skipped': 0,
+        'rescue_seconds': 0.0,
+        'rescue_cache_hits': 0,
+        'rescue_cache_near_hits': 0,
+        'rescue_cache_misses': 0,
+        'duplicates_fanned_out': 0,
+        'duplicates_skipped': 0,
+        'person_counts': {name: 0 for name in names}
+    }
+
+def place_early(filename, img_path, result, placer):
+    """
+    Place the matches an image already has while its doubt-zone faces wait for the
+    rescue stage. Stats are only counted later by place_result.
+
+    Returns:
+        Set of person names placed successfully.
+    """
+    placed = set()
+    for _, person_name in result['matches']:
+        if person_name in placed:
+            continue
+        person_dir = os.path.join(OUTPUT_DIR, person_name)
+        os.makedirs(person_dir, exist_ok=True)
+        try:
+            placer.place(img_path, os.path.join(person_dir, filename), person_name)
+            placed.add(person_name)
+        except Exception as e:
+            # Retried when the image is finalized after the rescue stage
+            print(f"[ERROR] Failed to place {filename} in {person_name}: {e}")
+    return placed
+
+def place_result(filename, img_path, result, stats, placer, already_placed=()):
+    """
+    Place one analyzed photo into its person folders (or Unknown) and update stats.
+    Persons in ``already_placed`` were written by place_early and are only counted.
+    """
+    if result['status'] == 'error':
+        print(f"[ERROR] Failed to process {filename}: {result['error']}")
+        return
+    if result['status'] == 'unreadable':
+        return
+    if result.get('from_ledger'):
+        stats['from_ledger'] += 1
+    if result['status'] == 'no_faces':
+        stats['no_faces'] += 1
+        return
+
+    stats['processed'] += 1
+    stats['low_quality_faces'] += result['low_quality']
+    image_matched = False
+    placed = set()
+
+    for kind, person_name in result['matches']:
+        # Several faces of the same person in one photo -> one placement
+        if person_name in placed:
+            continue
+        person_dir = os.path.join(OUTPUT_DIR, person_name)
+        os.makedirs(person_dir, exist_ok=True)
+        dest_path = os.path.join(person_dir, filename)
+
+        try:
+            if person_name not in already_placed:
+                placer.place(img_path, dest_path, person_name)
+            placed.add(person_name)
+            stats['person_counts'][person_name] += 1
+            if kind == 'recovered':
+                stats['recovered'] += 1
+                image_matched = True
+            elif not image_matched:
+                stats['clear_matches'] += 1
+                image_matched = True
+        except Exception as e:
+            label = "recovered " if kind == 'recovered' else ""
+            print(f"[ERROR] Failed to place {label}{filename} in {person_name}: {e}")
+
+    # If no face in this image produced a match, save to Unknown
+    if image_matched:
+        # Placed in Unknown by an earlier run whose rescue was deferred
+        try:
+            placer.remove(os.path.join(OUTPUT_DIR, "Unknown", filename))
+        except Exception as e:
+            print(f"[WARN] Failed to remove stale Unknown copy of {filename}: {e}")
+    else:
+        unknown_dir = os.path.join(OUTPUT_DIR, "Unknown")
+        dest_path = os.path.join(unknown_dir, filename)
+        try:
+            placer.place(img_path, dest_path, "Unknown")
+        except Exception as e:
+            print(f"[ERROR] Failed to place {filename} in Unknown: {e}")
+        stats['unknown'] += 1
+
+def complete_rescues(img, result, app_small, app_hd, gfpgan, gallery, cache=None):
+    """
+    Restore the doubt-zone faces listed in 'needs_rescue' and re-decide the image.
+    Rescue cache hits/misses for this image are returned in 'rescue_cache'.
+    """
+    before = cache.counters() if cache is not None else None
+    if img is not None:
+        app = app_small if result['engine'] == 'small' else app_hd
+        for i in result['needs_rescue']:
+            result['faces'][i]['rescue'] = rescue_face(img, result['faces'][i], app, gfpgan,
+                                                       engine=result['engine'], cache=cache)
+    if cache is not None:
+        after = cache.counters()
+        result['rescue_cache'] = {k: after[k] - before[k] for k in after}
+    return finalize_result(result, gallery)
+
+def rescue_priority(result, gallery):
+    """Gap between STRICT_THRESHOLD and the best doubt-zone face; faces closest to a clear match go first."""
+    _, sims, _ = gallery.match([result['faces'][i]['embedding'] for i in result['needs_rescue']])
+    return float(STRICT_THRESHOLD - np.max(sims))
+
+def plan_from_ledger(images, ledger, gallery):
+    """
+    Split the images into ledger hits that need no models, ledger hits that only need
+    GFPGAN for newly doubtful faces, and images that must be analyzed from scratch.
+
+    Returns:
+        (ready, pending_rescue): dicts filename -> decided ledger result.
+    """
+    ready = {}
+    pending_rescue = {}
+    for filename in images:
+        cached = ledger.lookup(os.path.join(NEW_PHOTOS_DIR, filename))
+        if cached is None:
+            continue
+        finalize_result(cached, gallery)
+        if cached['needs_rescue']:
+            pending_rescue[filename] = cached
+        else:
+            ready[filename] = cached
+    return ready, pending_rescue
+
+class RescueQueue:
+    """
+    Images with doubt-zone faces, held back from final placement until the rescue
+    stage has run. Their clear matches are placed as soon as they are queued.
+    """
+
+    def __init__(self, gallery):
+        self.gallery = gallery
+        self.entries = []
+
+    def push(self, filename, result, already_placed):
+        self.entries.append((rescue_priority(result, self.gallery), len(self.entries), filename, result, already_placed))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def drain(self):
+        """Entries in rescue order (smallest gap to a clear match first)."""
+        entries = sorted(self.entries, key=lambda e: e[:2])
+        self.entries = []
+        return [(filename, result, already_placed) for _, _, filename, result, already_placed in entries]
+
+class PersonCompletion:
+    """
+    Tells ``listener(person)`` when a person's folder is final, so delivery can start
+    while sorting continues. After the main pass only images waiting for the rescue
+    stage can still add photos; the best gallery candidates of their doubt-zone faces
+    are held back until those images are finalized, everyone else is released at
+    once. A photo that reaches a person already released (a recovered match, or the
+    duplicates of a queued image) reopens them, and they are released again by close().
+    """
+
+    def __init__(self, names, listener):
+        self.names = names
+        self.listener = listener
+        self.released = set()
+        self.reopened = set()
+        self.waiting = {}  # person -> queued images that may still add a photo
+        self.candidates = {}  # filename -> persons held back for it
+
+    def main_pass_done(self, entries, gallery):
+        for filename, result, _ in entries:
+            names, _, _ = gallery.match([result['faces'][i]['embedding'] for i in result['needs_rescue']])
+            held = {name for name in names if name is not None}
+            self.candidates[filename] = held
+            for name in held:
+                self.waiting[name] = self.waiting.get(name, 0) + 1
+        for name in self.names:
+            if not self.waiting.get(name):
+                self._release(name)
+
+    def finalized(self, filename, result, already_placed=(), fanned_out=False):
+        """
+        Account for a queued image that has its final decision.
+
+        Args:
+            already_placed: Persons place_early wrote this image to before release; no new photo
+            fanned_out: Whether duplicates of the image were placed, which is new for every match
+        """
+        for _, name in result['matches']:
+            if name in self.released and (fanned_out or name not in already_placed):
+                self.reopened.add(name)
+        for name in self.candidates.pop(filename, ()):
+            self.waiting[name] -= 1
+            if not self.waiting[name]:
+                self._release(name)
+
+    def _release(self, name):
+        self.released.add(name)
+        self.listener(name)
+
+    def close(self):
+        for name in sorted(self.reopened):
+            print(f"[WARN] {name} received a rescued photo after being released; releasing again")
+            self.listener(name)
+        for name, count in self.waiting.items():
+            if count and name not in self.released:
+                self._release(name)
+
+def run_rescue_stage(entries, submit, finish, stats, budget_seconds=None, max_faces=None, window=1):
+    """
+    Rescue queued images in priority order until the time or face budget runs out.
+
+    Rescue work is only handed out for the entries the budget admits, so skipped
+    entries cost no GFPGAN time in any mode; images are finished in entry order.
+
+    Args:
+        entries: (filename, result, already_placed) in rescue order (RescueQueue.drain)
+        submit: submit(filename, result) starts the rescue of one admitted entry and
+            returns a callable that waits for and returns the rescued result
+        finish: finish(filename, result, already_placed, rescued) places the image
+        budget_seconds: Wall-clock budget for the stage (None = unlimited)
+        max_faces: Maximum number of faces restored (None = unlimited)
+        window: Entries in flight at once (worker processes rescue that many ahead)
+    """
+    start = time.perf_counter()
+    pending = collections.deque()  # (filename, result, already_placed, faces, wait for the rescue or None if skipped)
+    admitted_faces = 0
+
+    def complete_oldest():
+        filename, result, already_placed, faces, wait = pending.popleft()
+        if wait is None:
+            finish(filename, result, already_placed, rescued=False)
+            return
+        rescued = wait()
+        # Faces still listed afterwards could not be rescued (GFPGAN unavailable)
+        stats['rescue_faces'] += faces - len(rescued['needs_rescue'])
+        stats['rescue_skipped'] += len(rescued['needs_rescue'])
+        for counter, value in rescued.pop('rescue_cache', {}).items():
+            stats['rescue_cache_' + counter] += value
+        stats['rescue_images'] += 1
+        finish(filename, rescued, already_placed, rescued=True)
+
+    for filename, result, already_placed in entries:
+        while len(pending) >= max(1, window):
+            complete_oldest()
+        faces = len(result['needs_rescue'])
+        over_time = budget_seconds is not None and time.perf_counter() - start >= budget_seconds
+        over_faces = max_faces is not None and admitted_faces + faces > max_faces
+        if over_time or over_faces:
+            # Left for the next run: the ledger still lists these faces as not rescued
+            stats['rescue_skipped'] += faces
+            pending.append((filename, result, already_placed, faces, None))
+            continue
+        admitted_faces += faces
+        pending.append((filename, result, already_placed, faces, submit(filename, result)))
+    while pending:
+        complete_oldest()
+    stats['rescue_seconds'] += time.perf_counter() - start
+
+# Per-process state for --workers mode: each worker loads the models and maps the gallery once
+_worker_state = {}
+
+def analysis_variant(reduced_floor):
+    """Ledger and rescue cache tag of the configured models and the decode mode; other variants are not reused."""
+    return f"{model_variant()}-decode:{'full' if reduced_floor is None else reduced_floor}"
+
+def _init_worker(rescue_cache_size, reduced_floor, runtime):
+    configure_runtime(runtime)
+    gallery = attach_ann_index(load_embeddings())
+    app_small, app_hd, gfpgan = initialize_models()
+    cache = (RescueCache(RESCUE_CACHE_PATH, rescue_cache_size, variant=analysis_variant(reduced_floor))
+             if rescue_cache_size else None)
+    _worker_state.update(gallery=gallery, app_small=app_small, app_hd=app_hd, gfpgan=gfpgan,
+                         rescue_cache=cache, reduced_floor=reduced_floor)
+
+def _analyze_in_worker(filename):
+    img_path = os.path.join(NEW_PHOTOS_DIR, filename)
+    return filename, analyze_image(img_path, _worker_state['app_small'], _worker_state['app_hd'], _worker_state['gallery'],
+                                   reduced_floor=_worker_state['reduced_floor'])
+
+def _rescue_in_worker(filename, result):
+    img = decode_image(os.path.join(NEW_PHOTOS_DIR, filename))
+    return complete_rescues(img, result, _worker_state['app_small'], _worker_state['app_hd'],
+                            _worker_state['gfpgan'], _worker_state['gallery'], cache=_worker_state['rescue_cache'])
+
+def open_worker_pool(workers, tasks, rescue_cache_size, reduced_floor):
+    # spawn, not fork: CUDA and onnxruntime sessions must not be inherited by children
+    ctx = multiprocessing.get_context("spawn")
+    return ctx.Pool(processes=max(1, min(workers, tasks)), initializer=_init_worker,
+                    initargs=(rescue_cache_size, reduced_floor, runtime_settings()))
+
+def iter_results_parallel(pool, images, workers, ready, pending_rescue):
+    """Shard the images that need detection across the pool; results come back in input order."""
+    tasks = [f for f in images if f not in ready and f not in pending_rescue]
+    chunksize = max(1, min(16, len(tasks) // (workers * 8)))
+    analyzed = pool.imap(_analyze_in_worker, tasks, chunksize=chunksize) if tasks else iter(())
+    for filename in images:
+        if filename in ready:
+            yield filename, ready[filename]
+        elif filename in pending_rescue:
+            yield filename, pending_rescue[filename]
+        else:
+            yield next(analyzed)
+
+def run_staged(images, gallery, decode_threads, queue_size, ready, pending_rescue, ledger, handle, reduced_floor,
+               load_models=initialize_models, batch_size=1, batch_wait_ms=0.0):
+    """
+    Single-process mode: overlap decoding, detection and file placement (see pipeline.py).
+    With ``batch_size`` > 1, up to that many decoded photos (those ready within
+    ``batch_wait_ms`` of the first) are analyzed together by analyze_decoded_batch.
+
+    Returns:
+        (pipeline report, models or None when every image came from the ledger)
+    """
+    # Models are only loaded when some image is missing from the ledger or needs a rescue
+    models = load_models() if len(ready) < len(images) else None
+    from tqdm import tqdm
+
+    progress = tqdm(total=len(images), desc="Processing images")
+
+    def decode(filename):
+        if filename in ready or filename in pending_rescue:
+            return None
+        return decode_for_analysis(os.path.join(NEW_PHOTOS_DIR, filename), reduced_floor)
+
+    def infer(filename, decoded):
+        if filename in ready:
+            return ready[filename]
+        if filename in pending_rescue:
+            return pending_rescue[filename]
+        img, scale, max_dim = decoded
+        result = analyze_decoded(img, models[0], models[1], gallery, scale=scale, max_dim=max_dim)
+        if ledger is not None:
+            ledger.record(os.path.join(NEW_PHOTOS_DIR, filename), result)
+        return result
+
+    def infer_batch(filenames, decoded):
+        todo = [i for i, filename in enumerate(filenames) if filename not in ready and filename not in pending_rescue]
+        analyzed = {}
+        if todo:
+            analyzed = dict(zip(todo, analyze_decoded_batch([decoded[i] for i in todo], models[0], models[1], gallery)))
+        results = []
+        for i, filename in enumerate(filenames):
+            if i not in analyzed:
+                results.append(infer(filename, decoded[i]))
+                continue
+            if ledger is not None:
+                ledger.record(os.path.join(NEW_PHOTOS_DIR, filename), analyzed[i])
+            results.append(analyzed[i])
+        return results
+
+    def output(filename, result):
+        handle(filename, result)
+        progress.update(1)
+
+    try:
+        report = run_pipeline(images, decode, infer, output, decode_threads=decode_threads, queue_size=queue_size,
+                              infer_batch_fn=infer_batch, batch_size=batch_size, batch_wait=batch_wait_ms / 1000)
+    finally:
+        progress.close()
+    return report, models
 
-    return app_small, app_hd, gfpgan_model
+def process_new_photos(workers=1, decode_threads=2, queue_size=8, use_ledger=True, reanalyze=False,
+                       save_faces=False, placement="copy", rescue_budget=None, rescue_max_faces=None,
+                       rescue_cache_size=DEFAULT_RESCUE_CACHE_SIZE, full_decode=False, dedup="off",
+                       batch_size=1, batch_wait_ms=DEFAULT_BATCH_WAIT_MS, load_models=initialize_models,
+                       on_person_final=None):
+    """
+    Sort Data/new_photos into person folders (see the CLI flags below for the options).
 
-def process_new_photos():
-    embeddings_db = load_embeddings()
-    ensure_output_dirs(embeddings_db.keys())
+    Args:
+        load_models: Returns (app_small, app_hd, gfpgan) for single-process mode, e.g. models
+            already loaded by the caller (run_system.py shares them with enrollment)
+        on_person_final: Called with a person's name once no more photos can be placed in
+            their folder (see PersonCompletion); lets delivery overlap the rescue stage
+    """
+    gallery = attach_ann_index(load_embeddings())
+    ensure_output_dirs(gallery.names)
 
     if not os.path.isdir(NEW_PHOTOS_DIR):
         print(f"[ERROR] New photos folder not found: {NEW_PHOTOS_DIR}")
@@ -179,141 +792,291 @@ def process_new_photos():
         return
 
     print(f"[INFO] Found {len(images)} images to process")
-    print(f"[INFO] Searching for {len(embeddings_db)} known people")
+
+    # Duplicates are analyzed once (their representative) and get its decision
+    fingerprints = Fingerprints(DUPLICATE_GROUPS_PATH)
+    all_images = images
+    images, duplicate_groups = find_duplicates(NEW_PHOTOS_DIR, all_images, dedup, fingerprints)
+    if dedup != "off":
+        print(f"[INFO] Duplicates ({dedup}): {len(all_images) - len(images)} photos in {len(duplicate_groups)} groups "
+              f"reuse another photo's result ({fingerprints.hashed} files hashed)")
+    duplicate_decisions = {}
+    print(f"[INFO] Searching for {len(gallery.names)} known people")
     print(f"[INFO] Thresholds: Strict={STRICT_THRESHOLD}, Doubt={DOUBT_THRESHOLD}, Quality Gate={QUALITY_GATE_SCORE}")
     print(f"[INFO] Dual-Engine: app_small (320x320) for images < 800px, app_hd (640x640) for images >= 800px")
+    if batch_size > 1 and workers <= 1:
+        print(f"[INFO] Batched inference: up to {batch_size} photos per engine call (max wait {batch_wait_ms:.0f} ms)")
 
-    app_small, app_hd, gfpgan_model = initialize_models()
+    # Large JPEGs are decoded at 1/2-1/8 scale for detection; rescue crops always use full resolution
+    reduced_floor = None if full_decode else REDUCED_DECODE_FLOOR
+    variant = analysis_variant(reduced_floor)
+    ledger = ResultsLedger(LEDGER_PATH, variant=variant) if use_ledger else None
+    ready, pending_rescue = {}, {}
+    if ledger is not None and not reanalyze:
+        ready, pending_rescue = plan_from_ledger(images, ledger, gallery)
+        print(f"[INFO] Ledger: {len(ready)} images reused without inference, {len(pending_rescue)} need GFPGAN only, "
+              f"{len(images) - len(ready) - len(pending_rescue)} to analyze")
 
-    stats = {
-        'processed': 0,
-        'clear_matches': 0,
-        'recovered': 0,
-        'unknown': 0,
-        'no_faces': 0,
-        'low_quality_faces': 0,
-        'person_counts': {name: 0 for name in embeddings_db.keys()}
-    }
+    stats = make_stats(gallery.names)
+    placer = Placer(placement, manifest_path=PLACEMENT_MANIFEST_PATH)
+    if placement != "copy":
+        print(f"[INFO] Placement mode: {placement}")
 
-    for filename in tqdm(images, desc="Processing images"):
+    face_cache = FaceCacheWriter() if save_faces else None
+    rescue_queue = RescueQueue(gallery)
+    completion = PersonCompletion(gallery.names, on_person_final) if on_person_final is not None else None
+
+    def finish(filename, result, already_placed=(), rescued=False):
         img_path = os.path.join(NEW_PHOTOS_DIR, filename)
+        if ledger is not None:
+            if rescued:
+                ledger.record(img_path, result)
+            else:
+                ledger.update_decision(img_path, result['matches'])
+        if face_cache is not None:
+            face_cache.add(filename, result)
+        place_result(filename, img_path, result, stats, placer, already_placed)
+        fanned_out = fan_out(filename, result)
+        if completion is not None:
+            completion.finalized(filename, result, already_placed, fanned_out)
 
-        try:
-            img = cv2.imread(img_path)
-            if img is None:
+    def fan_out(filename, result):
+        """Place the duplicates of an image with its decision; True if any member was placed."""
+        group = duplicate_groups.get(filename)
+        if group is None:
+            return False
+        fanned_out = False
+        duplicate_decisions[filename] = sorted({name for _, name in result.get('matches', [])})
+        # Members share the decision, hence the folders: identical bytes are placed once
+        placed_bytes = {group['sha256']}
+        for member in group['members']:
+            if member['sha256'] in placed_bytes:
+                stats['duplicates_skipped'] += 1
                 continue
+            placed_bytes.add(member['sha256'])
+            stats['duplicates_fanned_out'] += 1
+            fanned_out = True
+            if face_cache is not None:
+                face_cache.add(member['file'], result)
+            place_result(member['file'], os.path.join(NEW_PHOTOS_DIR, member['file']), result, stats, placer)
+        return fanned_out
+
+    def handle(filename, result):
+        # Clear matches reach disk now; doubt-zone faces wait for the rescue stage
+        if result['needs_rescue']:
+            already_placed = place_early(filename, os.path.join(NEW_PHOTOS_DIR, filename), result, placer)
+            rescue_queue.push(filename, result, already_placed)
+        else:
+            finish(filename, result)
+
+    def rescue(submit, window=1, max_faces=rescue_max_faces):
+        entries = rescue_queue.drain()
+        if completion is not None:
+            completion.main_pass_done(entries, gallery)
+        if not entries:
+            return
+        faces = sum(len(result['needs_rescue']) for _, result, _ in entries)
+        print(f"[INFO] Rescue stage: {faces} doubt-zone faces in {len(entries)} images")
+        run_rescue_stage(entries, submit, finish, stats, budget_seconds=rescue_budget, max_faces=max_faces,
+                         window=window)
+
+    # Final placement of images without doubt-zone faces happens in input order; the
+    # rescue stage then finalizes the rest, so every mode produces the same output
+    pipeline_report = None
+    try:
+        if workers > 1:
+            from tqdm import tqdm
 
-            # Smart routing: Choose app based on image dimensions
-            h, w = img.shape[:2]
-            max_dim = max(h, w)
-            
-            if max_dim < 800:
-                # Low-res image -> use app_small
-                app = app_small
+            print(f"[INFO] Parallel mode: {workers} worker processes (models loaded once per worker)")
+            pool = None
+            if len(ready) < len(images):
+                pool = open_worker_pool(workers, len(images) - len(ready), rescue_cache_size, reduced_floor)
+            try:
+                for filename, result in tqdm(iter_results_parallel(pool, images, workers, ready, pending_rescue),
+                                             total=len(images), desc="Processing images"):
+                    if ledger is not None and filename not in ready and filename not in pending_rescue:
+                        ledger.record(os.path.join(NEW_PHOTOS_DIR, filename), result)
+                    handle(filename, result)
+                # Handed to the pool only once admitted; a few run ahead to keep the workers busy
+                rescue(lambda filename, result: pool.apply_async(_rescue_in_worker, (filename, result)).get,
+                       window=2 * workers)
+            finally:
+                if pool is not None:
+                    pool.terminate()
+        else:
+            pipeline_report, models = run_staged(images, gallery, decode_threads, queue_size,
+                                                 ready, pending_rescue, ledger, handle, reduced_floor,
+                                                 load_models=load_models, batch_size=batch_size,
+                                                 batch_wait_ms=batch_wait_ms)
+            rescue_cache = (RescueCache(RESCUE_CACHE_PATH, rescue_cache_size, variant=variant)
+                            if rescue_cache_size and rescue_queue else None)
+
+            def submit_rescue(filename, result):
+                # Runs when run_rescue_stage collects it, so only admitted entries are restored
+                return lambda: complete_rescues(decode_image(os.path.join(NEW_PHOTOS_DIR, filename)), result,
+                                                *models, gallery, cache=rescue_cache)
+
+            try:
+                rescue(submit_rescue)
+            finally:
+                if rescue_cache is not None:
+                    rescue_cache.close()
+    finally:
+        if ledger is not None:
+            ledger.close()
+        placer.close()
+        if dedup != "off":
+            fingerprints.keep_only(all_images)
+            save_duplicate_groups(DUPLICATE_GROUPS_PATH, fingerprints, dedup, duplicate_groups, duplicate_decisions)
+
+    if completion is not None:
+        completion.close()
+
+    if face_cache is not None:
+        face_cache.save(FACE_CACHE_PATH)
+        print(f"[SAVED] Face cache for offline re-sorting: {FACE_CACHE_PATH} ({len(face_cache)} images)")
+
+    print_summary(stats, placer=placer)
+    if pipeline_report is not None:
+        print_pipeline_report(pipeline_report)
+
+def watch_new_photos(placement="copy", use_ledger=True, poll_interval=None, settle_seconds=0.5,
+                     target_latency=None, rescue_cache_size=DEFAULT_RESCUE_CACHE_SIZE, full_decode=False,
+                     dedup="off", report_every=25):
+    """
+    Streaming mode: keep the models and gallery in memory and sort every photo as
+    soon as it has been completely written to Data/new_photos. Photos already in
+    the folder are sorted first. Runs until interrupted (Ctrl+C).
+
+    Args:
+        poll_interval: Rescan the folder every N seconds instead of using inotify
+        settle_seconds: How long a file's size and mtime must hold still
+        target_latency: Warn about photos sorted later than this after arrival
+        dedup: 'off' or identical-bytes skipping ('near' needs the whole batch and is treated as 'exact')
+        report_every: Print latency percentiles after every N photos
+    """
+    gallery = attach_ann_index(load_embeddings())
+    ensure_output_dirs(gallery.names)
+    os.makedirs(NEW_PHOTOS_DIR, exist_ok=True)
+
+    # Everything is loaded up front, so the first photo does not pay for it
+    app_small, app_hd, gfpgan = initialize_models()
+    gfpgan.get()
+
+    reduced_floor = None if full_decode else REDUCED_DECODE_FLOOR
+    variant = analysis_variant(reduced_floor)
+    ledger = ResultsLedger(LEDGER_PATH, variant=variant) if use_ledger else None
+    rescue_cache = RescueCache(RESCUE_CACHE_PATH, rescue_cache_size, variant=variant) if rescue_cache_size else None
+    placer = Placer(placement, manifest_path=PLACEMENT_MANIFEST_PATH)
+    stats = make_stats(gallery.names)
+    seen_bytes = {}
+    latency = LatencyStats()
+
+    def finish(filename, result, already_placed=(), rescued=False):
+        img_path = os.path.join(NEW_PHOTOS_DIR, filename)
+        if ledger is not None:
+            if rescued:
+                ledger.record(img_path, result)
             else:
-                # HD/4K image -> use app_hd
-                app = app_hd
+                ledger.update_decision(img_path, result['matches'])
+        place_result(filename, img_path, result, stats, placer, already_placed)
 
-            faces = app.get(img)
-            if not faces:
-                stats['no_faces'] += 1
-                continue
+    def submit_rescue(filename, result):
+        return lambda: complete_rescues(decode_image(os.path.join(NEW_PHOTOS_DIR, filename)), result, app_small, app_hd,
+                                        gfpgan, gallery, cache=rescue_cache)
 
-            stats['processed'] += 1
-            image_matched = False
+    def sort_one(filename):
+        img_path = os.path.join(NEW_PHOTOS_DIR, filename)
+        digest = None
+        if dedup != "off":
+            digest = file_sha256(img_path)
+            if seen_bytes.get(digest, filename) != filename:
+                stats['duplicates_skipped'] += 1
+                print(f"[SKIP] {filename}: identical to {seen_bytes[digest]}")
+                return
 
-            for face in faces:
-                if face.det_score < QUALITY_GATE_SCORE:
-                    stats['low_quality_faces'] += 1
-                    continue
+        result = ledger.lookup(img_path) if ledger is not None else None
+        if result is not None:
+            finalize_result(result, gallery)
+        else:
+            img, scale, max_dim = decode_for_analysis(img_path, reduced_floor)
+            result = analyze_decoded(img, app_small, app_hd, gallery, scale=scale, max_dim=max_dim)
+            if ledger is not None:
+                ledger.record(img_path, result)
+
+        if result['needs_rescue']:
+            # Rescued right away: there is no end of the batch to defer it to
+            run_rescue_stage([(filename, result, ())], submit_rescue, finish, stats)
+        else:
+            finish(filename, result)
+        if ledger is not None:
+            ledger.commit()
+        # Only a sorted photo stands in for its copies; a failed one is retried when a copy arrives
+        if digest is not None and result['status'] not in ('error', 'unreadable'):
+            seen_bytes[digest] = filename
+
+    watcher = open_watcher(NEW_PHOTOS_DIR, poll_interval)
+    tracker = ArrivalTracker(NEW_PHOTOS_DIR, settle_seconds, require_close=watcher.mode == "inotify")
+    tracker.scan()
+    print(f"[INFO] Watching {NEW_PHOTOS_DIR} ({watcher.mode}, settle {settle_seconds}s); press Ctrl+C to stop")
 
-                embedding = face.embedding
-                best_name, best_similarity = find_best_match(embedding, embeddings_db)
-
-                if best_similarity >= STRICT_THRESHOLD:
-                    person_dir = os.path.join(OUTPUT_DIR, best_name)
-                    os.makedirs(person_dir, exist_ok=True)
-                    dest_path = os.path.join(person_dir, filename)
-                    
-                    if not os.path.exists(dest_path):
-                        try:
-                            shutil.copy2(img_path, dest_path)
-                            stats['person_counts'][best_name] += 1
-                            if not image_matched:
-                                stats['clear_matches'] += 1
-                                image_matched = True
-                        except Exception as e:
-                            print(f"[ERROR] Failed to copy {filename} to {best_name}: {e}")
-
-                elif best_similarity >= DOUBT_THRESHOLD:
-                    # Unsure zone -> Smart Rescue with GFPGAN
-                    if gfpgan_model is None:
-                        # No restoration available; treat as unknown/ignored
-                        continue
-
-                    try:
-                        face_crop = crop_face(img, face.bbox)
-                        if face_crop.size == 0:
-                            continue
-
-                        restored_face = restore_face_with_gfpgan(gfpgan_model, face_crop)
-                        if restored_face is None:
-                            continue
-
-                        # Re-detect on restored face using the same app that detected it initially
-                        restored_faces = app.get(restored_face)
-                        if restored_faces:
-                            restored_face_obj = max(restored_faces, key=lambda f: f.det_score)
-                            if restored_face_obj.det_score >= QUALITY_GATE_SCORE:
-                                restored_embedding = restored_face_obj.embedding
-                                restored_name, restored_similarity = find_best_match(restored_embedding, embeddings_db)
-
-                                if restored_similarity >= STRICT_THRESHOLD:
-                                    person_dir = os.path.join(OUTPUT_DIR, restored_name)
-                                    os.makedirs(person_dir, exist_ok=True)
-                                    dest_path = os.path.join(person_dir, filename)
-                                    
-                                    if not os.path.exists(dest_path):
-                                        try:
-                                            shutil.copy2(img_path, dest_path)
-                                            stats['person_counts'][restored_name] += 1
-                                            stats['recovered'] += 1
-                                            image_matched = True
-                                        except Exception as e:
-                                            print(f"[ERROR] Failed to copy recovered {filename} to {restored_name}: {e}")
-
-                    except Exception as e:
-                        # Any error in rescue path -> just ignore this face
-                        continue
-
-                else:
-                    # similarity < DOUBT_THRESHOLD -> treat as stranger (ignored)
+    try:
+        while True:
+            for filename, first_seen in tracker.ready():
+                try:
+                    sort_one(filename)
+                except Exception as e:
+                    print(f"[ERROR] Failed to sort {filename}: {e}")
                     continue
+                elapsed = time.monotonic() - first_seen
+                latency.add(elapsed)
+                if target_latency is not None and elapsed > target_latency:
+                    print(f"[WARN] {filename} sorted {elapsed:.2f}s after arrival (target {target_latency}s)")
+                if len(latency) % report_every == 0:
+                    print(f"[INFO] Latency: {latency.summary()}")
 
-            # If no face in this image produced a match, save to Unknown
-            if not image_matched:
-                unknown_dir = os.path.join(OUTPUT_DIR, "Unknown")
-                dest_path = os.path.join(unknown_dir, filename)
-                if not os.path.exists(dest_path):
-                    try:
-                        shutil.copy2(img_path, dest_path)
-                    except Exception as e:
-                        print(f"[ERROR] Failed to copy {filename} to Unknown: {e}")
-                stats['unknown'] += 1
+            names, closed = watcher.wait(tracker.next_timeout())
+            if names is None:
+                tracker.scan()
+            else:
+                tracker.touch(names - closed)
+                tracker.touch(closed, closed=True)
+    except KeyboardInterrupt:
+        print("\n[INFO] Watch mode stopped.")
+    finally:
+        watcher.close()
+        if rescue_cache is not None:
+            rescue_cache.close()
+        if ledger is not None:
+            ledger.close()
+        placer.close()
 
-        except Exception as e:
-            print(f"[ERROR] Failed to process {filename}: {e}")
-            continue
+    print_summary(stats, placer=placer)
+    print(f"[LATENCY] Arrival to sorted: {latency.summary()}")
 
+def print_summary(stats, strict_threshold=STRICT_THRESHOLD, placer=None):
     print("\n" + "="*60)
     print("[FINAL SUMMARY REPORT]")
     print("="*60)
     print(f"Total images processed: {stats['processed']}")
-    print(f"Clear matches (>= {STRICT_THRESHOLD}): {stats['clear_matches']}")
+    print(f"Clear matches (>= {strict_threshold}): {stats['clear_matches']}")
     print(f"Recovered via GFPGAN: {stats['recovered']}")
     print(f"Unknown images: {stats['unknown']}")
     print(f"Images with no faces: {stats['no_faces']}")
     print(f"Low quality faces skipped: {stats['low_quality_faces']}")
+    print(f"Reused from results ledger (no inference): {stats['from_ledger']}")
+    if stats['rescue_faces'] or stats['rescue_skipped']:
+        print(f"Rescue stage: {stats['rescue_faces']} faces in {stats['rescue_images']} images, "
+              f"{stats['rescue_seconds']:.2f}s ({stats['rescue_skipped']} faces left for the next run)")
+    if stats['rescue_cache_hits'] or stats['rescue_cache_misses']:
+        print(f"Rescue cache: {stats['rescue_cache_hits']} hits ({stats['rescue_cache_near_hits']} near-duplicate), "
+              f"{stats['rescue_cache_misses']} misses")
+    if stats.get('duplicates_fanned_out') or stats.get('duplicates_skipped'):
+        print(f"Duplicates: {stats['duplicates_skipped']} identical copies skipped, "
+              f"{stats['duplicates_fanned_out']} near-duplicates sorted with their group's decision")
+    if placer is not None:
+        methods = ", ".join(f"{method}: {count}" for method, count in sorted(placer.methods.items()))
+        print(f"Placement ({placer.mode}): {placer.seconds:.2f}s" + (f" ({methods})" if methods else ""))
     print(f"\nTotal matched: {stats['clear_matches'] + stats['recovered']}")
     print(f"Match rate: {(stats['clear_matches'] + stats['recovered']) / max(stats['processed'], 1) * 100:.2f}%")
     print("\n[PERSON BREAKDOWN]")
@@ -323,6 +1086,63 @@ def process_new_photos():
     print("="*60)
 
 if __name__ == "__main__":
-    print("[INFO] Starting Smart Pipeline processing...")
-    process_new_photos()
+    parser = argparse.ArgumentParser(description="Sort new event photos into person folders")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for detection/matching (each loads its own models)")
+    parser.add_argument("--decode-threads", type=int, default=2,
+                        help="Single-process mode: threads decoding/prefetching images ahead of inference")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="Single-process mode: capacity of each inter-stage queue (caps images held in memory)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Single-process mode: photos per batched detector/recognizer call (1 = per photo)")
+    parser.add_argument("--batch-wait-ms", type=float, default=DEFAULT_BATCH_WAIT_MS,
+                        help="Single-process mode: how long a batch waits for more decoded photos before it runs")
+    parser.add_argument("--no-ledger", action="store_true",
+                        help="Do not read or write the per-image results ledger")
+    parser.add_argument("--reanalyze", action="store_true",
+                        help="Ignore ledger entries and run the models on every image (results are re-recorded)")
+    parser.add_argument("--save-faces", action="store_true",
+                        help="Also write every face's bbox, det_score and embedding to Data/face_cache.npz for resort.py")
+    parser.add_argument("--placement", choices=PLACEMENT_MODES, default="copy",
+                        help="How photos are placed in person folders (hardlink/reflink fall back to copy across filesystems)")
+    parser.add_argument("--rescue-budget", type=float, default=None,
+                        help="Seconds the GFPGAN rescue stage may run after the main pass (default: no limit)")
+    parser.add_argument("--rescue-max-faces", type=int, default=None,
+                        help="Maximum doubt-zone faces restored per run (default: no limit)")
+    parser.add_argument("--rescue-cache-size", type=int, default=DEFAULT_RESCUE_CACHE_SIZE,
+                        help="Entries kept in Data/rescue_cache.sqlite (least recently used evicted; 0 disables the cache)")
+    parser.add_argument("--full-decode", action="store_true",
+                        help=f"Always decode photos at full resolution (default: JPEGs larger than "
+                             f"{2 * REDUCED_DECODE_FLOOR}px are decoded at reduced scale for detection)")
+    parser.add_argument("--dedup", choices=DEDUP_MODES, default="off",
+                        help="Group duplicate photos before inference: identical bytes (exact) or also "
+                             "perceptually near-identical shots (near); groups go to Data/duplicate_groups.json "
+                             "(default: off, every file is analyzed and placed)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and sort photos as they arrive in Data/new_photos (Ctrl+C to stop)")
+    parser.add_argument("--poll-interval", type=float, default=None,
+                        help="Watch mode: rescan the folder every N seconds instead of using inotify")
+    parser.add_argument("--settle", type=float, default=0.5,
+                        help="Watch mode: seconds a new file's size must stay unchanged before it is sorted")
+    parser.add_argument("--target-latency", type=float, default=None,
+                        help="Watch mode: warn when a photo is sorted later than this many seconds after arrival")
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    configure_runtime(runtime_from_args(args))
+
+    if args.watch:
+        print("[INFO] Starting watch mode...")
+        watch_new_photos(placement=args.placement, use_ledger=not args.no_ledger, poll_interval=args.poll_interval,
+                         settle_seconds=max(0.0, args.settle), target_latency=args.target_latency,
+                         rescue_cache_size=max(0, args.rescue_cache_size), full_decode=args.full_decode,
+                         dedup=args.dedup)
+    else:
+        print("[INFO] Starting Smart Pipeline processing...")
+        process_new_photos(workers=args.workers, decode_threads=max(1, args.decode_threads),
+                           queue_size=max(1, args.queue_size), batch_size=max(1, args.batch_size),
+                           batch_wait_ms=max(0.0, args.batch_wait_ms), use_ledger=not args.no_ledger,
+                           reanalyze=args.reanalyze, save_faces=args.save_faces,
+                           placement=args.placement, rescue_budget=args.rescue_budget,
+                           rescue_max_faces=args.rescue_max_faces, rescue_cache_size=max(0, args.rescue_cache_size),
+                           full_decode=args.full_decode, dedup=args.dedup)
     print("[DONE] Processing completed.")
@@ -0,0 +1,186 @@
+"""
+Disk-backed cache of GFPGAN rescue results (SQLite), shared across runs.
+
+Entries are keyed by a SHA-1 of the face crop pixels, the engine that
+re-detects the restored face and the analysis variant (model set, ONNX
+Runtime options and decode mode); results of other variants are never reused. A 256-bit difference hash (dHash) of every
+cached crop is also kept, so a near-identical crop (burst shots, re-encoded
+uploads) within ``NEAR_MAX_DISTANCE`` bits reuses the stored result, provided
+the recognition embeddings of the two original (unrestored) faces agree to
+``NEAR_MIN_SOURCE_SIMILARITY``; low-resolution hashes alone cannot tell two
+similarly framed faces apart. A hit skips both ``restore_face_with_gfpgan``
+and the re-detection ``app.get``.
+
+The cache holds at most ``max_entries`` results; the least recently used
+ones are evicted first.
+"""
+
+import time
+import sqlite3
+import hashlib
+import numpy as np
+import cv2
+
+RESCUE_CACHE_SCHEMA_VERSION = 2
+DEFAULT_MAX_ENTRIES = 20000
+NEAR_MAX_DISTANCE = 8  # of 256 dHash bits
+NEAR_MIN_SOURCE_SIMILARITY = 0.9
+NEAR_MAX_CANDIDATES = 16  # closest hashes checked against the source embedding
+DHASH_SIZE = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS rescues (
+    key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    variant TEXT,
+    dhash BLOB NOT NULL,
+    source_embedding BLOB NOT NULL,
+    det_score REAL,
+    embedding BLOB,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rescues_last_used ON rescues (last_used);
+"""
+
+# Number of set bits for every byte value, for Hamming distances on packed hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _unit(vec):
+    vec = np.asarray(vec, dtype=np.float64).ravel()
+    norm = np.linalg.norm(vec)
+    return vec / norm if np.isfinite(norm) and norm > 0 else None
+
+def crop_key(crop, engine, variant=""):
+    digest = hashlib.sha1()
+    digest.update(f"{engine}:{variant}:{crop.shape}:".encode("ascii"))
+    digest.update(np.ascontiguousarray(crop).tobytes())
+    return digest.hexdigest()
+
+def dhash(crop):
+    """256-bit difference hash of a BGR crop, packed into 32 bytes."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, (DHASH_SIZE + 1, DHASH_SIZE), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+class RescueCache:
+    """SQLite-backed LRU of rescue results. Each process opens its own instance."""
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, variant=""):
+        self.path = path
+        self.max_entries = max_entries
+        self.variant = variant
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)",
+                              (str(RESCUE_CACHE_SCHEMA_VERSION),))
+        elif int(row[0]) == 1:
+            # Version 1 entries have no variant and are never reused; LRU eviction drops them
+            self.conn.execute("ALTER TABLE rescues ADD COLUMN variant TEXT")
+            self.conn.execute("UPDATE meta SET value = ? WHERE key = 'schema_version'",
+                              (str(RESCUE_CACHE_SCHEMA_VERSION),))
+        elif int(row[0]) != RESCUE_CACHE_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported rescue cache schema {row[0]} in {path}")
+        self.conn.commit()
+
+        # Hashes of this variant's entries present at open time, for near-duplicate lookups
+        rows = self.conn.execute("SELECT key, engine, dhash FROM rescues WHERE variant = ?", (variant,)).fetchall()
+        self._keys = [key for key, _, _ in rows]
+        self._engines = np.array([engine for _, engine, _ in rows], dtype=object)
+        self._hashes = (np.frombuffer(b"".join(h for _, _, h in rows), dtype=np.uint8).reshape(-1, DHASH_SIZE * DHASH_SIZE // 8)
+                        if rows else np.zeros((0, DHASH_SIZE * DHASH_SIZE // 8), dtype=np.uint8))
+
+    def _near_row(self, crop_hash, engine, source_embedding):
+        if not len(self._keys):
+            return None, None
+        distances = _POPCOUNT[np.bitwise_xor(self._hashes, crop_hash)].sum(axis=1, dtype=np.int32)
+        distances[self._engines != engine] = NEAR_MAX_DISTANCE + 1
+        source = _unit(source_embedding)
+
+        for idx in np.argsort(distances, kind="stable")[:NEAR_MAX_CANDIDATES]:
+            if distances[idx] > NEAR_MAX_DISTANCE:
+                break
+            key = self._keys[idx]
+            row = self.conn.execute(
+                "SELECT det_score, embedding, source_embedding FROM rescues WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                continue  # evicted since this process opened the cache
+            cached_source = _unit(np.frombuffer(row[2], dtype=np.float32))
+            if source is not None and cached_source is not None and float(source @ cached_source) >= NEAR_MIN_SOURCE_SIMILARITY:
+                return key, row[:2]
+        return None, None
+
+    def get(self, crop, engine, source_embedding):
+        """
+        Look up the rescue of a crop whose original face has ``source_embedding``.
+
+        Returns:
+            {'hit': True, 'det_score', 'embedding'} on a hit, otherwise
+            {'hit': False, ...} to be passed back to put() with the computed result.
+        """
+        key = crop_key(crop, engine, self.variant)
+        row = self.conn.execute("SELECT det_score, embedding FROM rescues WHERE key = ?", (key,)).fetchone()
+        crop_hash = None
+        if row is None:
+            crop_hash = dhash(crop)
+            near_key, row = self._near_row(crop_hash, engine, source_embedding)
+            if row is not None:
+                self.near_hits += 1
+                key = near_key
+
+        if row is None:
+            self.misses += 1
+            return {'hit': False, 'key': key, 'dhash': crop_hash, 'source_embedding': source_embedding}
+
+        self.hits += 1
+        self.conn.execute("UPDATE rescues SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        det_score, embedding = row
+        return {
+            'hit': True,
+            'det_score': det_score,
+            'embedding': None if embedding is None else np.frombuffer(embedding, dtype=np.float32).copy(),
+        }
+
+    def put(self, lookup, engine, rescue):
+        """Store a rescue result computed after a miss returned by get()."""
+        embedding = rescue['embedding']
+        self.conn.execute(
+            "INSERT OR REPLACE INTO rescues (key, engine, variant, dhash, source_embedding, det_score, embedding, "
+            "last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (lookup['key'], engine, self.variant, lookup['dhash'].tobytes(),
+             np.asarray(lookup['source_embedding'], dtype=np.float32).tobytes(), rescue['det_score'],
+             None if embedding is None else np.asarray(embedding, dtype=np.float32).tobytes(), time.time()),
+        )
+        self._evict()
+        self.conn.commit()
+
+        self._keys.append(lookup['key'])
+        self._engines = np.append(self._engines, np.array([engine], dtype=object))
+        self._hashes = np.vstack([self._hashes, lookup['dhash'][None, :]])
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM rescues").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM rescues WHERE key IN (SELECT key FROM rescues ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def counters(self):
+        return {'hits': self.hits, 'near_hits': self.near_hits, 'misses': self.misses}
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,211 @@
+"""
+Re-sort event photos from the face cache without loading any model.
+
+    python src/process_photos.py --save-faces     # once, runs the models
+    python src/resort.py --strict 0.5 --doubt 0.3  # re-place the cached photos in seconds
+    python src/resort.py --sweep                   # match/unknown counts per threshold setting
+
+Every cached face is matched against the gallery once; each threshold
+setting is then a handful of vectorized comparisons. Faces that enter the
+doubt zone under the new thresholds but were never restored with GFPGAN
+during the first pass cannot be rescued offline; they are counted as
+"awaiting rescue" (a normal process_photos.py run picks them up from the
+results ledger).
+"""
+
+import os
+import csv
+import argparse
+import numpy as np
+
+from face_cache import RESCUE_RESTORED, load_face_cache
+from process_photos import (
+    FACE_CACHE_PATH, NEW_PHOTOS_DIR, OUTPUT_DIR, PLACEMENT_MANIFEST_PATH,
+    STRICT_THRESHOLD, DOUBT_THRESHOLD, QUALITY_GATE_SCORE,
+    load_embeddings, attach_ann_index, ensure_output_dirs, make_stats, place_result, print_summary,
+)
+from placement import PLACEMENT_MODES, Placer
+
+MATCH_CHUNK = 4096
+
+def match_all(gallery, embeddings):
+    """Best person and similarity for every row of ``embeddings``, matched in chunks."""
+    names = []
+    sims = np.full(len(embeddings), -1.0)
+    for start in range(0, len(embeddings), MATCH_CHUNK):
+        chunk_names, chunk_sims, _ = gallery.match(embeddings[start:start + MATCH_CHUNK])
+        names.extend(chunk_names)
+        sims[start:start + len(chunk_names)] = chunk_sims
+    return names, sims
+
+def prepare(cache, gallery):
+    """Match every cached face (and every restored face) against the gallery once."""
+    face_names, face_sims = match_all(gallery, cache["face_embedding"])
+    restored_names, restored_sims = match_all(gallery, cache["rescue_embedding"])
+
+    rows = cache["rescue_row"]
+    has_rescue = (cache["rescue_state"] == RESCUE_RESTORED) & (rows >= 0)
+    rescue_sims = np.full(len(rows), -1.0)
+    rescue_sims[has_rescue] = restored_sims[rows[has_rescue]]
+    rescue_names = [restored_names[row] if ok else None for row, ok in zip(rows, has_rescue)]
+
+    return {
+        'face_names': face_names,
+        'face_sims': face_sims,
+        'rescue_names': rescue_names,
+        'rescue_sims': rescue_sims,
+        'has_rescue': has_rescue,
+    }
+
+def classify_faces(cache, matched, strict, doubt, quality_gate):
+    """
+    Vectorized form of process_photos.decide_faces for all cached faces at once.
+
+    Returns:
+        (clear, recovered, awaiting_rescue, low_quality) boolean arrays, one entry per face.
+    """
+    det_scores = cache["face_det_score"]
+    sims = matched['face_sims']
+    good = det_scores >= quality_gate
+    clear = good & (sims >= strict)
+    doubtful = good & ~clear & (sims >= doubt)
+    restored_ok = (matched['has_rescue']
+                   & (cache["rescue_det_score"] >= quality_gate)
+                   & (matched['rescue_sims'] >= strict))
+    recovered = doubtful & restored_ok
+    awaiting_rescue = doubtful & (cache["rescue_state"] == 0)
+    return clear, recovered, awaiting_rescue, ~good
+
+def sweep_counts(cache, matched, strict, doubt, quality_gate):
+    clear, recovered, awaiting_rescue, _ = classify_faces(cache, matched, strict, doubt, quality_gate)
+    num_images = len(cache["image_name"])
+    processed = int(np.sum(cache["image_status"] == "ok"))
+    matched_per_image = np.bincount(cache["face_image"], weights=(clear | recovered), minlength=num_images)
+    matched_images = int(np.count_nonzero(matched_per_image))
+    return {
+        'matched': matched_images,
+        'unknown': processed - matched_images,
+        'match_rate': matched_images / max(processed, 1) * 100,
+        'recovered_faces': int(recovered.sum()),
+        'awaiting_rescue': int(awaiting_rescue.sum()),
+    }
+
+def run_sweep(cache, matched, strict_values, doubt_values, gate_values):
+    print("\n[THRESHOLD SWEEP]")
+    print(f"  {'strict':>6} {'doubt':>6} {'gate':>5} | {'matched images':>14} {'unknown':>8} {'rate':>7} "
+          f"{'recovered':>9} {'awaiting rescue':>15}")
+    for gate in gate_values:
+        for strict in strict_values:
+            for doubt in doubt_values:
+                if doubt > strict:
+                    continue
+                counts = sweep_counts(cache, matched, strict, doubt, gate)
+                print(f"  {strict:>6.2f} {doubt:>6.2f} {gate:>5.2f} | {counts['matched']:>14} {counts['unknown']:>8} "
+                      f"{counts['match_rate']:>6.2f}% {counts['recovered_faces']:>9} {counts['awaiting_rescue']:>15}")
+
+def build_results(cache, matched, strict, doubt, quality_gate):
+    """Rebuild the per-image result dicts place_result expects, in the cached (input) order."""
+    clear, recovered, awaiting_rescue, low_quality = classify_faces(cache, matched, strict, doubt, quality_gate)
+    face_image = cache["face_image"]
+    bounds = np.searchsorted(face_image, np.arange(len(cache["image_name"]) + 1))
+
+    for image_idx, (filename, status) in enumerate(zip(cache["image_name"], cache["image_status"])):
+        matches = []
+        for face_idx in range(bounds[image_idx], bounds[image_idx + 1]):
+            if clear[face_idx]:
+                matches.append(('clear', matched['face_names'][face_idx]))
+            elif recovered[face_idx]:
+                matches.append(('recovered', matched['rescue_names'][face_idx]))
+        face_slice = slice(bounds[image_idx], bounds[image_idx + 1])
+        yield str(filename), {
+            'status': str(status),
+            'error': None,
+            'matches': matches,
+            'low_quality': int(low_quality[face_slice].sum()),
+            'needs_rescue': list(np.flatnonzero(awaiting_rescue[face_slice])),
+        }
+
+def clear_placements(filenames, placer):
+    """
+    Remove the earlier placements of ``filenames`` from every folder in Data/output
+    (and, in manifest mode, from the manifest). Other photos stay where they are.
+    """
+    if os.path.isdir(OUTPUT_DIR):
+        for entry in os.scandir(OUTPUT_DIR):
+            if entry.is_dir():
+                for filename in filenames.intersection(os.listdir(entry.path)):
+                    os.remove(os.path.join(entry.path, filename))
+    if placer.mode == "manifest" and os.path.exists(PLACEMENT_MANIFEST_PATH):
+        with open(PLACEMENT_MANIFEST_PATH, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))[1:]
+        placer.manifest_rows = [tuple(row) for row in rows if len(row) == 3 and row[1] not in filenames]
+
+def resort(cache, matched, gallery, strict, doubt, quality_gate, placement="copy"):
+    """
+    Re-place the cached photos in Data/output with the given thresholds. Photos
+    that are not in the cache (or no longer in Data/new_photos) keep their placements.
+    """
+    results = []
+    missing = 0
+    for filename, result in build_results(cache, matched, strict, doubt, quality_gate):
+        if not os.path.exists(os.path.join(NEW_PHOTOS_DIR, filename)):
+            missing += 1
+            continue
+        results.append((filename, result))
+
+    placer = Placer(placement, manifest_path=PLACEMENT_MANIFEST_PATH)
+    clear_placements({filename for filename, _ in results}, placer)
+    ensure_output_dirs(gallery.names)
+
+    stats = make_stats(gallery.names)
+    awaiting = 0
+    for filename, result in results:
+        img_path = os.path.join(NEW_PHOTOS_DIR, filename)
+        awaiting += len(result['needs_rescue'])
+        place_result(filename, img_path, result, stats, placer)
+    placer.close()
+
+    if missing:
+        print(f"[WARN] {missing} cached photos are no longer in {NEW_PHOTOS_DIR} and were skipped")
+    if awaiting:
+        print(f"[WARN] {awaiting} doubt-zone faces were never restored with GFPGAN; "
+              "run process_photos.py to rescue them")
+    print_summary(stats, strict_threshold=strict, placer=placer)
+
+def parse_values(text):
+    return [float(v) for v in text.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-sort photos from the face cache with new thresholds (no models)")
+    parser.add_argument("--cache", default=FACE_CACHE_PATH, help="Face cache written by process_photos.py --save-faces")
+    parser.add_argument("--strict", type=float, default=STRICT_THRESHOLD, help="Strict (clear match) threshold")
+    parser.add_argument("--doubt", type=float, default=DOUBT_THRESHOLD, help="Doubt zone (GFPGAN rescue) threshold")
+    parser.add_argument("--quality-gate", type=float, default=QUALITY_GATE_SCORE, help="Minimum detection score")
+    parser.add_argument("--placement", choices=PLACEMENT_MODES, default="copy",
+                        help="How photos are placed in person folders")
+    parser.add_argument("--sweep", action="store_true", help="Print counts for a grid of thresholds instead of re-sorting")
+    parser.add_argument("--sweep-strict", default="0.35,0.4,0.45,0.5,0.55,0.6", help="Comma-separated strict values")
+    parser.add_argument("--sweep-doubt", default="0.2,0.25,0.3,0.35", help="Comma-separated doubt values")
+    parser.add_argument("--sweep-gate", default=str(QUALITY_GATE_SCORE), help="Comma-separated quality gate values")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache):
+        print(f"[ERROR] Face cache not found: {args.cache} (run process_photos.py --save-faces first)")
+        return
+
+    cache = load_face_cache(args.cache)
+    gallery = attach_ann_index(load_embeddings())
+    print(f"[INFO] Loaded face cache: {len(cache['image_name'])} images, {len(cache['face_det_score'])} faces")
+    matched = prepare(cache, gallery)
+
+    if args.sweep:
+        run_sweep(cache, matched, parse_values(args.sweep_strict), parse_values(args.sweep_doubt),
+                  parse_values(args.sweep_gate))
+        return
+
+    print(f"[INFO] Thresholds: Strict={args.strict}, Doubt={args.doubt}, Quality Gate={args.quality_gate}")
+    resort(cache, matched, gallery, args.strict, args.doubt, args.quality_gate, placement=args.placement)
+    print("[DONE] Re-sorting completed.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Persistent per-image results ledger (SQLite) for resumable sorting runs.
+
+Every analyzed photo is recorded under its path, size and mtime together with
+the raw face data the models produced: bboxes, det_scores, embeddings and, for
+doubt-zone faces, the embedding of the GFPGAN-restored face. Decisions are
+always recomputed from these embeddings with the current thresholds and
+gallery, so reruns, crash recovery and threshold changes skip face detection
+entirely. Only a face that falls into the doubt zone under new thresholds and
+was never rescued needs its photo analyzed again.
+
+Entries also carry the analysis variant (model set, ONNX Runtime options and
+decode mode) that produced them; an entry of another variant is a miss and is
+replaced when the photo is analyzed again.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+
+LEDGER_SCHEMA_VERSION = 2
+COMMIT_EVERY = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    engine TEXT,
+    variant TEXT,
+    decision TEXT,
+    analyzed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS faces (
+    path TEXT NOT NULL,
+    face_idx INTEGER NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    det_score REAL NOT NULL,
+    embedding BLOB NOT NULL,
+    rescued INTEGER NOT NULL DEFAULT 0,
+    rescue_det_score REAL,
+    rescue_embedding BLOB,
+    PRIMARY KEY (path, face_idx)
+);
+"""
+
+def _to_blob(vec):
+    return None if vec is None else np.asarray(vec, dtype=np.float32).tobytes()
+
+def _from_blob(blob):
+    return None if blob is None else np.frombuffer(blob, dtype=np.float32).copy()
+
+class ResultsLedger:
+    """SQLite-backed store of per-image analysis results. Calls are serialized, so threads may share it."""
+
+    def __init__(self, path, variant=""):
+        self.path = path
+        self.variant = variant
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)", (str(LEDGER_SCHEMA_VERSION),))
+        elif int(row[0]) == 1:
+            # Version 1 entries have no variant and are re-analyzed on first use
+            self.conn.execute("ALTER TABLE images ADD COLUMN variant TEXT")
+            self.conn.execute("UPDATE meta SET value = ? WHERE key = 'schema_version'",
+                              (str(LEDGER_SCHEMA_VERSION),))
+        elif int(row[0]) != LEDGER_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported results ledger schema {row[0]} in {path}")
+        self.conn.commit()
+        self._pending = 0
+
+    def lookup(self, img_path):
+        """Return the stored result for an image, or None if it is missing, changed or of another variant."""
+        try:
+            st = os.stat(img_path)
+        except OSError:
+            return None
+        with self._lock:
+            return self._lookup(img_path, st)
+
+    def _lookup(self, img_path, st):
+        row = self.conn.execute(
+            "SELECT size, mtime_ns, status, engine, variant FROM images WHERE path = ?", (img_path,)
+        ).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns or row[4] != self.variant:
+            return None
+
+        faces = []
+        for x1, y1, x2, y2, det_score, emb, rescued, r_score, r_emb in self.conn.execute(
+            "SELECT x1, y1, x2, y2, det_score, embedding, rescued, rescue_det_score, rescue_embedding "
+            "FROM faces WHERE path = ? ORDER BY face_idx", (img_path,)
+        ):
+            rescue = None
+            if rescued:
+                rescue = {'det_score': r_score, 'embedding': _from_blob(r_emb)}
+            faces.append({
+                'bbox': [x1, y1, x2, y2],
+                'det_score': det_score,
+                'embedding': _from_blob(emb),
+                'rescue': rescue,
+            })
+        return {'status': row[2], 'engine': row[3], 'faces': faces, 'error': None, 'from_ledger': True}
+
+    def record(self, img_path, result):
+        """Store (or replace) the analysis of one image. Errors are never recorded."""
+        if result['status'] == 'error':
+            return
+        try:
+            st = os.stat(img_path)
+        except OSError:
+            return
+
+        with self._lock:
+            self._record(img_path, st, result)
+
+    def _record(self, img_path, st, result):
+        self.conn.execute("DELETE FROM faces WHERE path = ?", (img_path,))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO images (path, size, mtime_ns, status, engine, variant, decision, analyzed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (img_path, st.st_size, st.st_mtime_ns, result['status'], result.get('engine'), self.variant,
+             json.dumps(result.get('matches', [])), time.time()),
+        )
+        self.conn.executemany(
+            "INSERT INTO faces (path, face_idx, x1, y1, x2, y2, det_score, embedding, "
+            "rescued, rescue_det_score, rescue_embedding) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (img_path, idx, *[float(v) for v in face['bbox']], float(face['det_score']),
+                 _to_blob(face['embedding']), int(face['rescue'] is not None),
+                 None if face['rescue'] is None or face['rescue']['det_score'] is None else float(face['rescue']['det_score']),
+                 None if face['rescue'] is None else _to_blob(face['rescue']['embedding']))
+                for idx, face in enumerate(result['faces'])
+            ],
+        )
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+    def update_decision(self, img_path, matches):
+        with self._lock:
+            self.conn.execute("UPDATE images SET decision = ? WHERE path = ?", (json.dumps(matches), img_path))
+            self._pending += 1
+            if self._pending >= COMMIT_EVERY:
+                self.commit()
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
@@ -1,178 +1,505 @@
+"""
+Results distribution: zips every person folder in Data/output and POSTs it to
+the n8n webhook, which emails it to the attendee. The zip is built while it is
+uploaded (photos stored, not deflated) and never written to disk.
+
+Folders are sent concurrently by a small worker pool (``--concurrency``). Each
+worker keeps one keep-alive session, an optional token bucket (``--rate``)
+caps requests per second across workers, and 429/5xx responses and connection
+errors are retried with capped, fully jittered exponential backoff (a
+Retry-After header wins). Every retry and failure goes to execution_report.csv.
+
+Usage:
+    python src/send_results.py --concurrency 8 --rate 5
+    python src/stub_webhook.py --fail-rate 0.2 &      # local test webhook
+"""
+
 import os
 import csv
-import shutil
+import time
+import uuid
+import random
+import zipfile
+import argparse
+import threading
 import requests
-from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from attendees import MAX_REPORTED_ROWS, AttendeeIndex, load_attendee_index
+from delivery_ledger import DeliveryLedger, split_parts
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_DIR = os.path.join(BASE_DIR, "Data", "output")
 CSV_PATH = os.path.join(BASE_DIR, "attendees.csv")
+ATTENDEES_INDEX_PATH = os.path.join(BASE_DIR, "Data", "attendees_index.json")
+DELIVERY_LEDGER_PATH = os.path.join(BASE_DIR, "Data", "delivery_ledger.sqlite")
 REPORT_PATH = os.path.join(BASE_DIR, "execution_report.csv")
 WEBHOOK_URL = "http://localhost:5678/webhook/f33ec700-f3d6-47be-b50e-fdd5ec2cc049"
 
-def log_transaction(name, email, status, message):
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_TIMEOUT = 30  # seconds per request
+BACKOFF_BASE = 1.0  # seconds; attempt n waits up to BACKOFF_BASE * 2**n
+BACKOFF_CAP = 60.0
+# 501 Not Implemented and 505 HTTP Version Not Supported will not change on a retry
+PERMANENT_SERVER_ERRORS = {501, 505}
+STREAM_CHUNK = 1024 * 1024  # bytes read from a photo per step of the zip stream
+# Already compressed: deflating them costs CPU and saves next to nothing
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mp4', '.mov', '.zip')
+
+DEFAULT_MAX_PART_MB = 20  # per email; common mail providers reject attachments above 20-25 MB
+REPORT_COLUMNS = ['Timestamp', 'Name', 'Email', 'Status', 'Message', 'Files']
+
+_log_lock = threading.Lock()
+_report_checked = False
+
+def _migrate_report_header():
+    """Add the Files column to a report written before it existed (old rows get an empty one)."""
+    global _report_checked
+    _report_checked = True
+    if not os.path.exists(REPORT_PATH):
+        return
+    with open(REPORT_PATH, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    if not rows or rows[0] != REPORT_COLUMNS[:-1]:
+        return
+    tmp_path = REPORT_PATH + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(REPORT_COLUMNS)
+        writer.writerows(row + [''] for row in rows[1:])
+    os.replace(tmp_path, REPORT_PATH)
+    print(f"🔧 [INFO] Added a Files column to {os.path.basename(REPORT_PATH)}")
+
+def log_transaction(name, email, status, message, files=()):
     """
     Log a transaction to execution_report.csv.
     
     Args:
         name: Person's name
         email: Email address
-        status: Status (SUCCESS/FAILED/SKIPPED)
+        status: Status (SUCCESS/FAILED/SKIPPED/RETRY)
         message: Additional message/error details
+        files: Names of the photos in this send (Files column, ';'-separated)
     """
-    file_exists = os.path.exists(REPORT_PATH)
-    
     try:
-        with open(REPORT_PATH, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            
-            # Write headers if file is new
-            if not file_exists:
-                writer.writerow(['Timestamp', 'Name', 'Email', 'Status', 'Message'])
-            
-            # Write the transaction row
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            writer.writerow([timestamp, name, email, status, message])
+        with _log_lock:
+            if not _report_checked:
+                _migrate_report_header()
+            with open(REPORT_PATH, 'a', newline='', encoding='utf-8') as f:
+                file_exists = f.tell() > 0
+
+                writer = csv.writer(f)
+
+                # Write headers if file is new
+                if not file_exists:
+                    writer.writerow(REPORT_COLUMNS)
+                
+                # Write the transaction row
+                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                writer.writerow([timestamp, name, email, status, message, ';'.join(files)])
             
     except Exception as e:
         # Don't crash the main process if logging fails
         print(f"⚠️  [WARNING] Failed to log transaction: {e}")
 
 def load_attendees():
-    """Load attendees.csv and return a dictionary mapping Name -> Email."""
-    attendees = {}
+    """Load attendees.csv (through the cached index) and return an AttendeeIndex mapping Name -> Email."""
+    empty = AttendeeIndex.from_rows([])
     
     if not os.path.exists(CSV_PATH):
         print(f"❌ [ERROR] attendees.csv not found at: {CSV_PATH}")
-        return attendees
+        return empty
     
     try:
-        # Detect delimiter by reading first line
-        with open(CSV_PATH, 'r', encoding='utf-8-sig') as f:
-            first_line = f.readline()
-            # Check which delimiter appears more (comma or semicolon)
-            comma_count = first_line.count(',')
-            semicolon_count = first_line.count(';')
-            delimiter = ';' if semicolon_count > comma_count else ','
-            print(f"🔍 [DEBUG] Detected delimiter: '{delimiter}' (commas: {comma_count}, semicolons: {semicolon_count})")
-            f.seek(0)  # Reset to beginning
-            
-            reader = csv.DictReader(f, delimiter=delimiter)
-            
-            # Strip whitespace from fieldnames (column headers)
-            reader.fieldnames = [field.strip() if field else field for field in reader.fieldnames]
-            print(f"🔍 [DEBUG] Detected columns: {reader.fieldnames}")
-            
-            # Validate required columns exist
-            if 'Name' not in reader.fieldnames or 'Email' not in reader.fieldnames:
-                print(f"❌ [ERROR] Required columns 'Name' and 'Email' not found.")
-                print(f"   Available columns: {reader.fieldnames}")
-                return attendees
-            
-            row_count = 0
-            for row in reader:
-                row_count += 1
-                # Strip whitespace from both keys and values
-                cleaned_row = {k.strip(): v.strip() if v else '' for k, v in row.items()}
-                
-                name = cleaned_row.get('Name', '').strip()
-                email = cleaned_row.get('Email', '').strip()
-                
-                # Skip rows without valid name or email
-                if not name or not email:
-                    print(f"⚠️  [SKIP] Row {row_count}: Missing Name or Email (Name='{name}', Email='{email}')")
-                    continue
-                
-                # Basic email validation
-                if '@' not in email:
-                    print(f"⚠️  [SKIP] Row {row_count}: Invalid email format for '{name}' (Email='{email}')")
-                    continue
-                
-                attendees[name] = email
-            
-            print(f"✅ [INFO] Loaded {len(attendees)} valid attendees from {row_count} rows in CSV")
-            return attendees
-            
+        start = time.perf_counter()
+        attendees, rebuilt = load_attendee_index(CSV_PATH, ATTENDEES_INDEX_PATH)
     except UnicodeDecodeError as e:
         print(f"❌ [ERROR] Encoding issue with attendees.csv. Tried UTF-8-sig. Error: {e}")
-        return attendees
+        return empty
+    except ValueError as e:
+        print(f"❌ [ERROR] {e}")
+        return empty
     except Exception as e:
         print(f"❌ [ERROR] Failed to read attendees.csv: {e}")
         import traceback
         traceback.print_exc()
-        return attendees
+        return empty
+    
+    for problem in attendees.problems[:MAX_REPORTED_ROWS]:
+        print(f"⚠️  [SKIP] {problem}")
+    if len(attendees.problems) > MAX_REPORTED_ROWS:
+        print(f"⚠️  [SKIP] ... and {len(attendees.problems) - MAX_REPORTED_ROWS} more invalid rows")
+    for key, names in sorted(attendees.ambiguous.items())[:MAX_REPORTED_ROWS]:
+        print(f"⚠️  [WARNING] Different emails for names that only differ in case/accents: {', '.join(names)}")
+    source = "parsed attendees.csv" if rebuilt else "attendee index cache"
+    print(f"✅ [INFO] Loaded {len(attendees)} valid attendees ({source}, {(time.perf_counter() - start) * 1000:.0f} ms)")
+    return attendees
 
-def zip_folder(folder_path, zip_path):
-    """Compress a folder into a zip file."""
-    try:
-        shutil.make_archive(zip_path.replace('.zip', ''), 'zip', folder_path)
-        zip_size = os.path.getsize(zip_path) / (1024 * 1024)  # Size in MB
-        print(f"📦 [INFO] Created zip: {os.path.basename(zip_path)} ({zip_size:.2f} MB)")
-        return True
-    except Exception as e:
-        print(f"❌ [ERROR] Failed to create zip for {folder_path}: {e}")
-        return False
+class _StreamSink:
+    """Write-only, non-seekable file object that zipfile writes into; the bytes are taken out with drain()."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
 
-def send_to_webhook(email, zip_path):
-    """Send zip file to n8n webhook via POST request.
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def zip_stream(files, chunk_size=STREAM_CHUNK):
+    """
+    Generate a zip archive of ``files`` ([(path, arcname)]) chunk by chunk, without a temp file.
+
+    Already-compressed formats (JPEG, PNG, ...) are stored, anything else is deflated.
+    Only about one ``chunk_size`` of data is held in memory at a time.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w') as archive:
+        for path, arcname in files:
+            info = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+            stored = arcname.lower().endswith(STORED_EXTENSIONS)
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, archive.open(info, 'w') as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()  # central directory
+
+def multipart_body(fields, file_field, filename, content_type, stream, boundary):
+    """Generate a multipart/form-data body whose last part is the (streamed) file."""
+    for name, value in fields.items():
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+               f'{value}\r\n').encode('utf-8')
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+           f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+    for chunk in stream:
+        if chunk:
+            yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+def folder_files(folder_path):
+    """[(path, arcname)] of the files directly inside a person folder, sorted by name."""
+    return [(os.path.join(folder_path, f), f) for f in sorted(os.listdir(folder_path))
+            if os.path.isfile(os.path.join(folder_path, f))]
+
+def send_to_webhook(email, files, zip_name, session=None, timeout=DEFAULT_TIMEOUT, webhook_url=WEBHOOK_URL,
+                    part=None):
+    """Send photos to n8n webhook as a zip attachment, built while uploading, via one POST request.
+    
+    The body is generated afresh on every call, so a retry simply calls this again.
+    
+    Args:
+        files: [(path, arcname)] to put in the zip
+        zip_name: File name of the attachment
+        part: (index, count) when the photos go out in several emails
     
     Returns:
-        tuple: (success: bool, message: str)
+        tuple: (success: bool, message: str, retryable: bool, response or None)
     """
-    if not os.path.exists(zip_path):
-        error_msg = f"Zip file not found: {zip_path}"
-        print(f"❌ [ERROR] {error_msg}")
-        return False, error_msg
+    data = {
+        'email': email,
+        'subject': 'Your photos are ready',
+        'message': f'Dear {email.split("@")[0]},\n\nYour event photos are ready! Please find them attached.\n\nBest regards,\nEvent Photo Team'
+    }
+    if part is not None and part[1] > 1:
+        data['subject'] += f' (part {part[0]} of {part[1]})'
+
+    boundary = uuid.uuid4().hex
+    body = multipart_body(data, 'attachment', zip_name, 'application/zip', zip_stream(files), boundary)
+    headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
     
     try:
-        with open(zip_path, 'rb') as f:
-            files = {
-                'attachment': (os.path.basename(zip_path), f, 'application/zip')
-            }
-            data = {
-                'email': email,
-                'subject': 'Your photos are ready',
-                'message': f'Dear {email.split("@")[0]},\n\nYour event photos are ready! Please find them attached.\n\nBest regards,\nEvent Photo Team'
-            }
-            
-            print(f"📤 [INFO] Sending to {email}...")
-            response = requests.post(WEBHOOK_URL, files=files, data=data, timeout=30)
+        print(f"📤 [INFO] Sending to {email}...")
+        # A generator body goes out with chunked transfer encoding
+        response = (session or requests).post(webhook_url, data=body, headers=headers, timeout=timeout)
+        
+        if response.status_code == 200:
+            print(f"✅ [SUCCESS] Successfully sent photos to {email}")
+            return True, "Photos sent successfully", False, response
+        else:
+            error_msg = f"Webhook returned status {response.status_code}: {response.text[:200]}"
+            print(f"⚠️  [WARNING] Webhook returned status {response.status_code} for {email}")
+            print(f"   Response: {response.text[:200]}")
+            return False, error_msg, is_retryable_status(response.status_code), response
             
-            if response.status_code == 200:
-                print(f"✅ [SUCCESS] Successfully sent photos to {email}")
-                return True, "Photos sent successfully"
-            else:
-                error_msg = f"Webhook returned status {response.status_code}: {response.text[:200]}"
-                print(f"⚠️  [WARNING] Webhook returned status {response.status_code} for {email}")
-                print(f"   Response: {response.text[:200]}")
-                return False, error_msg
-                
+
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        error_msg = f"Network error: {str(e)}"
+        print(f"❌ [ERROR] Network error while sending to {email}: {e}")
+        return False, error_msg, True, None
     except requests.exceptions.RequestException as e:
         error_msg = f"Network error: {str(e)}"
         print(f"❌ [ERROR] Network error while sending to {email}: {e}")
-        return False, error_msg
+        return False, error_msg, False, None
+    except OSError as e:
+        # A photo could not be read while the zip was being streamed
+        error_msg = f"Failed to read photos: {str(e)}"
+        print(f"❌ [ERROR] Failed to zip photos for {email}: {e}")
+        return False, error_msg, False, None
     except Exception as e:
         error_msg = f"Exception: {str(e)}"
         print(f"❌ [ERROR] Failed to send to {email}: {e}")
-        return False, error_msg
+        return False, error_msg, False, None
+
+def is_retryable_status(status):
+    """408, 429 and 5xx (including CDN codes such as 520-524 in front of the webhook) are transient."""
+    return status in (408, 429) or (500 <= status < 600 and status not in PERMANENT_SERVER_ERRORS)
 
-def cleanup_zip(zip_path):
-    """Delete zip file after sending."""
+def retry_after_seconds(response):
+    """Retry-After of a response in seconds (delta-seconds or HTTP date), or None."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
     try:
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-            print(f"🗑️  [INFO] Deleted zip file: {os.path.basename(zip_path)}")
-            return True
-    except Exception as e:
-        print(f"⚠️  [WARNING] Failed to delete zip file {zip_path}: {e}")
-        return False
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, response=None):
+    """Seconds to wait before retry ``attempt`` (0-based): Retry-After if given, else full jitter."""
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class RateLimiter:
+    """Token bucket shared by the delivery workers: ``rate`` requests per second, bursts of ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def new_stats():
+    return {
+        'processed': 0,
+        'sent': 0,
+        'failed': 0,
+        'not_found': 0,
+        'up_to_date': 0,
+        'parts': 0,
+        'retries': 0
+    }
+
+class DeliveryEngine:
+    """
+    Sends person folders from a pool of ``concurrency`` worker threads.
+
+    Every worker has its own keep-alive requests.Session; ``rate`` (requests per
+    second, None = unlimited) is enforced across all of them. A folder submitted
+    again while it is still being sent waits for the first send to finish.
+
+    Only photos missing from the attendee's delivery ledger are sent (every
+    photo with ``resend_all``), split into zips of at most ``max_part_mb``
+    (None = no cap); every successful send is recorded in the ledger.
+    """
+
+    def __init__(self, attendees, concurrency=DEFAULT_CONCURRENCY, rate=None, max_retries=DEFAULT_MAX_RETRIES,
+                 timeout=DEFAULT_TIMEOUT, webhook_url=WEBHOOK_URL, resend_all=False, max_part_mb=DEFAULT_MAX_PART_MB):
+        self.attendees = attendees
+        self.ledger = DeliveryLedger(DELIVERY_LEDGER_PATH)
+        self.resend_all = resend_all
+        self.max_part_bytes = int(max_part_mb * 1024 * 1024) if max_part_mb else None
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.timeout = timeout
+        self.webhook_url = webhook_url
+        self.limiter = RateLimiter(rate, burst=self.concurrency) if rate else None
+        self.stats = new_stats()
+        self.busy = 0.0  # summed send time of all workers
+        self.error = None
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="delivery")
+        self._local = threading.local()
+        self._sessions = []
+        self._person_locks = {}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self.lock:
+                self._sessions.append(session)
+        return session
+
+    def post(self, name, email, files, zip_name, part=None):
+        """POST with retries. Returns (success, message)."""
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                self.limiter.acquire()
+            success, message, retryable, response = send_to_webhook(
+                email, files, zip_name, self.session(), self.timeout, self.webhook_url, part)
+            if success or not retryable:
+                return success, message
+            if attempt == self.max_retries:
+                return False, f"{message} (gave up after {self.max_retries} retries)"
+            delay = backoff_delay(attempt, response)
+            print(f"🔁 [RETRY] {name}: attempt {attempt + 1} failed, retrying in {delay:.1f}s")
+            log_transaction(name, email, "RETRY", f"Attempt {attempt + 1} failed ({message}); retrying in {delay:.1f}s",
+                            [arcname for _, arcname in files])
+            self.count('retries')
+            time.sleep(delay)
+
+    def submit(self, folder_name):
+        return self.pool.submit(self._send, folder_name)
+
+    def _send(self, folder_name):
+        with self.lock:
+            person_lock = self._person_locks.setdefault(folder_name, threading.Lock())
+        start = time.perf_counter()
+        try:
+            with person_lock:
+                send_person(folder_name, self.attendees, self.stats, self)
+        except Exception as e:
+            with self.lock:
+                if self.error is None:
+                    self.error = e
+            print(f"❌ [ERROR] Delivery of {folder_name} failed: {e}")
+        finally:
+            with self.lock:
+                self.busy += time.perf_counter() - start
+
+    def close(self, cancel=False):
+        """Wait for every submitted folder (or drop the queued ones with ``cancel``)."""
+        self.pool.shutdown(wait=True, cancel_futures=cancel)
+        for session in self._sessions:
+            session.close()
+        if self.ledger is not None:
+            self.ledger.close()
+
+def send_person(folder_name, attendees, stats, engine=None):
+    """Zip one person folder, send it to the webhook and log the outcome in stats.
+
+    With ``engine`` (a DeliveryEngine) the POST is retried, stats are updated under its lock
+    and only photos the attendee has not received are sent, in size-capped parts.
+    """
+    count = engine.count if engine is not None else lambda key: stats.__setitem__(key, stats[key] + 1)
+    ledger = engine.ledger if engine is not None else None
+    folder_path = os.path.join(OUTPUT_DIR, folder_name)
+    
+    # Check if folder has any files
+    files = folder_files(folder_path)
+    
+    if not files:
+        print(f"⚠️  [SKIP] {folder_name}: No files in folder")
+        return
+    
+    print(f"\n{'='*60}")
+    print(f"👤 [PROCESSING] {folder_name} ({len(files)} photos)")
+    print(f"{'='*60}")
+    
+    # Check if name exists in attendees (case, spacing and accents may differ)
+    email = attendees.get(folder_name)
+    if email is None:
+        suggestions = attendees.suggest(folder_name) if hasattr(attendees, 'suggest') else []
+        hint = f" (closest: {', '.join(suggestions)})" if suggestions else ""
+        print(f"⚠️  [SKIP] {folder_name}: Not found in attendees.csv{hint}")
+        log_transaction(folder_name, "N/A", "SKIPPED", f"Name not found in attendees.csv{hint}")
+        count('not_found')
+        return
+    
+    if ledger is not None and engine.resend_all:
+        entries = ledger.entries(files)
+    elif ledger is not None:
+        entries = ledger.pending(email, files)
+        if not entries:
+            print(f"✅ [SKIP] {folder_name}: All {len(files)} photos already delivered")
+            count('up_to_date')
+            return
+        if len(entries) < len(files):
+            print(f"📒 [INFO] {folder_name}: {len(entries)} new of {len(files)} photos")
+    else:
+        entries = [{'path': path, 'arcname': arcname, 'size': os.path.getsize(path)} for path, arcname in files]
+    count('processed')
+    
+    # The zip is streamed into the upload; nothing is written to disk
+    parts = split_parts(entries, engine.max_part_bytes if engine is not None else None)
+    for index, part in enumerate(parts, 1):
+        zip_filename = f"{folder_name}.zip" if len(parts) == 1 else f"{folder_name}_part{index}of{len(parts)}.zip"
+        part_files = [(entry['path'], entry['arcname']) for entry in part]
+        names = [entry['arcname'] for entry in part]
+        part_mb = sum(entry['size'] for entry in part) / (1024 * 1024)
+        print(f"📦 [INFO] Streaming {zip_filename} ({len(part)} files, {part_mb:.2f} MB)")
+        
+        if engine is not None:
+            success, message = engine.post(folder_name, email, part_files, zip_filename, (index, len(parts)))
+        else:
+            success, message = send_to_webhook(email, part_files, zip_filename, part=(index, len(parts)))[:2]
+        if not success:
+            count('failed')
+            log_transaction(folder_name, email, "FAILED", message, names)
+            return  # the remaining parts go out with the next run
+        
+        if ledger is not None:
+            ledger.mark_delivered(email, part)
+        count('parts')
+        detail = f" (part {index} of {len(parts)})" if len(parts) > 1 else ""
+        log_transaction(folder_name, email, "SUCCESS", f"Photos sent successfully{detail}: {len(part)} files, {part_mb:.2f} MB",
+                        names)
+    count('sent')
+
+def print_send_summary(stats):
+    print(f"\n{'='*60}")
+    print("📊 [SUMMARY] Distribution Complete")
+    print(f"{'='*60}")
+    print(f"✅ Processed: {stats['processed']}")
+    print(f"📤 Successfully sent: {stats['sent']}")
+    print(f"❌ Failed: {stats['failed']}")
+    print(f"⚠️  Not in CSV: {stats['not_found']}")
+    print(f"📒 Already up to date: {stats['up_to_date']}")
+    print(f"📦 Zips sent: {stats['parts']}")
+    print(f"🔁 Retries: {stats['retries']}")
+    print(f"{'='*60}\n")
 
-def send_results():
+def send_results(concurrency=DEFAULT_CONCURRENCY, rate=None, max_retries=DEFAULT_MAX_RETRIES,
+                 timeout=DEFAULT_TIMEOUT, webhook_url=WEBHOOK_URL, resend_all=False, max_part_mb=DEFAULT_MAX_PART_MB):
     """Main function to process and send sorted photos."""
     print("🚀 [INFO] Starting photo distribution process...")
     print(f"📁 [INFO] Output directory: {OUTPUT_DIR}")
-    print(f"🔗 [INFO] Webhook URL: {WEBHOOK_URL}\n")
+    print(f"🔗 [INFO] Webhook URL: {webhook_url}\n")
     
     # Load attendees
     attendees = load_attendees()
@@ -193,73 +520,35 @@ def send_results():
         print("⚠️  [WARNING] No folders found in output directory (excluding 'Unknown')")
         return
     
-    print(f"📂 [INFO] Found {len(folders)} person folders to process\n")
+    print(f"📂 [INFO] Found {len(folders)} person folders to process "
+          f"(concurrency {concurrency}, rate {f'{rate}/s' if rate else 'unlimited'})\n")
     
-    # Statistics
-    stats = {
-        'processed': 0,
-        'sent': 0,
-        'failed': 0,
-        'not_found': 0
-    }
+    engine = DeliveryEngine(attendees, concurrency, rate, max_retries, timeout, webhook_url, resend_all, max_part_mb)
+    start = time.perf_counter()
     
     # Process each folder
     for folder_name in folders:
-        folder_path = os.path.join(OUTPUT_DIR, folder_name)
-        
-        # Check if folder has any files
-        files = [f for f in os.listdir(folder_path) 
-                 if os.path.isfile(os.path.join(folder_path, f))]
-        
-        if not files:
-            print(f"⚠️  [SKIP] {folder_name}: No files in folder")
-            continue
-        
-        print(f"\n{'='*60}")
-        print(f"👤 [PROCESSING] {folder_name} ({len(files)} photos)")
-        print(f"{'='*60}")
-        
-        # Check if name exists in attendees
-        if folder_name not in attendees:
-            print(f"⚠️  [SKIP] {folder_name}: Not found in attendees.csv")
-            log_transaction(folder_name, "N/A", "SKIPPED", "Name not found in attendees.csv")
-            stats['not_found'] += 1
-            continue
-        
-        email = attendees[folder_name]
-        stats['processed'] += 1
-        
-        # Create zip file in temp location (same directory as folder)
-        zip_filename = f"{folder_name}.zip"
-        zip_path = os.path.join(OUTPUT_DIR, zip_filename)
-        
-        # Step 1: Create zip
-        if not zip_folder(folder_path, zip_path):
-            stats['failed'] += 1
-            continue
-        
-        # Step 2: Send to webhook
-        success, message = send_to_webhook(email, zip_path)
-        if success:
-            stats['sent'] += 1
-            log_transaction(folder_name, email, "SUCCESS", "Photos sent successfully")
-        else:
-            stats['failed'] += 1
-            log_transaction(folder_name, email, "FAILED", message)
-        
-        # Step 3: Cleanup zip file
-        cleanup_zip(zip_path)
+        engine.submit(folder_name)
+    engine.close()
     
-    # Final summary
-    print(f"\n{'='*60}")
-    print("📊 [SUMMARY] Distribution Complete")
-    print(f"{'='*60}")
-    print(f"✅ Processed: {stats['processed']}")
-    print(f"📤 Successfully sent: {stats['sent']}")
-    print(f"❌ Failed: {stats['failed']}")
-    print(f"⚠️  Not in CSV: {stats['not_found']}")
-    print(f"{'='*60}\n")
+    elapsed = time.perf_counter() - start
+    print_send_summary(engine.stats)
+    print(f"⏱️  [INFO] {len(folders)} folders in {elapsed:.2f}s ({len(folders) / max(elapsed, 1e-9):.1f} folders/s)")
 
 if __name__ == "__main__":
-    send_results()
+    parser = argparse.ArgumentParser(description="Send every sorted person folder to the n8n webhook")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Parallel deliveries")
+    parser.add_argument("--rate", type=float, default=None, help="Most webhook requests per second (default: unlimited)")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="Retries of a delivery after 429/5xx responses or connection errors")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds per webhook request")
+    parser.add_argument("--webhook-url", default=WEBHOOK_URL)
+    parser.add_argument("--max-part-mb", type=float, default=DEFAULT_MAX_PART_MB,
+                        help="Split a delivery into zips of at most this many MB (0 = one zip)")
+    parser.add_argument("--resend-all", action="store_true",
+                        help="Ignore the delivery ledger and send every photo (deliveries are still recorded)")
+    args = parser.parse_args()
+
+    send_results(args.concurrency, args.rate, args.max_retries, args.timeout, args.webhook_url,
+                 args.resend_all, args.max_part_mb or None)
 
@@ -0,0 +1,302 @@
+"""
+Local HTTP sorting service: keeps the models resident and sorts single photos.
+
+    POST /sort     body = encoded JPEG/PNG bytes -> JSON decision
+    GET  /health   {"status": "ok", ...} once the models are loaded
+
+Request threads only decode the upload; every photo is then handed to one
+inference thread that owns the models. Requests arriving within
+``--max-wait-ms`` of each other (up to ``--max-batch``) are coalesced into one
+micro-batch: the photos of each engine go through one batched model call
+(analyze_decoded_batch), and the per-face names and similarities of the
+whole batch come from one gallery lookup. Nothing is written to Data/output.
+
+Response:
+    {"status": "ok" | "no_faces" | "unreadable" | "error" | "timeout",
+     "matches": ["Alice", ...],                 # persons the photo would be sorted into
+     "faces": [{"bbox": [x1, y1, x2, y2], "det_score": 0.91,
+                "name": "Alice", "similarity": 0.62,
+                "decision": "clear" | "recovered" | "doubt" | "stranger" | "low_quality"}],
+     "engine": "small" | "hd", "batch_size": 3, "queue_ms": 4.1, "infer_ms": 35.0}
+
+A request without a result after ``--request-timeout`` seconds gets 503 if
+its photo was still queued (it is then dropped) or 504 if inference had started.
+
+Usage:
+    python src/sort_service.py --port 8765 --max-batch 8 --max-wait-ms 10
+    curl --data-binary @photo.jpg http://127.0.0.1:8765/sort
+"""
+
+import json
+import time
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import cv2
+
+from face_models import add_runtime_arguments, configure_runtime, runtime_from_args
+from image_io import REDUCED_DECODE_FLOOR, decode_bytes_for_detection
+from process_photos import (
+    DOUBT_THRESHOLD, QUALITY_GATE_SCORE, STRICT_THRESHOLD, RESCUE_CACHE_PATH, analysis_variant, analyze_decoded_batch,
+    attach_ann_index, complete_rescues, find_best_match, initialize_models, load_embeddings,
+)
+from rescue_cache import RescueCache
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BATCH = 8
+DEFAULT_MAX_WAIT_MS = 10.0
+DEFAULT_REQUEST_TIMEOUT = 60.0  # seconds a request waits for its result
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+class Job:
+    """One photo waiting for the inference thread."""
+
+    def __init__(self, data, decoded):
+        self.data = data
+        self.decoded = decoded
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.response = None
+        self.started = False
+        self.cancelled = False
+
+def describe_faces(faces, names, sims, gallery):
+    """Per-face decision, mirroring decide_faces (names/sims come from the batched gallery lookup)."""
+    described = []
+    for face, name, similarity in zip(faces, names, sims):
+        entry = {'bbox': [round(float(v), 1) for v in face['bbox']], 'det_score': round(float(face['det_score']), 4),
+                 'name': None, 'similarity': None}
+        if face['det_score'] < QUALITY_GATE_SCORE:
+            entry['decision'] = 'low_quality'
+        else:
+            entry.update(name=name, similarity=round(float(similarity), 4))
+            rescue = face['rescue']
+            if similarity >= STRICT_THRESHOLD:
+                entry['decision'] = 'clear'
+            elif similarity < DOUBT_THRESHOLD:
+                entry['decision'] = 'stranger'
+            elif rescue is not None and rescue['embedding'] is not None and rescue['det_score'] >= QUALITY_GATE_SCORE:
+                restored_name, restored_similarity = find_best_match(rescue['embedding'], gallery)
+                if restored_similarity >= STRICT_THRESHOLD:
+                    entry.update(name=restored_name, similarity=round(float(restored_similarity), 4), decision='recovered')
+                else:
+                    entry['decision'] = 'doubt'
+            else:
+                entry['decision'] = 'doubt'
+        described.append(entry)
+    return described
+
+class SortingService:
+    """Owns the models; run() is the inference thread that drains the job queue in micro-batches."""
+
+    def __init__(self, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_MAX_WAIT_MS, rescue=True,
+                 rescue_cache_size=0, reduced_floor=REDUCED_DECODE_FLOOR, request_timeout=DEFAULT_REQUEST_TIMEOUT):
+        self.gallery = attach_ann_index(load_embeddings())
+        self.app_small, self.app_hd, self.gfpgan = initialize_models()
+        if rescue:
+            self.gfpgan.get()
+        self.rescue = rescue
+        self.rescue_cache_size = rescue_cache_size if rescue else 0
+        self.rescue_cache = None
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.reduced_floor = reduced_floor
+        self.request_timeout = request_timeout
+        self.jobs = queue.Queue()
+        self.stats = {'requests': 0, 'batches': 0, 'timeouts': 0}
+        # Guards stats and the started/cancelled/done handoff of jobs between request and inference threads
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def submit(self, data):
+        """
+        Decode in the calling (request) thread, queue for inference and wait for the result.
+
+        Returns:
+            The response dict, or a 'timeout' response when none arrived within
+            request_timeout seconds; 'started' tells whether inference had begun.
+        """
+        job = Job(data, decode_bytes_for_detection(data, self.reduced_floor))
+        self.jobs.put(job)
+        if job.done.wait(self.request_timeout):
+            return job.response
+        with self._lock:
+            if job.done.is_set():
+                return job.response  # finished just after the wait expired
+            # A photo still in the queue is dropped; one being analyzed finishes unseen
+            started = job.started
+            job.cancelled = not started
+            self.stats['timeouts'] += 1
+        return {'status': 'timeout', 'started': started, 'matches': [], 'faces': [],
+                'error': f"no result within {self.request_timeout:g}s"}
+
+    def stats_snapshot(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def _next_batch(self):
+        try:
+            batch = [self.jobs.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.jobs.get(timeout=remaining) if remaining > 0 else self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            batch = [job for job in batch if not job.cancelled]
+            for job in batch:
+                job.started = True
+        return batch
+
+    def run(self):
+        # Opened here: the SQLite connection belongs to the inference thread
+        if self.rescue_cache_size:
+            self.rescue_cache = RescueCache(RESCUE_CACHE_PATH, self.rescue_cache_size,
+                                            variant=analysis_variant(self.reduced_floor))
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                responses = self._sort_batch(batch)
+            except Exception as e:
+                responses = [{'status': 'error', 'error': str(e), 'matches': [], 'faces': []} for _ in batch]
+            infer_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.stats['batches'] += 1
+                self.stats['requests'] += len(batch)
+                for job, response in zip(batch, responses):
+                    response.update(batch_size=len(batch), queue_ms=round((start - job.enqueued) * 1000, 2),
+                                    infer_ms=round(infer_ms, 2))
+                    job.response = response
+                    job.done.set()
+        if self.rescue_cache is not None:
+            self.rescue_cache.close()
+
+    def _sort_batch(self, batch):
+        results = []
+        analyzed = analyze_decoded_batch([job.decoded for job in batch], self.app_small, self.app_hd, self.gallery)
+        for job, result in zip(batch, analyzed):
+            if self.rescue and result['needs_rescue']:
+                full = cv2.imdecode(np.frombuffer(job.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                result = complete_rescues(full, result, self.app_small, self.app_hd, self.gfpgan, self.gallery,
+                                          cache=self.rescue_cache)
+            results.append(result)
+
+        # One gallery lookup for every face in the batch
+        all_faces = [face for result in results for face in result.get('faces', [])]
+        names, sims, _ = self.gallery.match([face['embedding'] for face in all_faces]) if all_faces else ([], [], None)
+
+        responses = []
+        offset = 0
+        for result in results:
+            faces = result.get('faces', [])
+            response = {
+                'status': result['status'],
+                'engine': result.get('engine'),
+                'matches': sorted({name for _, name in result.get('matches', [])}),
+                'faces': describe_faces(faces, names[offset:offset + len(faces)], sims[offset:offset + len(faces)],
+                                        self.gallery),
+            }
+            offset += len(faces)
+            if result.get('error'):
+                response['error'] = result['error']
+            responses.append(response)
+        return responses
+
+    def stop(self):
+        self._stop.set()
+
+def make_handler(service):
+    class SortHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, code, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/health":
+                self._send_json(200, {'status': 'ok', 'people': len(service.gallery.names),
+                                      **service.stats_snapshot()})
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/sort":
+                self._send_json(404, {'error': 'not found'})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length <= 0 or length > MAX_BODY_BYTES:
+                self._send_json(400 if length <= 0 else 413, {'error': 'expected the image bytes as the request body'})
+                return
+            data = self.rfile.read(length)
+            response = service.submit(data)
+            if response['status'] == 'timeout':
+                # 503: still queued behind other photos (overloaded); 504: inference itself took too long
+                self._send_json(504 if response.pop('started') else 503, response)
+                return
+            self._send_json(200 if response['status'] != 'error' else 500, response)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would drown the console under load
+
+    return SortHandler
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, **service_kwargs):
+    service = SortingService(**service_kwargs)
+    worker = threading.Thread(target=service.run, name="inference", daemon=True)
+    worker.start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    print(f"[OK] Sorting service listening on http://{host}:{port} "
+          f"(max batch {service.max_batch}, max wait {service.max_wait * 1000:.0f} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Shutting down...")
+    finally:
+        server.server_close()
+        service.stop()
+        worker.join(timeout=5)
+    batches = max(service.stats['batches'], 1)
+    print(f"[DONE] {service.stats['requests']} requests in {service.stats['batches']} batches "
+          f"(mean batch {service.stats['requests'] / batches:.2f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP service that sorts single photos with resident models")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH,
+                        help="Most requests coalesced into one inference batch")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="How long the first request of a batch waits for more to arrive")
+    parser.add_argument("--no-rescue", action="store_true",
+                        help="Do not run GFPGAN; doubt-zone faces are reported with decision 'doubt'")
+    parser.add_argument("--rescue-cache-size", type=int, default=0,
+                        help="Also use Data/rescue_cache.sqlite with this many entries (0 = off)")
+    parser.add_argument("--full-decode", action="store_true", help="Decode uploads at full resolution for detection")
+    parser.add_argument("--request-timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT,
+                        help="Seconds a request waits for its result before 503 (still queued) or 504")
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    configure_runtime(runtime_from_args(args))
+
+    serve(args.host, args.port, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, rescue=not args.no_rescue,
+          rescue_cache_size=max(0, args.rescue_cache_size),
+          reduced_floor=None if args.full_decode else REDUCED_DECODE_FLOOR,
+          request_timeout=max(0.001, args.request_timeout))
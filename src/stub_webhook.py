@@ -0,0 +1,168 @@
+"""
+Local stand-in for the n8n webhook, for testing send_results.py without sending email.
+
+Accepts the same multipart POST on any path (with Content-Length or chunked
+transfer encoding) and answers 200, except:
+    --fail-rate 0.2          that fraction of requests gets 503
+    --throttle-every 5       every 5th request gets 429 with Retry-After: --retry-after
+    --latency-ms 200         each request takes this long (simulates the email step)
+
+Every request is counted per recipient and its zip attachment is opened and
+CRC-checked; the totals (photos received, broken zips, the highest number of
+requests seen in flight at once) are printed on Ctrl+C and served as JSON on
+GET /stats.
+
+Usage:
+    python src/stub_webhook.py --fail-rate 0.2 --throttle-every 7 --latency-ms 100
+    python src/send_results.py --concurrency 8
+"""
+
+import io
+import re
+import json
+import time
+import random
+import argparse
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 5678
+EMAIL_FIELD = re.compile(rb'name="email"\r\n\r\n([^\r]*)\r\n')
+ATTACHMENT_PART = re.compile(rb'name="attachment"; filename="[^"]*"\r\n[^\r]*\r\n\r\n(.*)\r\n--[0-9A-Za-z_\'()+,./:=?-]+--\r\n$', re.S)
+
+class StubState:
+    def __init__(self, fail_rate=0.0, throttle_every=0, retry_after=1, latency_ms=0.0):
+        self.fail_rate = fail_rate
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.latency = max(0.0, latency_ms) / 1000
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, 'throttled': 0, 'failed': 0, 'bytes': 0, 'photos': 0, 'bad_zips': 0,
+                       'max_in_flight': 0}
+        self.in_flight = 0
+        self.delivered = {}  # email -> successful deliveries
+        self.attempts = {}  # email -> requests
+
+    def begin(self, email, size):
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts['bytes'] += size
+            self.in_flight += 1
+            self.counts['max_in_flight'] = max(self.counts['max_in_flight'], self.in_flight)
+            self.attempts[email] = self.attempts.get(email, 0) + 1
+            if self.throttle_every and self.counts['requests'] % self.throttle_every == 0:
+                return 429
+        return 503 if random.random() < self.fail_rate else 200
+
+    def end(self, email, code):
+        with self.lock:
+            self.in_flight -= 1
+            key = {200: 'ok', 429: 'throttled'}.get(code, 'failed')
+            self.counts[key] += 1
+            if code == 200:
+                self.delivered[email] = self.delivered.get(email, 0) + 1
+
+    def check_zip(self, data):
+        """Open the attachment and verify every entry's CRC."""
+        try:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                ok = archive.testzip() is None
+                photos = len(archive.namelist())
+        except zipfile.BadZipFile:
+            ok, photos = False, 0
+        with self.lock:
+            self.counts['photos'] += photos
+            self.counts['bad_zips'] += 0 if ok else 1
+
+    def snapshot(self):
+        with self.lock:
+            return {**self.counts, 'delivered': dict(self.delivered), 'attempts': dict(self.attempts)}
+
+def make_handler(state):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, code, payload, headers=()):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                self._send_json(200, state.snapshot())
+            else:
+                self._send_json(404, {'error': 'not found'})
+
+        def _read_body(self):
+            if "chunked" not in self.headers.get("Transfer-Encoding", "").lower():
+                return self.rfile.read(int(self.headers.get("Content-Length", 0) or 0))
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()  # blank line after the last chunk (no trailers expected)
+                    return b"".join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+
+        def do_POST(self):
+            body = self._read_body()
+            match = EMAIL_FIELD.search(body)
+            email = match.group(1).decode("utf-8", "replace") if match else "?"
+            attachment = ATTACHMENT_PART.search(body)
+            if attachment:
+                state.check_zip(attachment.group(1))
+            code = state.begin(email, len(body))
+            try:
+                time.sleep(state.latency)
+            finally:
+                state.end(email, code)
+            if code == 429:
+                self._send_json(429, {'error': 'rate limited'}, [("Retry-After", str(state.retry_after))])
+            elif code == 503:
+                self._send_json(503, {'error': 'temporarily unavailable'})
+            else:
+                self._send_json(200, {'status': 'sent', 'email': email})
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the n8n webhook for delivery tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth request with 429 (0 = never)")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Time each request takes")
+    args = parser.parse_args()
+
+    state = StubState(args.fail_rate, args.throttle_every, args.retry_after, args.latency_ms)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"[OK] Stub webhook listening on http://{args.host}:{args.port} "
+          f"(fail rate {args.fail_rate:.0%}, 429 every {args.throttle_every or '-'}, latency {args.latency_ms:.0f} ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Shutting down...")
+    finally:
+        server.server_close()
+
+    stats = state.snapshot()
+    print(f"[DONE] {stats['requests']} requests: {stats['ok']} ok, {stats['throttled']} throttled, "
+          f"{stats['failed']} failed; {stats['bytes'] / 1e6:.1f} MB; at most {stats['max_in_flight']} in flight")
+    print(f"  Photos in attachments: {stats['photos']}, broken zips: {stats['bad_zips']}")
+    repeated = {email: n for email, n in stats['delivered'].items() if n > 1}
+    print(f"  Recipients delivered: {len(stats['delivered'])}" + (f" (more than once: {repeated})" if repeated else ""))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Folder watching for the streaming sorting mode (``process_photos.py --watch``).
+
+New photos are picked up with Linux inotify (through ctypes, no extra
+dependency) and, where inotify is unavailable or ``--poll-interval`` is given,
+by re-scanning the folder. Either way the caller blocks while nothing
+happens, so an idle watcher uses no CPU.
+
+A photo is handed over only once it has finished writing: with inotify it
+must have been reported by IN_CLOSE_WRITE / IN_MOVED_TO, and in both modes
+its size and mtime must stay unchanged for ``settle_seconds`` before it
+counts as complete (copiers that close and reopen, slow network shares).
+Hidden and partial download files are ignored.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+PARTIAL_SUFFIXES = (".part", ".tmp", ".crdownload", ".partial", ".download")
+
+# linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+WATCH_MASK = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+_EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+def is_candidate(name):
+    lower = name.lower()
+    return not name.startswith(".") and lower.endswith(IMAGE_EXTENSIONS) and not lower.endswith(PARTIAL_SUFFIXES)
+
+class InotifyWatcher:
+    """inotify watch on one folder. Raises OSError if inotify is not available."""
+
+    mode = "inotify"
+
+    def __init__(self, folder):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.folder = folder
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"inotify_add_watch failed for {folder}")
+
+    def wait(self, timeout):
+        """
+        Block for at most ``timeout`` seconds (None = until something happens).
+
+        Returns:
+            (names, closed): files that were created or changed, and the subset
+            reported as completely written. ``names`` is None after a queue
+            overflow, meaning the caller must rescan the folder.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set(), set()
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return set(), set()
+
+        names, closed = set(), set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None, set()
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                raise OSError(errno.ENOENT, f"Watched folder went away: {self.folder}")
+            if not name:
+                continue
+            names.add(name)
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                closed.add(name)
+        return names, closed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Rescans the folder every ``interval`` seconds; used where inotify is not available."""
+
+    mode = "polling"
+
+    def __init__(self, folder, interval=1.0):
+        self.folder = folder
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        # Every file is reported; the tracker only acts on new or changed ones
+        return None, set()
+
+    def close(self):
+        pass
+
+def open_watcher(folder, poll_interval=None):
+    """inotify watcher, or a polling one when ``poll_interval`` is given or inotify fails."""
+    if poll_interval is None:
+        try:
+            return InotifyWatcher(folder)
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable ({e}); falling back to polling")
+            poll_interval = 1.0
+    return PollingWatcher(folder, poll_interval)
+
+class ArrivalTracker:
+    """
+    Follows files from their first sighting until they are completely written.
+    The first-seen (monotonic) time is handed out with every ready file, so
+    latency can be measured from arrival rather than from completion.
+    """
+
+    def __init__(self, folder, settle_seconds=0.5, require_close=False):
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.require_close = require_close
+        self.pending = {}  # name -> [first_seen, size, mtime_ns, unchanged_since, closed]
+        self.done = {}  # name -> (size, mtime_ns) of the version already handed over
+
+    def scan(self):
+        """Pick up every candidate file in the folder (start-up, polling, inotify overflow)."""
+        try:
+            with os.scandir(self.folder) as entries:
+                # Files already on disk are not being written by anyone we could hear from
+                self.touch([entry.name for entry in entries if entry.is_file()], closed=True)
+        except OSError as e:
+            print(f"[WARN] Failed to scan {self.folder}: {e}")
+
+    def touch(self, names, closed=False):
+        now = time.monotonic()
+        for name in names:
+            if not is_candidate(name):
+                continue
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                self.pending.pop(name, None)  # deleted or renamed before it settled
+                continue
+            if self.done.get(name) == (st.st_size, st.st_mtime_ns):
+                continue
+            entry = self.pending.get(name)
+            if entry is None:
+                entry = self.pending[name] = [now, st.st_size, st.st_mtime_ns, now, False]
+            elif (entry[1], entry[2]) != (st.st_size, st.st_mtime_ns):
+                entry[1:4] = [st.st_size, st.st_mtime_ns, now]
+            entry[4] = entry[4] or closed
+
+    def ready(self):
+        """
+        Returns:
+            [(name, first_seen)] of files whose size and mtime held still for
+            ``settle_seconds``, oldest first.
+        """
+        self.touch(list(self.pending))
+        now = time.monotonic()
+        complete = sorted(
+            ((name, entry[0]) for name, entry in self.pending.items()
+             if entry[1] > 0 and now - entry[3] >= self.settle_seconds
+             and (entry[4] or not self.require_close)),
+            key=lambda item: item[1],
+        )
+        for name, _ in complete:
+            entry = self.pending.pop(name)
+            self.done[name] = (entry[1], entry[2])
+        return complete
+
+    def next_timeout(self):
+        """Seconds until the earliest pending file may settle (None = nothing pending)."""
+        waiting = [entry for entry in self.pending.values() if entry[4] or not self.require_close]
+        if not waiting:
+            return None  # the next inotify event wakes the caller
+        now = time.monotonic()
+        return max(0.0, min(entry[3] + self.settle_seconds - now for entry in waiting))
+
+class LatencyStats:
+    """Arrival-to-sorted latency of every photo, reported as percentiles."""
+
+    def __init__(self):
+        self.samples = []
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def summary(self):
+        if not self.samples:
+            return "no photos yet"
+        p50, p90, p99 = np.percentile(self.samples, [50, 90, 99])
+        return (f"{len(self.samples)} photos, p50 {p50:.2f}s, p90 {p90:.2f}s, p99 {p99:.2f}s, "
+                f"max {max(self.samples):.2f}s")
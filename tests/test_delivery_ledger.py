@@ -0,0 +1,37 @@
+"""split_parts caps parts by size; pending() leaves out what an attendee already received."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from delivery_ledger import DeliveryLedger, split_parts
+
+def sized(*sizes):
+    return [{'path': f"{i}.jpg", 'arcname': f"{i}.jpg", 'sha256': str(i), 'size': size}
+            for i, size in enumerate(sizes)]
+
+def test_parts_capped_by_size_with_oversized_file_alone():
+    parts = split_parts(sized(4, 5, 30, 2, 3, 6), max_bytes=10)
+    assert [[entry['size'] for entry in part] for part in parts] == [[4, 5], [30], [2, 3], [6]]
+
+def test_no_cap_is_one_part():
+    assert split_parts(sized(4, 50), max_bytes=None) == [sized(4, 50)]
+    assert split_parts([], max_bytes=None) == []
+
+def test_pending_excludes_contents_delivered_to_that_email(tmp_path):
+    files = []
+    for name, content in (("a.jpg", b"alpha"), ("b.jpg", b"beta"), ("copy_of_a.jpg", b"alpha")):
+        (tmp_path / name).write_bytes(content)
+        files.append((str(tmp_path / name), name))
+
+    ledger = DeliveryLedger(str(tmp_path / "ledger.sqlite"))
+    try:
+        pending = ledger.pending("alice@example.com", files)
+        assert [entry['arcname'] for entry in pending] == ["a.jpg", "b.jpg"]  # same bytes go out once
+
+        ledger.mark_delivered("alice@example.com", pending[:1])
+        assert [entry['arcname'] for entry in ledger.pending("alice@example.com", files)] == ["b.jpg"]
+        assert [entry['arcname'] for entry in ledger.pending("bob@example.com", files)] == ["a.jpg", "b.jpg"]
+    finally:
+        ledger.close()
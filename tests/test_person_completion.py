@@ -0,0 +1,44 @@
+"""PersonCompletion: only photos that are new after a person's release reopen them."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from process_photos import PersonCompletion
+
+class FakeGallery:
+    """Every doubt-zone face's best candidate is Bob."""
+
+    def match(self, embeddings):
+        return ["Bob"] * len(embeddings), [0.4] * len(embeddings), None
+
+def queued_image():
+    # Face 0 is a clear match for Alice (placed early), face 1 waits for the rescue stage
+    result = {'faces': [{'embedding': None}, {'embedding': None}], 'matches': [('clear', "Alice")],
+              'needs_rescue': [1]}
+    return "q.jpg", result, {"Alice"}
+
+def run(final_matches, fanned_out=False):
+    released = []
+    completion = PersonCompletion(["Alice", "Bob", "Carol"], released.append)
+    filename, result, already_placed = queued_image()
+    completion.main_pass_done([(filename, result, already_placed)], FakeGallery())
+    assert released == ["Alice", "Carol"]
+    completion.finalized(filename, dict(result, matches=final_matches, needs_rescue=[]), already_placed, fanned_out)
+    completion.close()
+    return completion, released
+
+def test_clear_match_placed_early_is_not_reopened():
+    completion, released = run([('clear', "Alice")])
+    assert completion.reopened == set()
+    assert released == ["Alice", "Carol", "Bob"]
+
+def test_recovered_match_reopens_released_person():
+    completion, released = run([('clear', "Alice"), ('recovered', "Carol")])
+    assert completion.reopened == {"Carol"}
+    assert released == ["Alice", "Carol", "Bob", "Carol"]
+
+def test_fanned_out_duplicates_reopen_clear_match():
+    completion, released = run([('clear', "Alice")], fanned_out=True)
+    assert completion.reopened == {"Alice"}
@@ -0,0 +1,45 @@
+"""run_rescue_stage: budget-skipped entries get no rescue work and never shift later results."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from process_photos import make_stats, run_rescue_stage
+
+def entry(filename, faces):
+    return filename, {'needs_rescue': list(range(faces)), 'matches': []}, ()
+
+def run(entries, **budget):
+    submitted, finished = [], []
+
+    def submit(filename, result):
+        submitted.append(filename)
+        return lambda: {'needs_rescue': [], 'matches': [(0, filename)]}
+
+    def finish(filename, result, already_placed=(), rescued=False):
+        finished.append((filename, rescued, result['matches']))
+
+    stats = make_stats([])
+    run_rescue_stage(entries, submit, finish, stats, **budget)
+    return submitted, finished, stats
+
+def test_skipped_entry_followed_by_rescued_entry():
+    submitted, finished, stats = run([entry("a.jpg", 3), entry("b.jpg", 1)], max_faces=2)
+    assert submitted == ["b.jpg"]
+    assert finished == [("a.jpg", False, []), ("b.jpg", True, [(0, "b.jpg")])]
+    assert stats['rescue_faces'] == 1
+    assert stats['rescue_skipped'] == 3
+
+def test_window_keeps_entry_order():
+    entries = [entry("a.jpg", 1), entry("b.jpg", 5), entry("c.jpg", 1), entry("d.jpg", 1)]
+    submitted, finished, stats = run(entries, max_faces=3, window=3)
+    assert submitted == ["a.jpg", "c.jpg", "d.jpg"]
+    assert [f for f, _, _ in finished] == ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    assert [rescued for _, rescued, _ in finished] == [True, False, True, True]
+    assert stats['rescue_images'] == 3
+
+def test_time_budget_submits_nothing_once_spent():
+    submitted, finished, stats = run([entry("a.jpg", 1), entry("b.jpg", 1)], budget_seconds=0)
+    assert submitted == []
+    assert [rescued for _, rescued, _ in finished] == [False, False]
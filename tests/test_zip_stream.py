@@ -0,0 +1,26 @@
+"""zip_stream: the streamed chunks form a valid archive with the original bytes."""
+
+import io
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from send_results import zip_stream
+
+def test_zip_stream_round_trip(tmp_path):
+    contents = {"photo.jpg": os.urandom(5000), "notes.txt": b"hello " * 2000, "empty.png": b""}
+    files = []
+    for name, data in contents.items():
+        (tmp_path / name).write_bytes(data)
+        files.append((str(tmp_path / name), name))
+
+    archive = b"".join(zip_stream(files, chunk_size=1024))
+
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == list(contents)
+        assert {name: zf.read(name) for name in contents} == contents
+        assert zf.getinfo("photo.jpg").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED